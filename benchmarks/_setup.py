@@ -0,0 +1,51 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway test database created from the configured
+DATABASES setting (use `CI=True` for SQLite), so they never touch real data:
+
+    CI=True python -m benchmarks.bench_history_pagination
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangochatapi.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(fn, repeat=50):
+    """Run `fn` `repeat` times and return latency stats in milliseconds."""
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "mean": statistics.fmean(samples),
+    }
+
+
+def report(label, stats):
+    print(f"{label:<40} p50={stats['p50']:8.3f}ms  p99={stats['p99']:8.3f}ms  mean={stats['mean']:8.3f}ms")
@@ -0,0 +1,64 @@
+"""
+Per-keystroke latency: SearchUsersView vs the autocomplete endpoint.
+
+Types "johnny" one character at a time against each endpoint. The autocomplete
+index is the local PrefixIndex unless --redis-url points at a Redis server, in
+which case the shared sorted-set index is measured.
+
+    CI=True python -m benchmarks.bench_autocomplete --profiles 100000
+"""
+import argparse
+from unittest import mock
+
+from benchmarks._setup import measure, report, test_database
+
+WORD = "johnny"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--redis-url", help="measure the Redis-backed index on this server")
+    args = parser.parse_args()
+
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from chat.autocomplete import LocalAutocomplete, RedisAutocomplete
+    from chat.models import User, UserProfile
+
+    names = ["john", "jane", "joan", "jonas", "johnny", "jolene", "bob", "alice"]
+    with test_database():
+        me = User.objects.create(email="me@example.com")
+        for start in range(0, args.profiles, 20_000):
+            stop = min(start + 20_000, args.profiles)
+            users = User.objects.bulk_create(User(email=f"user{i}@example.com") for i in range(start, stop))
+            UserProfile.objects.bulk_create(
+                UserProfile(user=user, username=f"{names[i % len(names)]}{i}", full_name=f"User {i}")
+                for i, user in zip(range(start, stop), users)
+            )
+
+        if args.redis_url:
+            import redis
+            backend = RedisAutocomplete(redis.Redis.from_url(args.redis_url))
+        else:
+            backend = LocalAutocomplete()
+        backend.rebuild("users")
+
+        client = APIClient()
+        client.force_authenticate(user=me)
+        prefixes = [WORD[:n] for n in range(1, len(WORD) + 1)]
+
+        print(f"Typing {WORD!r} over {args.profiles} profiles ({type(backend).__name__})")
+        with mock.patch("chat.autocomplete.get_autocomplete", return_value=backend):
+            for prefix in prefixes:
+                report(f"  /users/search/?q={prefix}", measure(
+                    lambda: client.get(reverse("user-search"), {"q": prefix}), args.repeat // 10,
+                ))
+                report(f"  /autocomplete/?q={prefix}", measure(
+                    lambda: client.get(reverse("autocomplete"), {"q": prefix, "type": "users"}), args.repeat,
+                ))
+
+
+if __name__ == "__main__":
+    main()
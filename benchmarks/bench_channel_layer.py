@@ -0,0 +1,101 @@
+"""
+Group fan-out cost: channels_redis vs chat.layers.RedisStreamsChannelLayer
+for one room whose members are spread over several workers.
+
+Both layers run against one in-process fakeredis server, with a layer
+instance per simulated worker. Reports the time for a group_send to reach
+every member and the Redis commands it ran, including those inside
+channels_redis's Lua script. Needs fakeredis[lua] (requirements.txt).
+
+    python -m benchmarks.bench_channel_layer --workers 4 --members 5000 --messages 20
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from unittest import mock
+
+import benchmarks._setup  # noqa: F401  (configures Django)
+
+
+def count_commands():
+    """Patch fakeredis to count every command it runs by name."""
+    from fakeredis._socket._base import BaseFakeSocket
+
+    counts = Counter()
+    original = BaseFakeSocket._run_command
+
+    def run_command(self, func, sig, args, from_script):
+        counts[sig.name] += 1
+        return original(self, func, sig, args, from_script)
+
+    return counts, mock.patch.object(BaseFakeSocket, "_run_command", run_command)
+
+
+def channels_redis_layers(workers):
+    import fakeredis
+    from channels_redis.core import RedisChannelLayer
+
+    server = fakeredis.FakeServer()
+    layers = [RedisChannelLayer(hosts=["redis://fake"]) for _ in range(workers)]
+    clients = {id(layer): fakeredis.aioredis.FakeRedis(server=server) for layer in layers}
+    patch = mock.patch.object(RedisChannelLayer, "connection", lambda self, index: clients[id(self)])
+    return layers, patch
+
+
+def streams_layers(workers):
+    from contextlib import nullcontext
+    from chat.layers import RedisStreamsChannelLayer
+
+    prefix = f"bench:{time.time_ns()}"
+    return [RedisStreamsChannelLayer(url="fakeredis://", prefix=prefix, block=5) for _ in range(workers)], nullcontext()
+
+
+async def run(label, make_layers, workers, members, messages):
+    layers, patch = make_layers(workers)
+    counts, counting = count_commands()
+    with patch:
+        channels = []
+        for n in range(members):
+            layer = layers[n % workers]
+            channel = await layer.new_channel()
+            await layer.group_add("room", channel)
+            channels.append((layer, channel))
+
+        async def broadcast(n):
+            await layers[0].group_send("room", {"type": "chat.message", "n": n})
+            await asyncio.gather(*(layer.receive(channel) for layer, channel in channels))
+
+        await broadcast(-1)  # warm up
+        samples = []
+        with counting:
+            for n in range(messages):
+                start = time.perf_counter()
+                await broadcast(n)
+                samples.append((time.perf_counter() - start) * 1000)
+        writes = sum(count for name, count in counts.items() if name.upper() in ("ZADD", "XADD"))
+        samples.sort()
+        print(
+            f"{label:<16} {members} members on {workers} workers: p50 {samples[len(samples) // 2]:8.1f}ms per broadcast, "
+            f"{writes / messages:8.1f} queue/stream writes and {sum(counts.values()) / messages:8.1f} commands per broadcast"
+        )
+        for layer in layers:
+            if hasattr(layer, "close"):
+                await layer.close()
+            else:
+                await layer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--members", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run("channels_redis", channels_redis_layers, args.workers, args.members, args.messages))
+    asyncio.run(run("redis streams", streams_layers, args.workers, args.members, args.messages))
+
+
+if __name__ == "__main__":
+    main()
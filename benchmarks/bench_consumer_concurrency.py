@@ -0,0 +1,91 @@
+"""
+Connections/sec and messages/sec through ChatConsumer for different
+CHAT_DB_EXECUTOR_WORKERS sizes.
+
+Uses the in-memory channel layer so the numbers reflect handshake and database
+cost only. SQLite allows a single writer, so pools larger than one thread are
+skipped there; run it against Postgres (without CI=True) to see the pool pay off.
+
+    CI=True python -m benchmarks.bench_consumer_concurrency --connections 50 --messages 50 --workers 0 1 4 16
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._setup import test_database
+
+
+async def run(workers, connections, messages):
+    from asgiref.sync import sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from django.conf import settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from chat.models import FriendRequest, Message, User
+    from djangochatapi.asgi import application
+
+    settings.CHAT_DB_EXECUTOR_WORKERS = workers
+
+    pairs = []
+    for i in range(connections):
+        sender = await User.objects.acreate(email=f"w{workers}-sender{i}@example.com")
+        receiver = await User.objects.acreate(email=f"w{workers}-receiver{i}@example.com")
+        await FriendRequest.objects.acreate(from_user=sender, to_user=receiver, status="accepted")
+        token = await sync_to_async(lambda: str(AccessToken.for_user(sender)))()
+        pairs.append((receiver.id, token))
+
+    async def connect(receiver_id, token):
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{receiver_id}/?token={token}")
+        connected, _ = await communicator.connect()
+        assert connected
+        return communicator
+
+    start = time.perf_counter()
+    communicators = await asyncio.gather(*(connect(*pair) for pair in pairs))
+    connect_elapsed = time.perf_counter() - start
+
+    before = await Message.objects.acount()
+
+    async def chat(communicator):
+        for n in range(messages):
+            await communicator.send_json_to({"content": f"message {n}"})
+            await communicator.receive_json_from(timeout=30)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in communicators))
+    message_elapsed = time.perf_counter() - start
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+    total = connections * messages
+    assert await Message.objects.acount() - before == total
+    print(
+        f"workers={workers:<3} {connections} connections: {connections / connect_elapsed:8.0f} conn/s, "
+        f"{total} messages: {total / message_elapsed:8.0f} msg/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=50, help="messages per connection")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 4, 16])
+    args = parser.parse_args()
+
+    from django.conf import settings
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    # Every message must be stored; the default send limits would refuse most of them.
+    settings.CHAT_RATE_LIMIT = {"BACKEND": "local", "USER": {}, "CONNECTION": {}}
+
+    from django.db import connection
+
+    with test_database():
+        for workers in args.workers:
+            if workers > 1 and connection.vendor == "sqlite":
+                print(f"workers={workers:<3} skipped: SQLite allows a single writer")
+                continue
+            asyncio.run(run(workers, args.connections, args.messages))
+
+
+if __name__ == "__main__":
+    main()
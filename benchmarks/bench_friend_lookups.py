@@ -0,0 +1,80 @@
+"""
+Compare friend checks: the old two-query FriendRequest path, the Friendship
+edge table, and a cached friend-id set.
+
+    CI=True python -m benchmarks.bench_friend_lookups --users 5000 --friends 300
+"""
+import argparse
+import random
+
+from benchmarks._setup import measure, report, test_database
+
+
+def legacy_are_friends(user1, user2):
+    from chat.models import FriendRequest
+    return FriendRequest.objects.filter(
+        from_user=user1, to_user=user2, status="accepted"
+    ).exists() or FriendRequest.objects.filter(
+        from_user=user2, to_user=user1, status="accepted"
+    ).exists()
+
+
+def legacy_get_friend_ids(user):
+    from chat.models import FriendRequest
+    sent = FriendRequest.objects.filter(from_user=user, status="accepted").values_list("to_user", flat=True)
+    received = FriendRequest.objects.filter(to_user=user, status="accepted").values_list("from_user", flat=True)
+    return list(set(sent).union(set(received)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--friends", type=int, default=300, help="friends per user")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    from django.core.cache import cache
+    from chat.models import FriendRequest, Friendship, User
+    from chat.utils import are_friends, get_friend_ids, invalidate_friend_cache
+
+    with test_database():
+        User.objects.bulk_create(User(email=f"user{i}@example.com") for i in range(args.users))
+        user_ids = list(User.objects.values_list("id", flat=True))
+        rng = random.Random(42)
+        pairs = set()
+        for user_id in user_ids:
+            for friend_id in rng.sample(user_ids, args.friends // 2):
+                if friend_id != user_id and (friend_id, user_id) not in pairs:
+                    pairs.add((user_id, friend_id))
+        FriendRequest.objects.bulk_create(
+            (FriendRequest(from_user_id=a, to_user_id=b, status="accepted") for a, b in pairs), batch_size=5000
+        )
+        # bulk_create skips signals, so build the edges the way the migration does.
+        Friendship.objects.bulk_create(
+            (Friendship(user_id=u, friend_id=f) for a, b in pairs for u, f in ((a, b), (b, a))), batch_size=5000
+        )
+
+        user = User.objects.get(id=user_ids[0])
+        friend = User.objects.get(id=next(iter(get_friend_ids(user))))
+        stranger = User.objects.exclude(id__in=get_friend_ids(user)).exclude(id=user.id).first()
+
+        def uncached(fn):
+            def run():
+                invalidate_friend_cache(user)
+                fn()
+            return run
+
+        print(f"{len(pairs)} friendships across {args.users} users")
+        report("are_friends, legacy (friend)", measure(lambda: legacy_are_friends(user, friend), args.repeat))
+        report("are_friends, legacy (stranger)", measure(lambda: legacy_are_friends(user, stranger), args.repeat))
+        report("are_friends, edge table", measure(uncached(lambda: are_friends(user, stranger)), args.repeat))
+        get_friend_ids(user)
+        report("are_friends, cached set", measure(lambda: are_friends(user, stranger), args.repeat))
+        report("get_friend_ids, legacy", measure(lambda: legacy_get_friend_ids(user), args.repeat))
+        report("get_friend_ids, edge table", measure(uncached(lambda: get_friend_ids(user)), args.repeat))
+        report("get_friend_ids, cached set", measure(lambda: get_friend_ids(user), args.repeat))
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Unread counts for a user in many groups: one COUNT per group vs the single
+annotated query behind GroupQuerySet.with_unread_counts, plus the group list
+endpoint that uses it.
+
+Half the groups are fully read, so the latest-message short-circuit skips
+their counts entirely.
+
+    CI=True python -m benchmarks.bench_group_unread --groups 250 --messages 40
+"""
+import argparse
+
+from benchmarks._setup import measure, report, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=250)
+    parser.add_argument("--messages", type=int, default=40, help="messages per group")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from chat.models import Group, GroupMembership, GroupMessage, User, newer_than
+
+    with test_database():
+        reader = User.objects.create(email="reader@example.com")
+        sender = User.objects.create(email="sender@example.com")
+        groups = Group.objects.bulk_create(
+            Group(name=f"Group {i}", creator=sender) for i in range(args.groups)
+        )
+        GroupMembership.objects.bulk_create(GroupMembership(group=group, user=reader) for group in groups)
+        GroupMessage.objects.bulk_create(
+            (
+                GroupMessage(group=group, sender=sender, content=f"message {n}")
+                for group in groups for n in range(args.messages)
+            ),
+            batch_size=5000,
+        )
+        # bulk_create skips the signals that maintain these columns.
+        for group in groups:
+            Group.objects.record_messages([GroupMessage.objects.filter(group=group).latest("created_at", "id")])
+        for group in groups[::2]:
+            GroupMembership.objects.mark_read(group, reader)
+
+        member_groups = Group.objects.filter(memberships__user=reader)
+
+        def unread(group):
+            membership = GroupMembership.objects.get(group=group, user=reader)
+            messages = GroupMessage.objects.filter(group=group)
+            if membership.last_read_message_at is not None:
+                messages = messages.filter(newer_than(membership.last_read_message_at, membership.last_read_message_id))
+            return messages.count()
+
+        def per_group_counts():
+            return {group.id: unread(group) for group in member_groups}
+
+        def annotated_counts():
+            return dict(member_groups.with_unread_counts(reader).values_list("id", "unread_count"))
+
+        assert per_group_counts() == annotated_counts()
+
+        client = APIClient()
+        client.force_authenticate(user=reader)
+        url = reverse("group-list")
+
+        print(f"Unread counts for a user in {args.groups} groups ({args.messages} messages each)")
+        report("COUNT per group", measure(per_group_counts, args.repeat))
+        report("with_unread_counts, one query", measure(annotated_counts, args.repeat))
+        report("GET /api/groups/, first page", measure(lambda: client.get(url), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
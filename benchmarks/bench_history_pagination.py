@@ -0,0 +1,55 @@
+"""
+Compare page-number and keyset (cursor) pagination on ChatHistoryView as the
+conversation grows.
+
+Page-number pagination pays a COUNT(*) plus an OFFSET scan that grows with
+depth. Cursor pages are read in index order, so the latest page and the
+oldest page should both take the same time at every history size.
+
+    CI=True python -m benchmarks.bench_history_pagination --sizes 20000 200000
+"""
+import argparse
+
+from benchmarks._setup import measure, report, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from chat.models import FriendRequest, Message, User
+
+    with test_database():
+        alice = User.objects.create_user(email="alice@example.com", password="pass")
+        bob = User.objects.create_user(email="bob@example.com", password="pass")
+        FriendRequest.objects.create(from_user=alice, to_user=bob, status="accepted")
+
+        client = APIClient()
+        client.force_authenticate(user=alice)
+        url = reverse("chat-history", kwargs={"id": bob.id})
+        stored = 0
+        for size in sorted(args.sizes):
+            Message.objects.bulk_create(
+                (
+                    Message(sender=alice if i % 2 else bob, receiver=bob if i % 2 else alice, content=f"message {i}")
+                    for i in range(stored, size)
+                ),
+                batch_size=5000,
+            )
+            stored = size
+            oldest_ids = list(Message.objects.order_by("id").values_list("id", flat=True)[:20])
+            deep_page = max(1, size // 10 - 1)
+
+            print(f"ChatHistoryView over {size} messages")
+            report("page-number, first page", measure(lambda: client.get(url), args.repeat))
+            report(f"page-number, page {deep_page}", measure(lambda: client.get(url, {"page": deep_page}), args.repeat))
+            report("cursor, latest page", measure(lambda: client.get(url, {"mode": "cursor"}), args.repeat))
+            report("cursor, oldest page", measure(lambda: client.get(url, {"before": oldest_ids[-1]}), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+One worker holding N sockets in the same group room: a channel-layer group
+member per socket (the default) vs WS_LOCAL_FANOUT (chat/fanout.py).
+
+Runs channels_redis against an in-process fakeredis server and stands in for
+the consumers with objects that only count the frames they get. Reports the
+Redis commands, and the bytes sent to Redis, per broadcast and for N sockets
+joining. Needs fakeredis[lua] (requirements.txt).
+
+    python -m benchmarks.bench_local_fanout --sockets 300 --messages 50
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from unittest import mock
+
+import benchmarks._setup  # noqa: F401  (configures Django)
+from benchmarks.bench_channel_layer import channels_redis_layers
+
+
+def count_traffic():
+    """Patch fakeredis to count the commands it runs and the bytes of their arguments."""
+    from fakeredis._socket._base import BaseFakeSocket
+
+    counts = Counter()
+    original = BaseFakeSocket._run_command
+
+    def run_command(self, func, sig, args, from_script):
+        counts["commands"] += 1
+        counts["bytes"] += sum(len(arg) for arg in args if isinstance(arg, bytes))
+        return original(self, func, sig, args, from_script)
+
+    return counts, mock.patch.object(BaseFakeSocket, "_run_command", run_command)
+
+
+class Socket:
+    """A stand-in GroupChatConsumer."""
+
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.user = "bench"
+        self.received = asyncio.Queue()
+
+    async def group_message(self, event):
+        self.received.put_nowait(event)
+
+
+async def per_socket(layer, sockets):
+    members = [Socket(await layer.new_channel()) for _ in range(sockets)]
+    for socket in members:
+        await layer.group_add("group_1", socket.channel)
+
+    async def receive():
+        await asyncio.gather(*(layer.receive(socket.channel) for socket in members))
+
+    return receive
+
+
+async def local_fanout(layer, sockets):
+    from chat.fanout import LocalRooms
+
+    rooms = LocalRooms(layer)
+    members = [Socket() for _ in range(sockets)]
+    for socket in members:
+        await rooms.join("group_1", socket)
+
+    async def receive():
+        await asyncio.gather(*(socket.received.get() for socket in members))
+
+    return receive
+
+
+async def run(label, join, sockets, messages):
+    (layer,), patch = channels_redis_layers(1)
+    counts, counting = count_traffic()
+    with patch:
+        with counting:
+            receive = await join(layer, sockets)
+        joined = dict(counts)
+        counts.clear()
+
+        async def broadcast(n):
+            await layer.group_send("group_1", {"type": "group_message", "room": "group_1", "text": f'{{"n":{n}}}'})
+            await receive()
+
+        await broadcast(-1)  # warm up
+        samples = []
+        with counting:
+            for n in range(messages):
+                start = time.perf_counter()
+                await broadcast(n)
+                samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(
+            f"{label:<22} {sockets} sockets: join {joined['commands']:5d} commands; per broadcast "
+            f"p50 {samples[len(samples) // 2]:6.2f}ms, {counts['commands'] / messages:5.1f} commands, "
+            f"{counts['bytes'] / messages:8.0f} bytes to Redis"
+        )
+        await layer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(run("member per socket", per_socket, args.sockets, args.messages))
+    asyncio.run(run("WS_LOCAL_FANOUT", local_fanout, args.sockets, args.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Messages/sec through ChatConsumer with synchronous vs write-behind persistence.
+
+Uses the in-memory channel layer so the numbers reflect database cost only.
+
+    CI=True python -m benchmarks.bench_message_persistence --rooms 20 --messages 200
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._setup import test_database
+
+
+async def run(mode, rooms, messages):
+    from asgiref.sync import sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from django.conf import settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from chat.models import FriendRequest, Message, User
+    from chat.persistence import message_buffer
+    from djangochatapi.asgi import application
+
+    settings.CHAT_MESSAGE_PERSISTENCE = mode
+
+    communicators = []
+    for i in range(rooms):
+        sender = await User.objects.acreate(email=f"{mode}-sender{i}@example.com")
+        receiver = await User.objects.acreate(email=f"{mode}-receiver{i}@example.com")
+        await FriendRequest.objects.acreate(from_user=sender, to_user=receiver, status="accepted")
+        token = await sync_to_async(lambda: str(AccessToken.for_user(sender)))()
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{receiver.id}/?token={token}")
+        connected, _ = await communicator.connect()
+        assert connected
+        communicators.append(communicator)
+
+    before = await Message.objects.acount()
+
+    async def chat(communicator):
+        for n in range(messages):
+            await communicator.send_json_to({"content": f"message {n}"})
+            await communicator.receive_json_from(timeout=30)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in communicators))
+    delivered = time.perf_counter() - start
+    if mode == "write_behind":
+        await message_buffer().flush()
+    persisted = time.perf_counter() - start
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+    total = rooms * messages
+    assert await Message.objects.acount() - before == total
+    print(
+        f"{mode:<14} {total} messages: delivered {total / delivered:8.0f} msg/s, "
+        f"persisted {total / persisted:8.0f} msg/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200, help="messages per room")
+    args = parser.parse_args()
+
+    from django.conf import settings
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    # Every message must be stored; the default send limits would refuse most of them.
+    settings.CHAT_RATE_LIMIT = {"BACKEND": "local", "USER": {}, "CONNECTION": {}}
+
+    with test_database():
+        for mode in ("sync", "write_behind"):
+            asyncio.run(run(mode, args.rooms, args.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Per-request cost of the response envelope on /api/messages/inbox/.
+
+"legacy" reproduces the old CustomResponseMiddleware: DRF renders the body,
+then the middleware wraps response.data and encodes it again with JsonResponse.
+"renderer" is EnvelopeJSONRenderer, which wraps while rendering, once per
+JSON backend. Full requests are dominated by the query and view, so the
+render step is also timed on its own.
+
+    CI=True python -m benchmarks.bench_response_envelope --friends 50
+"""
+import argparse
+
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from benchmarks._setup import measure, report, test_database
+
+
+class LegacyResponseMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        excluded_paths = ["/swagger/", "/docs/", "/admin/", "/redoc/"]
+        if any(path in request.path for path in excluded_paths):
+            return response
+        if hasattr(response, "data") and isinstance(response.data, dict):
+            is_success = 200 <= response.status_code < 300
+            data = {
+                "success": is_success,
+                "data": response.data if is_success else None,
+                "errors": response.data if not is_success else None,
+                "status": response.status_code,
+            }
+            return JsonResponse(data, status=response.status_code)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--friends", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+    from chat.models import FriendRequest, Message, User
+    from chat.renderers import EnvelopeJSONRenderer
+    from chat.views.message_views import ChatInboxView
+
+    with test_database():
+        alice = User.objects.create_user(email="alice@example.com", password="pass")
+        friends = User.objects.bulk_create(User(email=f"friend{i}@example.com") for i in range(args.friends))
+        for friend in friends:
+            FriendRequest.objects.create(from_user=alice, to_user=friend, status="accepted")
+        Message.objects.bulk_create(
+            Message(sender=friend, receiver=alice, content=f"hello from {friend.email} " * 4) for friend in friends
+        )
+        call_command("backfill_conversations", stdout=open("/dev/null", "w"))
+        url = reverse("chat-inbox")
+
+        def client():
+            api_client = APIClient()
+            api_client.force_authenticate(user=alice)
+            return api_client
+
+        print(f"GET {url} with {args.friends} conversations")
+        original = ChatInboxView.renderer_classes
+        ChatInboxView.renderer_classes = [JSONRenderer]
+        with override_settings(MIDDLEWARE=[*settings.MIDDLEWARE, "benchmarks.bench_response_envelope.LegacyResponseMiddleware"]):
+            legacy = client()
+            assert legacy.get(url).json()["status"] == 200
+            report("legacy middleware (json x2)", measure(lambda: legacy.get(url), args.repeat))
+        ChatInboxView.renderer_classes = [EnvelopeJSONRenderer]
+        for backend in ("json", "orjson"):
+            with override_settings(CHAT_JSON_BACKEND=backend):
+                current = client()
+                assert current.get(url).json()["status"] == 200
+                report(f"envelope renderer ({backend})", measure(lambda: current.get(url), args.repeat))
+        ChatInboxView.renderer_classes = original
+
+        response = client().get(url)
+        data = response.data
+        context = {"request": response.wsgi_request, "response": response}
+        middleware = LegacyResponseMiddleware(lambda request: None)
+
+        def legacy_render():
+            middleware.process_response(response.wsgi_request, response).content
+
+        print("render step only")
+        report("legacy (render + re-encode)", measure(
+            lambda: (JSONRenderer().render(data), legacy_render()), args.repeat * 10
+        ))
+        for backend in ("json", "orjson"):
+            with override_settings(CHAT_JSON_BACKEND=backend):
+                report(f"envelope renderer ({backend})", measure(
+                    lambda: EnvelopeJSONRenderer().render(data, "application/json", context), args.repeat * 10
+                ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Rows/sec through the ModelSerializers and the hand-rolled row serializers used
+by ChatHistoryView, GroupMessagesView, FriendListView and SearchUsersView.
+
+"fetch + serialize" includes the query each path runs (select_related models
+vs `.values_list()` tuples); "serialize" times the Python side alone.
+
+    CI=True python -m benchmarks.bench_row_serializers --rows 5000
+"""
+import argparse
+import time
+
+from benchmarks._setup import test_database
+
+
+def rows_per_second(fn, rows, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return rows * repeat / (time.perf_counter() - start)
+
+
+def compare(label, queryset, model_serializer, row_serializer, rows, repeat):
+    instances = list(queryset)
+    tuples = list(row_serializer.select(queryset))
+    assert model_serializer(instances, many=True).data == row_serializer(tuples, many=True).data
+    results = {
+        "ModelSerializer, fetch + serialize": lambda: model_serializer(list(queryset), many=True).data,
+        "row serializer, fetch + serialize": lambda: row_serializer(list(row_serializer.select(queryset)), many=True).data,
+        "ModelSerializer, serialize": lambda: model_serializer(instances, many=True).data,
+        "row serializer, serialize": lambda: row_serializer(tuples, many=True).data,
+    }
+    print(label)
+    for name, fn in results.items():
+        print(f"  {name:<38} {rows_per_second(fn, rows, repeat):12.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    from chat.models import Group, GroupMessage, Message, User, UserProfile
+    from chat.serializers import (
+        GroupMessageRowSerializer, GroupMessageSerializer, MessageRowSerializer, MessageSerializer,
+        UserSearchResultRowSerializer, UserSearchResultSerializer,
+    )
+
+    with test_database():
+        alice = User.objects.create(email="alice@example.com")
+        bob = User.objects.create(email="bob@example.com")
+        UserProfile.objects.create(user=bob, username="bob", full_name="Bob Builder")
+        group = Group.objects.create(name="Benchmark", creator=alice)
+        Message.objects.bulk_create(
+            Message(sender=alice if i % 2 else bob, receiver=bob if i % 2 else alice, content=f"message {i}")
+            for i in range(args.rows)
+        )
+        GroupMessage.objects.bulk_create(
+            GroupMessage(group=group, sender=alice, content=f"message {i}") for i in range(args.rows)
+        )
+        users = User.objects.bulk_create(User(email=f"user{i}@example.com") for i in range(args.rows))
+        UserProfile.objects.bulk_create(
+            UserProfile(user=user, username=f"user{i}", full_name=f"User {i}") for i, user in enumerate(users)
+        )
+
+        compare(
+            f"MessageSerializer ({args.rows} rows)",
+            Message.objects.select_related("sender", "receiver__profile").order_by("-created_at", "-id"),
+            MessageSerializer, MessageRowSerializer, args.rows, args.repeat,
+        )
+        compare(
+            f"GroupMessageSerializer ({args.rows} rows)",
+            GroupMessage.objects.select_related("sender").order_by("-created_at", "-id"),
+            GroupMessageSerializer, GroupMessageRowSerializer, args.rows, args.repeat,
+        )
+        compare(
+            f"UserSearchResultSerializer ({args.rows} rows)",
+            UserProfile.objects.filter(username__startswith="user").select_related("user").order_by("username"),
+            UserSearchResultSerializer, UserSearchResultRowSerializer, args.rows, args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+User search at scale: the old `icontains` filter vs the configured search
+backend (chat/search.py), for the first page of SearchUsersView results.
+
+On SQLite this exercises the in-process PrefixIndex; run against PostgreSQL
+(without CI=True) to measure the pg_trgm indexes. Building a million profiles
+takes a few minutes.
+
+    CI=True python -m benchmarks.bench_search --profiles 1000000
+"""
+import argparse
+import time
+
+from benchmarks._setup import measure, report, test_database
+
+FIRST = ["john", "jane", "alex", "maria", "chen", "fatima", "divine", "olu", "sam", "nina", "ivan", "amara"]
+LAST = ["smith", "okafor", "garcia", "nguyen", "bravo", "ekene", "kim", "haddad", "novak", "adeyemi"]
+QUERIES = ["joh", "john smi", "divine ekene", "olu12345", "zzz"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from django.db.models import Q
+    from chat.models import User, UserProfile
+    from chat.search import USERS, get_search_backend, in_order, search_backend
+
+    with test_database():
+        batch = 20_000
+        for start in range(0, args.profiles, batch):
+            stop = min(start + batch, args.profiles)
+            users = User.objects.bulk_create(User(email=f"user{i}@example.com") for i in range(start, stop))
+            UserProfile.objects.bulk_create(
+                UserProfile(
+                    user=user,
+                    username=f"{FIRST[i % len(FIRST)]}{i}",
+                    full_name=f"{FIRST[i % len(FIRST)].title()} {LAST[i // len(FIRST) % len(LAST)].title()}",
+                )
+                for i, user in zip(range(start, stop), users)
+            )
+        backend = get_search_backend()
+
+        start = time.perf_counter()
+        backend.search(USERS, "warmup")
+        print(f"{search_backend()} backend ready in {time.perf_counter() - start:.1f}s over {args.profiles} profiles")
+
+        for query in QUERIES:
+            def legacy():
+                profiles = UserProfile.objects.filter(
+                    Q(username__icontains=query) | Q(full_name__icontains=query)
+                ).select_related("user").order_by("username")
+                return profiles.count(), list(profiles[:10])
+
+            def indexed():
+                ranked = backend.search(USERS, query)
+                return len(ranked), list(in_order(UserProfile.objects.select_related("user"), ranked[:10]))
+
+            print(f"q={query!r}: icontains matches {legacy()[0]}, search matches {indexed()[0]}")
+            report("  icontains, count + first page", measure(legacy, args.repeat))
+            report("  search backend, first page", measure(indexed, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Opening N conversations for one client: N ws/chat/ sockets vs one ws/stream/
+socket with N subscribe frames. Reports wall time and the memory held by the
+open connections (tracemalloc), which is dominated by per-socket consumer
+state and channel-layer inboxes.
+
+Uses the in-memory channel layer, so the numbers cover handshake and
+per-connection cost only.
+
+    CI=True python -m benchmarks.bench_stream --rooms 50
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks._setup import test_database
+
+
+async def run(rooms):
+    from asgiref.sync import sync_to_async
+    from channels.testing import WebsocketCommunicator
+    from rest_framework_simplejwt.tokens import AccessToken
+    from chat.models import FriendRequest, User
+    from djangochatapi.asgi import application
+
+    user = await User.objects.acreate(email="stream-bench@example.com")
+    friends = [await User.objects.acreate(email=f"stream-friend{i}@example.com") for i in range(rooms)]
+    for friend in friends:
+        await FriendRequest.objects.acreate(from_user=user, to_user=friend, status="accepted")
+    token = await sync_to_async(lambda: str(AccessToken.for_user(user)))()
+
+    async def sockets():
+        communicators = []
+        for friend in friends:
+            communicator = WebsocketCommunicator(application, f"/ws/chat/{friend.id}/?token={token}")
+            assert (await communicator.connect())[0]
+            communicators.append(communicator)
+        return communicators
+
+    async def stream():
+        communicator = WebsocketCommunicator(application, f"/ws/stream/?token={token}")
+        assert (await communicator.connect())[0]
+        for friend in friends:
+            await communicator.send_json_to({"type": "subscribe", "chat": friend.id})
+            assert (await communicator.receive_json_from())["type"] == "subscribed"
+        return [communicator]
+
+    for label, open_rooms in ((f"{rooms} ws/chat/ sockets", sockets), (f"1 ws/stream/ socket, {rooms} rooms", stream)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        communicators = await open_rooms()
+        elapsed = time.perf_counter() - start
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for communicator in communicators:
+            await communicator.disconnect()
+        print(f"{label:<36} open in {elapsed * 1000:8.1f}ms, holding {held / 1024:8.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=50)
+    args = parser.parse_args()
+
+    from django.conf import settings
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    # Subscribing to every room at once would otherwise hit the subscribe limit.
+    settings.CHAT_RATE_LIMIT = {"BACKEND": "local", "USER": {}, "CONNECTION": {}}
+
+    with test_database():
+        asyncio.run(run(args.rooms))
+
+
+if __name__ == "__main__":
+    main()
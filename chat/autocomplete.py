@@ -0,0 +1,192 @@
+"""
+Typeahead for usernames and group names (GET /api/autocomplete/).
+
+Each kind ("users", "groups") is a sorted index of lowercased names. A lookup
+is a range scan from the typed prefix that returns the stored labels, so it
+never touches the database.
+
+CHAT_AUTOCOMPLETE["BACKEND"] picks where the index lives (see chat/stores.py):
+
+  "redis"  one sorted set per kind at REDIS_URL, every member scored 0, so
+           ZRANGEBYLEX walks them in name order. Shared by all workers.
+  "local"  a chat.search.PrefixIndex per kind in this process.
+
+Both are built from the database on first use and then kept current by the
+UserProfile/Group post_save and post_delete signals, applied after commit.
+`manage.py rebuild_autocomplete` rebuilds them from scratch.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from chat.encoding import dumps_text, loads
+from chat.models import Group, UserProfile
+from chat.stores import Stores
+from chat.redis_client import get_redis
+from chat.search import PrefixIndex
+
+KINDS = ("users", "groups")
+
+
+def entry(instance):
+    """(kind, id, term, label) for a UserProfile or Group."""
+    if isinstance(instance, UserProfile):
+        label = {"user_id": instance.user_id, "username": instance.username, "full_name": instance.full_name}
+        return "users", instance.user_id, instance.username.lower(), label
+    return "groups", instance.pk, instance.name.lower(), {"id": instance.pk, "name": instance.name}
+
+
+def all_entries(kind):
+    if kind == "users":
+        rows = UserProfile.objects.values_list("user_id", "username", "full_name")
+        for user_id, username, full_name in rows.iterator(chunk_size=10000):
+            yield user_id, username.lower(), {"user_id": user_id, "username": username, "full_name": full_name}
+    else:
+        for pk, name in Group.objects.values_list("pk", "name").iterator(chunk_size=10000):
+            yield pk, name.lower(), {"id": pk, "name": name}
+
+
+class LocalAutocomplete:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.labels = {}
+
+    def index_for(self, kind):
+        if kind not in self.indexes:
+            self.rebuild(kind)
+        return self.indexes[kind]
+
+    def rebuild(self, kind):
+        labels = {}
+        items = []
+        for key, term, label in all_entries(kind):
+            labels[key] = label
+            items.append((key, [term]))
+        index = PrefixIndex()
+        index.build(items)
+        self.indexes[kind], self.labels[kind] = index, labels
+
+    def complete(self, kind, prefix, limit):
+        with self.lock:
+            keys = self.index_for(kind).prefix(prefix, limit)
+            return [self.labels[kind][key] for key in keys]
+
+    def update(self, kind, key, term, label):
+        with self.lock:
+            if kind in self.indexes:
+                self.indexes[kind].add(key, [term])
+                self.labels[kind][key] = label
+
+    def delete(self, kind, key):
+        with self.lock:
+            if kind in self.indexes:
+                self.indexes[kind].remove(key)
+                self.labels[kind].pop(key, None)
+
+
+class RedisAutocomplete:
+    """
+    Members are "<term>\\x00<id>\\x00<label JSON>". A hash maps each id to its
+    current member so updates can remove the old one.
+    """
+    prefix = "chat:autocomplete"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_redis()
+
+    def keys(self, kind):
+        base = f"{self.prefix}:{kind}"
+        return base, f"{base}:members"
+
+    @staticmethod
+    def member(key, term, label):
+        return f"{term}\x00{key}\x00{dumps_text(label)}".encode()
+
+    def ensure_built(self, kind):
+        index_key, _ = self.keys(kind)
+        if not self.client.exists(index_key) and self.client.set(f"{index_key}:building", 1, nx=True, ex=300):
+            try:
+                self.rebuild(kind)
+            finally:
+                self.client.delete(f"{index_key}:building")
+
+    def rebuild(self, kind, chunk_size=10000):
+        """Build into scratch keys and swap them in, so lookups never see a partial index."""
+        index_key, members_key = self.keys(kind)
+        scratch_index, scratch_members = f"{index_key}:rebuild", f"{members_key}:rebuild"
+        self.client.delete(scratch_index, scratch_members)
+        # The sorted set is created even when empty, so ensure_built does not rebuild on every lookup.
+        self.client.zadd(scratch_index, {b"": 0})
+        pipe = self.client.pipeline(transaction=False)
+        for n, (key, term, label) in enumerate(all_entries(kind), 1):
+            member = self.member(key, term, label)
+            pipe.zadd(scratch_index, {member: 0})
+            pipe.hset(scratch_members, key, member)
+            if n % chunk_size == 0:
+                pipe.execute()
+        pipe.execute()
+        pipe = self.client.pipeline()
+        pipe.rename(scratch_index, index_key)
+        pipe.delete(members_key)
+        if self.client.exists(scratch_members):
+            pipe.rename(scratch_members, members_key)
+        pipe.execute()
+
+    def complete(self, kind, prefix, limit):
+        self.ensure_built(kind)
+        index_key, _ = self.keys(kind)
+        start = prefix.encode()
+        members = self.client.zrangebylex(index_key, b"[" + start, b"[" + start + b"\xff", start=0, num=limit)
+        return [loads(member.split(b"\x00", 2)[2]) for member in members if member]
+
+    def update(self, kind, key, term, label):
+        self.replace(kind, key, self.member(key, term, label))
+
+    def delete(self, kind, key):
+        self.replace(kind, key, None)
+
+    def replace(self, kind, key, member):
+        index_key, members_key = self.keys(kind)
+        if not self.client.exists(index_key):
+            return  # built from the database on first lookup
+        old = self.client.hget(members_key, key)
+        pipe = self.client.pipeline()
+        if old is not None:
+            pipe.zrem(index_key, old)
+        if member is None:
+            pipe.hdel(members_key, key)
+        else:
+            pipe.zadd(index_key, {member: 0})
+            pipe.hset(members_key, key, member)
+        pipe.execute()
+
+
+_backends = Stores("CHAT_AUTOCOMPLETE", {"redis": RedisAutocomplete, "local": LocalAutocomplete})
+
+
+def get_autocomplete():
+    return _backends.get()
+
+
+def index_saved(instance):
+    kind, key, term, label = entry(instance)
+    transaction.on_commit(lambda: get_autocomplete().update(kind, key, term, label))
+
+
+def index_deleted(instance):
+    kind, key, _, _ = entry(instance)
+    transaction.on_commit(lambda: get_autocomplete().delete(kind, key))
+
+
+def complete(kind, prefix, limit=None):
+    """Labels of up to `limit` `kind` entries whose name starts with `prefix`, in name order."""
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return []
+    return get_autocomplete().complete(kind, prefix, limit or settings.CHAT_AUTOCOMPLETE["LIMIT"])
@@ -1,200 +1,439 @@
-import json
+import functools
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from chat.models import Message, Group, GroupMessage, GroupMembership, FriendRequest
-from django.db.models import Q
+from django.conf import settings
+from chat.encoding import dumps_text, loads
+from chat.fanout import local_rooms
+from chat.inbox import user_room
+from chat.outbox import Outbox
+from chat.presence import STATUSES, get_presence, typing_coalescer, typing_frames
+from chat.ratelimit import ConnectionLimits
+from chat.rooms import ALLOWED, FORBIDDEN, MISSING, DirectRoom, GroupRoom, RoomError, read_message_id
 import logging
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 
 active_connections = Gauge("websocket_connections_active", "Current active WebSocket connections")
-private_msg_counter = Counter("private_messages_total", "Total private messages")
-group_msg_counter = Counter("group_messages_total", "Total group messages")
-messages_sent = Counter("chat_messages_sent_total", "Total number of messages sent")
 websocket_errors = Counter("websocket_errors_total", "Total WebSocket errors")
+connect_latency = Histogram(
+    "websocket_connect_seconds",
+    "Time from WebSocket connect to accept, including authorization",
+    ["consumer"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
 
 
 logger = logging.getLogger('chat')
 
-User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class PresenceMixin:
+    """
+    Presence and typing frames, shared by all consumers (see chat/presence.py):
+
+        {"type": "heartbeat"}                      keep this connection's presence alive
+        {"type": "presence", "status": "away"}     set it to "online" or "away"
+        {"type": "typing", "typing": true}         debounced, then coalesced per room
+
+    Every room the connection is in receives {"type": "presence", "user": <id>,
+    "status": ...} when a member's combined status changes and {"type": "typing",
+    "users": [...]} batches.
+    """
+    presence_status = None
+
+    def presence_rooms(self):
+        return [self.room_name]
+
+    async def join_presence(self):
+        self.typing = {}  # room -> (typing, when it was last sent)
+        await self.set_presence("online")
+
+    async def leave_presence(self):
+        if self.presence_status is None:
+            return  # never connected
+        for room, (typing, _) in self.typing.items():
+            if typing:
+                typing_coalescer.push(self.channel_layer, room, self.user.id, False)
+        previous, status = await get_presence().remove(self.user.id, self.channel_name)
+        if status != previous:
+            await self.broadcast_presence(status)
+
+    async def receive_presence_frame(self, data):
+        """Handle `data` if it is a heartbeat or presence frame; returns whether it was."""
+        frame_type = data.get("type")
+        if frame_type == "heartbeat":
+            await get_presence().set(self.user.id, self.channel_name, self.presence_status)
+        elif frame_type == "presence":
+            if data.get("status") not in STATUSES:
+                await self.send_json_error(f"'status' must be one of {', '.join(STATUSES)}.")
+            else:
+                await self.set_presence(data["status"])
+        else:
+            return False
+        return True
+
+    async def set_presence(self, status):
+        self.presence_status = status
+        previous, self.user_status = await get_presence().set(self.user.id, self.channel_name, status)
+        if self.user_status != previous:
+            await self.broadcast_presence(self.user_status)
+
+    async def broadcast_presence(self, status, rooms=None):
+        text = dumps_text({"type": "presence", "user": self.user.id, "status": status})
+        for room in self.presence_rooms() if rooms is None else rooms:
+            await self.channel_layer.group_send(room, {
+                "type": "presence_update",
+                "room": room,
+                "user": self.user.id,
+                "text": text,
+            })
+
+    def set_typing(self, room, typing):
+        now = time.monotonic()
+        was_typing, sent_at = self.typing.get(room, (False, 0.0))
+        if typing == was_typing and (not typing or now - sent_at < settings.CHAT_PRESENCE["TYPING_REFRESH"]):
+            typing_frames.labels("debounced").inc()
+            return
+        self.typing[room] = (typing, now)
+        typing_coalescer.push(self.channel_layer, room, self.user.id, typing)
+
+    async def presence_update(self, event):
+        if event["user"] != self.user.id:
+            await self.forward(event, key=("presence", event["room"], event["user"]))
+
+    async def typing_update(self, event):
+        await self.forward(event, key=("typing", event["room"]), merge=functools.partial(self.merge_typing, event["room"]))
+
+    def merge_typing(self, room, queued, text):
+        """Two typing batches for `room` as one, the newer state winning per user."""
+        users = {user["id"]: user for user in self.frame_data(queued)["users"]}
+        users.update((user["id"], user) for user in self.frame_data(text)["users"])
+        return self.frame_text({"room": room, "text": dumps_text({"type": "typing", "users": list(users.values())})})
+
+
+class RoomConsumer(PresenceMixin, AsyncWebsocketConsumer):
+    """
+    Frame handling shared by every consumer. A room frame is one of
+
+        {"content": "...", "message_type": "text"}   post a message
+        {"type": "read", "message_id": <id>}         advance the read watermark
+        {"type": "typing", "typing": true}
+        {"type": "sync", "since": <id>}              resend messages after <id>
+
+    and is handled by the chat.rooms room it is addressed to. The single-room
+    endpoints also sync on connect from a ?since=<id> parameter. Every connection
+    also joins its user's personal group for inbox deltas (see chat/inbox.py).
+
+    Frames from the channel layer go out through the connection's bounded
+    Outbox (see chat/outbox.py), so a slow client never blocks its consumer.
+    Room frames are rate limited by type for `endpoint` (see chat/ratelimit.py).
+    """
+    endpoint = None
+    inbox_room = None
+    outbox = None
+    limits = None
+
+    async def join_inbox(self):
+        self.inbox_room = user_room(self.user.id)
+        await self.channel_layer.group_add(self.inbox_room, self.channel_name)
+
+    async def leave_inbox(self):
+        if self.inbox_room is not None:
+            await self.channel_layer.group_discard(self.inbox_room, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            await self.receive_frame(loads(text_data))
+        except RoomError as e:
+            websocket_errors.inc()
+            await self.send_json_error(str(e), **e.fields)
+        except Exception as e:
+            websocket_errors.inc()
+            logger.error(f"[EXCEPTION] Error in message receive by {self.user}: {str(e)}", exc_info=True)
+            await self.send_json_error(f"Unexpected error: {str(e)}")
+
+    async def receive_frame(self, data):
+        if not await self.receive_presence_frame(data):
+            await self.receive_room_frame(self.room, data)
+
+    async def check_rate(self, frame_type):
+        if self.limits is None:
+            self.limits = ConnectionLimits(self.endpoint, self.user.id)
+        await self.limits.check(frame_type)
+
+    async def receive_room_frame(self, room, data):
+        frame_type = data.get("type")
+        await self.check_rate(frame_type if frame_type in ("read", "typing", "sync") else "message")
+        if frame_type == "read":
+            ack = await room.mark_read(self.channel_layer, data)
+            if ack is not None:
+                await self.forward({"room": room.name, "text": dumps_text(ack)})
+        elif frame_type == "typing":
+            self.set_typing(room.name, bool(data.get("typing", True)))
+        elif frame_type == "sync":
+            await self.send_sync(room, read_message_id(data, "since"))
+        else:
+            await room.post(self.channel_layer, data)
+
+    async def send_sync(self, room, since):
+        frame = await room.sync(since)
+        last_id = frame["messages"][-1]["id"] if frame["messages"] else None
+        await self.forward({"room": room.name, "id": last_id, "text": dumps_text(frame)})
+
+    def query_since(self):
+        """The ?since=<message id> a reconnecting client passes, if any."""
+        since = parse_qs(self.scope["query_string"].decode()).get("since", [""])[0]
+        return int(since) if since.isdigit() else None
+
+    async def forward(self, event, key=None, merge=None):
+        self.enqueue(self.frame_text(event), event.get("room"), event.get("id"), key, merge)
+
+    def frame_text(self, event):
+        """The frame this connection sends for a room's event."""
+        return event["text"]
+
+    def frame_data(self, text):
+        """The room's frame inside a frame_text."""
+        return loads(text)
+
+    def enqueue(self, text, room=None, message_id=None, key=None, merge=None):
+        if self.outbox is None:
+            self.outbox = Outbox(self.send, self.close)
+        self.outbox.put(text, room, message_id, key, merge)
+
+    async def websocket_disconnect(self, message):
+        if self.outbox is not None:
+            self.outbox.discard()
+        await super().websocket_disconnect(message)
+
+    async def chat_message(self, event):
+        await self.forward(event)
+
+    async def chat_read(self, event):
+        await self.forward(event)
+
+    async def group_message(self, event):
+        await self.forward(event)
+
+    async def inbox_update(self, event):
+        # Never coalesced: clients count unread messages from these deltas.
+        if event["conversation"] not in self.presence_rooms():
+            self.enqueue(self.frame_text(event))
+
+    async def send_json_error(self, message, **fields):
+        await self.send(text_data=dumps_text({"error": message, **fields}))
+
+
+class ChatConsumer(RoomConsumer):
+    endpoint = "ws_chat"
+
     async def connect(self):
+        started = time.perf_counter()
         self.user = self.scope["user"]
-        self.friend_id = self.scope["url_route"]["kwargs"]["friend_id"]
+        self.friend_id = int(self.scope["url_route"]["kwargs"]["friend_id"])
+        self.room = DirectRoom(self.user, self.friend_id)
 
-        self.friend = await self.get_user_by_id(self.friend_id)
+        authorization = await self.room.authorize()
 
-        if not self.friend:
-            await self.send_json_error("The user you're trying to chat with does not exist.")
+        if authorization == MISSING:
+            await self.send_json_error(self.room.missing_error)
             await self.close(4001)
             return
 
-        is_friend = await self.are_users_friends(self.user, self.friend)
-        if not is_friend:
-            await self.send_json_error("You can only chat with users you're friends with.")
+        if authorization == FORBIDDEN:
+            await self.send_json_error(self.room.forbidden_error)
             await self.close(4002)
             return
 
-        self.room_name = f"chat_{min(self.user.id, self.friend.id)}_{max(self.user.id, self.friend.id)}"
+        self.room_name = self.room.name
         await self.channel_layer.group_add(self.room_name, self.channel_name)
         await self.accept()
 
         active_connections.inc()
+        connect_latency.labels("chat").observe(time.perf_counter() - started)
+        await self.join_presence()
+        await self.join_inbox()
+        since = self.query_since()
+        if since is not None:
+            await self.send_sync(self.room, since)
 
         logger.info(f"[WS CONNECT] {self.user} connected to room {self.room_name}")
 
 
     async def disconnect(self, close_code):
+        await self.leave_presence()
+        await self.leave_inbox()
         await self.channel_layer.group_discard(self.room_name, self.channel_name)
 
         active_connections.dec()
 
         logger.info(f"[WS DISCONNECT] {self.user} disconnected from room {self.room_name}")
 
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-            content = data["content"]
-            message_type = data.get("message_type", "text")
-
-            message = await database_sync_to_async(Message.objects.create)(
-                sender=self.user,
-                receiver=self.friend,
-                content=content,
-                message_type=message_type,
-            )
-            logger.info(f"[MESSAGE SENT] {self.user} → {self.friend}: {content}")
-
-            await self.channel_layer.group_send(
-                self.room_name,
-                {
-                    "type": "chat_message",
-                    "message": {
-                        "id": message.id,
-                        "sender": self.user.email,
-                        "receiver": self.friend.id,
-                        "content": message.content,
-                        "message_type": message.message_type,
-                        "created_at": str(message.created_at),
-                    }
-                }
-            )
-            private_msg_counter.inc()
-            messages_sent.inc() # Promotheus
-
-        except KeyError:
-            websocket_errors.inc()
-            logger.warning(f"[KEY ERROR] Message payload missing 'content' by {self.user}")
-            await self.send_json_error("Missing 'content' in message payload.")
-        except Exception as e:
-            websocket_errors.inc()
-            logger.error(f"[EXCEPTION] Error in message receive by {self.user}: {str(e)}", exc_info=True)
-            await self.send_json_error(f"Unexpected error: {str(e)}")
-
-    async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event["message"]))
-
-    async def send_json_error(self, message):
-        await self.send(text_data=json.dumps({"error": message}))
-
-    @database_sync_to_async
-    def get_user_by_id(self, user_id):
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return None
-
-    @database_sync_to_async
-    def are_users_friends(self, user1, user2):
-        return FriendRequest.objects.filter(
-            Q(from_user=user1, to_user=user2) | Q(from_user=user2, to_user=user1),
-            status="accepted"
-        ).exists()
 
+class GroupChatConsumer(RoomConsumer):
+    endpoint = "ws_group"
 
-class GroupChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        started = time.perf_counter()
         self.user = self.scope["user"]
         self.group_id = self.scope["url_route"]["kwargs"]["group_id"]
-        self.room_name = f"group_{self.group_id}"
+        self.room = GroupRoom(self.user, self.group_id)
+        self.room_name = self.room.name
 
-        # Check if group exists
-        self.group = await self.get_group_or_none(self.group_id)
-        if not self.group:
+        # Group existence and membership are checked together
+        authorization = await self.room.authorize()
+        if authorization == MISSING:
             await self.close(code=4001)
             return
 
-        # Check membership
-        is_member = await self.is_group_member(self.group_id, self.user)
-        if not is_member:
-            await self.send(json.dumps({"error": "You are not a member of this group."}))
+        if authorization == FORBIDDEN:
+            await self.send_json_error(self.room.forbidden_error)
             await self.close(code=4002)
             return
 
-        await self.channel_layer.group_add(self.room_name, self.channel_name)
         await self.accept()
+        await self.join_room()
+        connect_latency.labels("group").observe(time.perf_counter() - started)
+        await self.join_presence()
+        await self.join_inbox()
+        since = self.query_since()
+        if since is not None:
+            await self.send_sync(self.room, since)
         logger.info(f"[WS CONNECT] {self.user} joined group room {self.room_name}")
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.room_name, self.channel_name)
+        await self.leave_presence()
+        await self.leave_inbox()
+        await self.leave_room()
         logger.info(f"[WS DISCONNECT] {self.user} left group room {self.room_name}")
 
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-            content = data.get("content")
-            message_type = data.get("message_type", "text")
-
-            if not content:
-                await self.send(json.dumps({"error": "Message content is required."}))
-                return
-
-            if len(content) > 1000:
-                await self.send(json.dumps({"error": "Message too long (max 1000 characters)."}))
-                return
-
-            msg = await database_sync_to_async(GroupMessage.objects.create)(
-                group=self.group,
-                sender=self.user,
-                content=content,
-                message_type=message_type,
-            )
-
-            logger.info(f"[GROUP MESSAGE SENT] {self.user} → Group {self.group_id}: {content}")
-
-            await self.channel_layer.group_send(
-                self.room_name,
-                {
-                    "type": "group_message",
-                    "message": {
-                        "id": msg.id,
-                        "sender": self.user.email,
-                        "group": self.group_id,
-                        "content": msg.content,
-                        "message_type": msg.message_type,
-                        "created_at": str(msg.created_at),
-                    }
-                }
-            )
-            group_msg_counter.inc()
-            messages_sent.inc() # Promotheus
-
-        except Exception as e:
-            websocket_errors.inc()
-            logger.error(f"[GROUP EXCEPTION] {self.user} → Group {self.group_id}: {str(e)}", exc_info=True)
-            await self.send(json.dumps({"error": f"An error occurred: {str(e)}"}))
+    # With WS_LOCAL_FANOUT the worker is in the room once for all its sockets (see chat/fanout.py).
+
+    async def join_room(self):
+        if settings.WS_LOCAL_FANOUT:
+            await local_rooms(self.channel_layer).join(self.room_name, self)
+        else:
+            await self.channel_layer.group_add(self.room_name, self.channel_name)
+
+    async def leave_room(self):
+        if settings.WS_LOCAL_FANOUT:
+            await local_rooms(self.channel_layer).leave(self.room_name, self)
+        else:
+            await self.channel_layer.group_discard(self.room_name, self.channel_name)
+
+
+class StreamConsumer(RoomConsumer):
+    """
+    One socket for any number of rooms (ws/stream/), instead of a socket per
+    conversation: the JWT is validated once and the connection costs one
+    consumer and one channel however many rooms it follows.
+
+        {"type": "subscribe", "chat": <friend id>}     -> {"type": "subscribed", "room": "chat_1_2"}
+        {"type": "subscribe", "group": <group id>}     -> {"type": "subscribed", "room": "group_3"}
+        {"type": "subscribe", "group": 3, "since": <id>}  also sends the room's {"type": "sync"} frame
+        {"type": "unsubscribe", "room": "group_3"}     -> {"type": "unsubscribed", "room": "group_3"}
+
+    Subscribing runs the same authorization as connecting to ws/chat/ or
+    ws/group/. Room frames (see RoomConsumer) name their room, as in
+    {"room": "group_3", "content": "hi"}; heartbeat and presence frames apply
+    to the whole connection. Everything a room sends arrives wrapped as
+    {"room": "group_3", "data": <the frame a single-room socket would get>},
+    inbox deltas as {"room": "user_<id>", "data": ...}, and errors about a
+    room carry its name. Unauthenticated sockets are closed with 4003.
+    """
+    endpoint = "ws_stream"
 
-    async def group_message(self, event):
-        await self.send(text_data=json.dumps(event["message"]))
+    async def connect(self):
+        started = time.perf_counter()
+        self.user = self.scope["user"]
+        self.rooms = {}
+        if not self.user.is_authenticated:
+            await self.close(code=4003)
+            return
 
-    @database_sync_to_async
-    def is_group_member(self, group_id, user):
-        return GroupMembership.objects.filter(group_id=group_id, user=user).exists()
+        await self.accept()
+        active_connections.inc()
+        connect_latency.labels("stream").observe(time.perf_counter() - started)
+        await self.join_presence()
+        await self.join_inbox()
+        logger.info(f"[WS CONNECT] {self.user} opened a stream")
 
-    @database_sync_to_async
-    def get_group_or_none(self, group_id):
-        try:
-            return Group.objects.get(id=group_id)
-        except Group.DoesNotExist:
-            return None
+    async def disconnect(self, close_code):
+        if self.presence_status is None:
+            return  # rejected in connect
+        await self.leave_presence()
+        await self.leave_inbox()
+        for room in self.rooms:
+            await self.channel_layer.group_discard(room, self.channel_name)
+        active_connections.dec()
+        logger.info(f"[WS DISCONNECT] {self.user} closed a stream with {len(self.rooms)} rooms")
+
+    def presence_rooms(self):
+        return list(self.rooms)
+
+    async def receive_frame(self, data):
+        frame_type = data.get("type")
+        if frame_type == "subscribe":
+            await self.subscribe(data)
+        elif frame_type == "unsubscribe":
+            await self.unsubscribe(data)
+        elif not await self.receive_presence_frame(data):
+            room = self.subscribed_room(data)
+            try:
+                await self.receive_room_frame(room, data)
+            except RoomError as e:
+                websocket_errors.inc()
+                await self.send_json_error(str(e), room=room.name, **e.fields)
+
+    def subscribed_room(self, data):
+        room = self.rooms.get(data.get("room"))
+        if room is None:
+            raise RoomError(f"Not subscribed to room {data.get('room')!r}.")
+        return room
+
+    def requested_room(self, data):
+        for key, room_class in (("chat", DirectRoom), ("group", GroupRoom)):
+            if key in data:
+                target = data[key]
+                if not isinstance(target, int) or isinstance(target, bool):
+                    raise RoomError(f"'{key}' must be an id.")
+                return room_class(self.user, target)
+        raise RoomError("Subscribe to a 'chat' (friend id) or a 'group' (group id).")
+
+    async def subscribe(self, data):
+        await self.check_rate("subscribe")
+        room = self.requested_room(data)
+        since = read_message_id(data, "since") if "since" in data else None
+        if room.name not in self.rooms:
+            if len(self.rooms) >= settings.WS_STREAM_MAX_ROOMS:
+                raise RoomError(f"A stream can follow at most {settings.WS_STREAM_MAX_ROOMS} rooms.")
+            authorization = await room.authorize()
+            if authorization != ALLOWED:
+                error = room.missing_error if authorization == MISSING else room.forbidden_error
+                await self.send_json_error(error, room=room.name)
+                return
+            self.rooms[room.name] = room
+            await self.channel_layer.group_add(room.name, self.channel_name)
+            await self.broadcast_presence(self.user_status, [room.name])
+        await self.send(text_data=dumps_text({"type": "subscribed", "room": room.name}))
+        if since is not None:
+            await self.send_sync(room, since)
+
+    async def unsubscribe(self, data):
+        room = self.subscribed_room(data)
+        typing, _ = self.typing.pop(room.name, (False, 0.0))
+        if typing:
+            typing_coalescer.push(self.channel_layer, room.name, self.user.id, False)
+        del self.rooms[room.name]
+        await self.channel_layer.group_discard(room.name, self.channel_name)
+        await self.send(text_data=dumps_text({"type": "unsubscribed", "room": room.name}))
+
+    async def forward(self, event, key=None, merge=None):
+        if event["room"] in self.rooms:  # drops events still in flight after an unsubscribe
+            await super().forward(event, key, merge)
+
+    def frame_text(self, event):
+        # The room name is a plain identifier and the text is already JSON, so wrap without re-encoding.
+        return f'{{"room":"{event["room"]}","data":{event["text"]}}}'
+
+    def frame_data(self, text):
+        return loads(text)["data"]
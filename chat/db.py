@@ -0,0 +1,34 @@
+"""
+Running the database work that still has to be synchronous.
+
+Single queries in the consumers and JWTAuthMiddleware use Django's async ORM
+(aget, afirst, asave, ...). Transactions, signal-driven writes and bulk
+flushes have no async API, so they go through `db_sync_to_async`.
+
+By default that is Channels' `database_sync_to_async`, which runs every call
+on one shared thread per process. Setting CHAT_DB_EXECUTOR_WORKERS to N runs
+those calls on a dedicated pool of N threads instead, so up to N run
+concurrently. Each thread holds its own database connection.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync, database_sync_to_async
+from django.conf import settings
+
+_executors = {}
+
+
+def get_executor():
+    workers = getattr(settings, "CHAT_DB_EXECUTOR_WORKERS", 0)
+    if not workers:
+        return None
+    if workers not in _executors:
+        _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-db")
+    return _executors[workers]
+
+
+def db_sync_to_async(func):
+    executor = get_executor()
+    if executor is None:
+        return database_sync_to_async(func)
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=executor)
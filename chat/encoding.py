@@ -0,0 +1,54 @@
+"""
+JSON encoding shared by the WebSocket consumers and the REST renderer.
+
+CHAT_JSON_BACKEND picks the implementation: "orjson", "json" (stdlib), or
+"auto" (orjson when installed). Both produce compact UTF-8 output, so frames
+and response bodies are the same whichever backend is active.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:  # optional, see requirements.txt
+    orjson = None
+
+BACKENDS = ("auto", "orjson", "json")
+
+
+def json_backend():
+    name = getattr(settings, "CHAT_JSON_BACKEND", "auto")
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f"CHAT_JSON_BACKEND must be one of {', '.join(BACKENDS)}, not {name!r}.")
+    if name == "auto":
+        return "orjson" if orjson is not None else "json"
+    if name == "orjson" and orjson is None:
+        raise ImproperlyConfigured("CHAT_JSON_BACKEND is 'orjson' but orjson is not installed.")
+    return name
+
+
+def dumps(obj, default=None):
+    """
+    Encode `obj` to JSON bytes. `default` is called for anything the backend
+    cannot encode natively; when given, it also receives datetimes so both
+    backends format them the same way.
+    """
+    if json_backend() == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if default is not None:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps_text(obj, default=None):
+    """Like `dumps`, for WebSocket text frames."""
+    return dumps(obj, default).decode()
+
+
+def loads(data):
+    if json_backend() == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,116 @@
+"""
+Process-local fan-out for group rooms, turned on with WS_LOCAL_FANOUT.
+
+Normally every GroupChatConsumer adds its own channel to the room's
+channel-layer group, so a worker holding 300 sockets in one room has 300
+members in the room's Redis set: every connect and disconnect is a Redis
+write, and every group_send reads all 300 names back and ships them, with the
+message, to that worker's queue.
+
+With local fan-out the worker joins each room once, with one channel of its
+own, when its first socket enters the room, and leaves when the last one goes.
+A listener task receives the room's events on that channel and hands each to
+the local consumers in the room, in order, by calling their handler directly.
+Every event a room sends names the room under "room" (see chat/rooms.py),
+which is how the listener finds the consumers.
+
+Channel-layer groups expire (channels_redis drops members after
+group_expiry, a day by default), so the worker re-adds its channel to every
+room it holds at half that interval.
+
+A failed receive or re-add is logged and retried after `retry_delay` seconds,
+so a Redis outage pauses the room's delivery instead of ending it.
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.consumer import get_handler_name
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger('chat')
+
+
+class LocalRooms:
+    """The rooms this worker has joined on one channel layer, and their local consumers."""
+    retry_delay = 1
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.loop = None
+
+    def bind(self):
+        # The channel and listener belong to an event loop; start over in a new one.
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.rooms = {}  # room -> local consumers
+            self.channel = None
+            self.tasks = []
+            self.lock = asyncio.Lock()
+
+    async def join(self, room, consumer):
+        self.bind()
+        async with self.lock:
+            if room not in self.rooms:
+                if self.channel is None:
+                    await self.start()
+                await self.channel_layer.group_add(room, self.channel)
+                self.rooms[room] = set()
+            self.rooms[room].add(consumer)
+
+    async def leave(self, room, consumer):
+        self.bind()
+        async with self.lock:
+            members = self.rooms.get(room)
+            if members is None:
+                return
+            members.discard(consumer)
+            if not members:
+                del self.rooms[room]
+                await self.channel_layer.group_discard(room, self.channel)
+
+    async def start(self):
+        self.channel = await self.channel_layer.new_channel()
+        self.tasks = [asyncio.ensure_future(self.listen()), asyncio.ensure_future(self.keep_alive())]
+
+    async def listen(self):
+        while True:
+            try:
+                event = await self.channel_layer.receive(self.channel)
+            except Exception:
+                logger.exception("[FANOUT] Receive failed; retrying")
+                await asyncio.sleep(self.retry_delay)
+                continue
+            handler_name = get_handler_name(event)
+            for consumer in list(self.rooms.get(event.get("room"), ())):
+                try:
+                    await getattr(consumer, handler_name)(event)
+                except Exception:
+                    logger.exception(f"[FANOUT] {handler_name} failed for {consumer.user} in {event.get('room')}")
+
+    async def keep_alive(self):
+        refresh = getattr(self.channel_layer, "group_expiry", 86400) / 2
+        interval = refresh
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.lock:
+                    for room in self.rooms:
+                        await self.channel_layer.group_add(room, self.channel)
+            except Exception:
+                # Retry well before the groups expire, not after another half expiry.
+                logger.exception("[FANOUT] Re-adding rooms failed; retrying")
+                interval = self.retry_delay
+            else:
+                interval = refresh
+
+
+_registries = weakref.WeakKeyDictionary()
+
+
+def local_rooms(channel_layer=None):
+    channel_layer = channel_layer or get_channel_layer()
+    if channel_layer not in _registries:
+        _registries[channel_layer] = LocalRooms(channel_layer)
+    return _registries[channel_layer]
@@ -0,0 +1,58 @@
+"""
+Inbox deltas. Every connected user's consumers join a personal `user_<id>`
+channel-layer group, and each new direct or group message sends a compact
+frame to the personal group of everyone whose inbox it changes, so clients
+keep their inbox current without polling ChatInboxView:
+
+    {"type": "inbox", "kind": "direct", "id": 41, "sender": 3, "receiver": 7,
+     "preview": "...", "message_type": "text", "created_at": "..."}
+    {"type": "inbox", "kind": "group", "id": 42, "sender": 3, "group": "9", ...}
+
+The frame is encoded once and is the same for every recipient, so it has no
+per-user unread count: a client bumps its own count for messages it did not
+send. A connection skips deltas for a room it already follows, since it gets
+the message itself: the room is sent every message, including those posted
+through the REST API (Room.broadcast_on_commit).
+"""
+from chat.encoding import dumps_text
+
+PREVIEW_LENGTH = 100
+
+
+def user_room(user_id):
+    return f"user_{user_id}"
+
+
+def delta(message, **target):
+    return {
+        "type": "inbox",
+        "id": message.id,
+        "sender": message.sender_id,
+        **target,
+        "preview": message.content[:PREVIEW_LENGTH],
+        "message_type": message.message_type,
+        "created_at": str(message.created_at),
+    }
+
+
+def direct_delta(message):
+    return delta(message, kind="direct", receiver=message.receiver_id)
+
+
+def group_delta(message):
+    # A string, like the group id in GroupRoom frames.
+    return delta(message, kind="group", group=str(message.group_id))
+
+
+async def publish(channel_layer, conversation, user_ids, payload):
+    """Send `payload` to the personal group of each of `user_ids`; `conversation` is the message's room."""
+    text = dumps_text(payload)
+    for user_id in user_ids:
+        room = user_room(user_id)
+        await channel_layer.group_send(room, {
+            "type": "inbox_update",
+            "room": room,
+            "conversation": conversation,
+            "text": text,
+        })
+
@@ -0,0 +1,218 @@
+"""
+A channel layer on Redis Streams, selected with CHAT_CHANNEL_LAYER=streams.
+
+channels_redis keeps group membership in Redis, so every group_send first
+reads the whole member set (5,000 names for a 5,000-member room), then
+serializes the message and runs a ZADD and EXPIRE for every worker that has a
+member, and nothing orders or keeps it. Here each group is a stream:
+
+  group_send  one XADD to the group's stream (plus an EXPIRE, pipelined)
+  group_add   records the channel in this worker's memory; the worker reads
+              the stream from its last entry at that moment, so everything
+              sent after group_add returns is delivered
+  delivery    one reader task per worker XREADs every stream it has members
+              in and hands each entry to its local member channels, in
+              stream order
+
+so a group message is written once and read once by each worker that has a
+member in the group, however many members that is. A message to a single
+channel goes to the stream of the worker that owns it; channel names carry
+the worker id (`<prefix>.<worker>!<id>`) so any worker can route them.
+
+Streams keep about MAXLEN entries and expire GROUP_EXPIRY seconds after the
+last write. Each channel holds at most `capacity` undelivered messages;
+group messages beyond that are dropped and direct sends raise ChannelFull,
+as with the other layers. A group joined while the reader is blocked is
+picked up within BLOCK milliseconds, and no entries are missed meanwhile.
+
+CONFIG keys: "url" (REDIS_URL, or "fakeredis://" for an in-process server
+shared by every layer in the process, for tests and benchmarks), "prefix",
+"maxlen", "group_expiry" and "block", plus the usual "capacity" and "expiry".
+"""
+import asyncio
+import logging
+import uuid
+
+import redis.asyncio
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+from chat.encoding import dumps, loads
+
+logger = logging.getLogger('chat')
+
+_fake_server = None
+
+
+def redis_client(url):
+    if url.startswith("fakeredis://"):
+        import fakeredis  # development dependency
+
+        global _fake_server
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        return fakeredis.aioredis.FakeRedis(server=_fake_server)
+    return redis.asyncio.Redis.from_url(url)
+
+
+class RedisStreamsChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self, url="redis://localhost:6379", prefix="chat:layer", maxlen=1000, group_expiry=86400, block=100,
+        expiry=60, capacity=100, channel_capacity=None,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.url = url
+        self.prefix = prefix
+        self.maxlen = maxlen
+        self.group_expiry = group_expiry
+        self.block = block
+        self.worker = uuid.uuid4().hex
+        self.loop = None
+
+    # Keys and names
+
+    def group_key(self, group):
+        return f"{self.prefix}:group:{group}"
+
+    def worker_key(self, worker):
+        return f"{self.prefix}:worker:{worker}"
+
+    @staticmethod
+    def worker_of(channel):
+        return channel.partition("!")[0].rpartition(".")[2]
+
+    # Per-loop state: asyncio queues and connections cannot move between event loops.
+
+    def bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.redis = redis_client(self.url)
+            self.channels = {}  # local channel -> asyncio.Queue
+            self.groups = {}  # group -> local member channels
+            self.cursors = {self.worker_key(self.worker): "0-0"}  # stream -> last entry id read
+            self.reader = None
+            self.closing = False
+
+    def start_reader(self):
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.ensure_future(self.read())
+
+    async def read(self):
+        own_key = self.worker_key(self.worker)
+        group_prefix = self.group_key("")
+        while not self.closing:
+            try:
+                response = await self.redis.xread(dict(self.cursors), block=self.block)
+            except Exception:
+                logger.exception("[CHANNEL LAYER] Stream read failed; retrying")
+                await asyncio.sleep(1)
+                continue
+            for key, entries in response or ():
+                key = key.decode()
+                if key not in self.cursors:
+                    continue  # the last local member left while the read was in flight
+                for entry_id, fields in entries:
+                    self.cursors[key] = entry_id
+                    message = loads(fields[b"message"])
+                    if key == own_key:
+                        self.deliver(fields[b"channel"].decode(), message)
+                    else:
+                        for channel in list(self.groups.get(key[len(group_prefix):], ())):
+                            self.deliver(channel, message)
+
+    def deliver(self, channel, message, strict=False):
+        queue = self.channels.get(channel)
+        if queue is None:
+            return  # closed, or never received on in this worker
+        if queue.qsize() >= self.get_capacity(channel):
+            if strict:
+                raise ChannelFull(channel)
+            return
+        queue.put_nowait(message)
+
+    # Channel layer API
+
+    async def new_channel(self, prefix="specific."):
+        self.bind()
+        channel = f"{prefix}.{self.worker}!{uuid.uuid4().hex}"
+        self.channels[channel] = asyncio.Queue()
+        self.start_reader()
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        self.bind()
+        worker = self.worker_of(channel)
+        if worker == self.worker:
+            self.deliver(channel, message, strict=True)
+            return
+        key = self.worker_key(worker)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xadd(key, {"channel": channel, "message": dumps(message)}, maxlen=self.maxlen, approximate=True)
+        pipe.expire(key, self.expiry)
+        await pipe.execute()
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self.bind()
+        queue = self.channels.setdefault(channel, asyncio.Queue())
+        self.start_reader()
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            if queue.empty():
+                self.channels.pop(channel, None)
+            raise
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.bind()
+        key = self.group_key(group)
+        if key not in self.cursors:
+            last = await self.redis.xrevrange(key, count=1)
+            self.cursors.setdefault(key, last[0][0] if last else "0-0")
+        self.groups.setdefault(group, set()).add(channel)
+        self.start_reader()
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.bind()
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.discard(channel)
+        if not members:
+            del self.groups[group]
+            self.cursors.pop(self.group_key(group), None)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        self.bind()
+        key = self.group_key(group)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xadd(key, {"message": dumps(message)}, maxlen=self.maxlen, approximate=True)
+        pipe.expire(key, self.group_expiry)
+        await pipe.execute()
+
+    async def flush(self):
+        self.bind()
+        keys = [key async for key in self.redis.scan_iter(match=f"{self.prefix}:*")]
+        if keys:
+            await self.redis.delete(*keys)
+        await self.close()
+
+    async def close(self):
+        """Stop this worker's reader, within BLOCK milliseconds, and drop its local state."""
+        if self.loop is asyncio.get_running_loop():
+            self.closing = True
+            if self.reader is not None:
+                await self.reader
+            await self.redis.aclose()
+        self.loop = None
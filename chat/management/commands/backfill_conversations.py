@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
+from chat.models import NEVER_READ, Conversation, Message, newer_than
+
+
+class Command(BaseCommand):
+    help = "Build or refresh Conversation rows from existing messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        # New rows start their read watermarks at the newest message the legacy
+        # is_read flag marked as read; existing rows keep their watermarks.
+        pairs = (
+            Message.objects
+            .annotate(low=Least("sender_id", "receiver_id"), high=Greatest("sender_id", "receiver_id"))
+            .values("low", "high")
+            .annotate(
+                last_message_id=Max("id"),
+                last_activity_at=Max("created_at"),
+                low_last_read_id=Max("id", filter=Q(is_read=True, receiver_id=F("low"))),
+                high_last_read_id=Max("id", filter=Q(is_read=True, receiver_id=F("high"))),
+            )
+            .order_by("low", "high")
+        )
+
+        total = 0
+        batch = []
+        for row in pairs.iterator(chunk_size=batch_size):
+            batch.append(Conversation(
+                user_low_id=row["low"],
+                user_high_id=row["high"],
+                last_message_id=row["last_message_id"],
+                last_activity_at=row["last_activity_at"],
+                user_low_last_read_id=row["low_last_read_id"] or 0,
+                user_high_last_read_id=row["high_last_read_id"] or 0,
+            ))
+            if len(batch) >= batch_size:
+                total += self.save_batch(batch)
+                batch = []
+        if batch:
+            total += self.save_batch(batch)
+
+        self.key_on_messages()
+        self.recount_unread()
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} conversations."))
+
+    def save_batch(self, batch):
+        Conversation.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["user_low", "user_high"],
+            update_fields=["last_message", "last_activity_at"],
+        )
+        return len(batch)
+
+    def key_on_messages(self):
+        """
+        Point each conversation at its newest message by (created_at, id), and
+        give watermarks that have none the created_at of their message.
+        """
+        pair = Message.objects.filter(user_low_id=OuterRef("user_low_id"), user_high_id=OuterRef("user_high_id"))
+        latest = pair.order_by("-created_at", "-id")
+        Conversation.objects.update(
+            last_message_id=Subquery(latest.values("id")[:1]),
+            last_activity_at=Subquery(latest.values("created_at")[:1]),
+        )
+        for side in ("user_low", "user_high"):
+            Conversation.objects.filter(**{f"{side}_last_read_at__isnull": True}).exclude(**{f"{side}_last_read_id": 0}).update(
+                **{f"{side}_last_read_at": Subquery(pair.filter(id=OuterRef(f"{side}_last_read_id")).values("created_at")[:1])}
+            )
+
+    def recount_unread(self):
+        """Derive every unread counter from its side's read watermark."""
+        def unread(receiver, sender, side):
+            return Coalesce(Subquery(
+                Message.objects
+                .filter(
+                    newer_than(Coalesce(OuterRef(f"{side}_last_read_at"), NEVER_READ), OuterRef(f"{side}_last_read_id")),
+                    receiver_id=OuterRef(receiver), sender_id=OuterRef(sender),
+                )
+                .order_by().values("receiver_id").annotate(count=Count("id")).values("count")
+            ), 0)
+
+        Conversation.objects.update(
+            user_low_unread=unread("user_low_id", "user_high_id", "user_low"),
+            user_high_unread=unread("user_high_id", "user_low_id", "user_high"),
+        )
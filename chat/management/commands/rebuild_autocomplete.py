@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from chat.autocomplete import KINDS, get_autocomplete
+
+
+class Command(BaseCommand):
+    help = "Rebuild the username and group name autocomplete index from the database."
+
+    def handle(self, *args, **options):
+        autocomplete = get_autocomplete()
+        for kind in KINDS:
+            autocomplete.rebuild(kind)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt autocomplete index for {', '.join(KINDS)}."))
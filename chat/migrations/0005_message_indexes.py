@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_alter_user_managers_remove_user_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 'accepted')), fields=['from_user', 'to_user'], name='friendreq_accepted_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(condition=models.Q(('status', 'accepted')), fields=['to_user', 'from_user'], name='friendreq_accepted_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='groupmsg_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'created_at', 'id'], name='message_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'is_read'], name='message_receiver_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', 'sender'], name='message_unread_idx'),
+        ),
+    ]
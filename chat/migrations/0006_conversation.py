@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('user_low_unread', models.PositiveIntegerField(default=0)),
+                ('user_high_unread', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_activity_at'], name='conversation_low_activity_idx'), models.Index(fields=['user_high', '-last_activity_at'], name='conversation_high_activity_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_pair_unique'), models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='conversation_pair_ordered')],
+            },
+        ),
+    ]
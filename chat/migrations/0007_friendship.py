@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_friendships(apps, schema_editor):
+    FriendRequest = apps.get_model('chat', 'FriendRequest')
+    Friendship = apps.get_model('chat', 'Friendship')
+    edges = []
+    for from_id, to_id in FriendRequest.objects.filter(status='accepted').values_list('from_user_id', 'to_user_id').iterator():
+        edges.append(Friendship(user_id=from_id, friend_id=to_id))
+        edges.append(Friendship(user_id=to_id, friend_id=from_id))
+    Friendship.objects.bulk_create(edges, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'friend'), name='friendship_unique')],
+            },
+        ),
+        migrations.RunPython(populate_friendships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_friendship'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
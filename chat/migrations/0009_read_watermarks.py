@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:11
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_watermarks(apps, schema_editor):
+    """Start each watermark at the newest message the old is_read flags marked as read."""
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    GroupMembership = apps.get_model('chat', 'GroupMembership')
+    GroupMessage = apps.get_model('chat', 'GroupMessage')
+
+    def newest_read(receiver, sender):
+        return Coalesce(Subquery(
+            Message.objects
+            .filter(receiver_id=OuterRef(receiver), sender_id=OuterRef(sender), is_read=True)
+            .order_by().values('receiver_id').annotate(newest=Max('id')).values('newest')
+        ), 0)
+
+    Conversation.objects.update(
+        user_low_last_read_id=newest_read('user_low_id', 'user_high_id'),
+        user_high_last_read_id=newest_read('user_high_id', 'user_low_id'),
+    )
+    # GroupMessage.is_read was shared by every member, so treat existing history as read.
+    GroupMembership.objects.update(last_read_message_id=Coalesce(Subquery(
+        GroupMessage.objects
+        .filter(group_id=OuterRef('group_id'))
+        .order_by().values('group_id').annotate(newest=Max('id')).values('newest')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low_last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='groupmembership',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_watermarks, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_receiver_read_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_unread_idx',
+        ),
+    ]
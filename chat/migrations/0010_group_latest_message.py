@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:17
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_latest_message(apps, schema_editor):
+    Group = apps.get_model('chat', 'Group')
+    GroupMessage = apps.get_model('chat', 'GroupMessage')
+    Group.objects.update(latest_message_id=Coalesce(Subquery(
+        GroupMessage.objects
+        .filter(group_id=OuterRef('pk'))
+        .order_by().values('group_id').annotate(newest=Max('id')).values('newest')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='latest_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'id'], name='groupmsg_group_id_idx'),
+        ),
+        migrations.RunPython(populate_latest_message, migrations.RunPython.noop),
+    ]
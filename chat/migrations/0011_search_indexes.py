@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Trigram GIN indexes for the word-start regex filters in chat/search.py. They
+# only exist on PostgreSQL; the other backends search an in-process index.
+TRIGRAM_INDEXES = [
+    ('chat_userprofile', 'username'),
+    ('chat_userprofile', 'full_name'),
+    ('chat_group', 'name'),
+    ('chat_group', 'description'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_group_latest_message'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
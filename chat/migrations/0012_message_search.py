@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# Full-text indexes for chat.search.match_content, maintained on every insert.
+# PostgreSQL: GIN indexes on to_tsvector('simple', content).
+# SQLite: external-content FTS5 tables kept current by triggers. SQLite drops a
+# table's triggers when Django rebuilds it, so a later migration that alters
+# chat_message or chat_groupmessage must run create_sqlite_fts again.
+TABLES = ['chat_message', 'chat_groupmessage']
+
+
+def create_sqlite_fts(schema_editor, table):
+    fts = f'{table}_fts'
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(content, content='{table}', content_rowid='id')"
+    )
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_insert')
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_delete')
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_update')
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER {fts}_update AFTER UPDATE OF content ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+        f'INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END'
+    )
+    schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_content_fts ON {table} USING gin (to_tsvector('simple', content))"
+            )
+        elif vendor == 'sqlite':
+            create_sqlite_fts(schema_editor, table)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_content_fts')
+        elif vendor == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
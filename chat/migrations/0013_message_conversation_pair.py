@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-17 13:54
+
+import importlib
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+search = importlib.import_module('chat.migrations.0012_message_search')
+
+
+def restore_sqlite_fts(apps, schema_editor):
+    # Adding the stored columns rebuilds chat_message on SQLite, dropping its FTS triggers.
+    if schema_editor.connection.vendor == 'sqlite':
+        search.create_sqlite_fts(schema_editor, 'chat_message')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_message_search'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_conversation_idx',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='user_high_id',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Greatest('sender', 'receiver'), output_field=models.BigIntegerField()),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='user_low_id',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Least('sender', 'receiver'), output_field=models.BigIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user_low_id', 'user_high_id', 'created_at', 'id'], name='message_conversation_idx'),
+        ),
+        migrations.RunPython(restore_sqlite_fts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-17 14:17
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_keys(apps, schema_editor):
+    """
+    Key each watermark and latest message on the created_at of its message. Ids
+    followed send order until now, so a deleted message is replaced by the
+    newest one before it.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    Group = apps.get_model('chat', 'Group')
+    GroupMembership = apps.get_model('chat', 'GroupMembership')
+    GroupMessage = apps.get_model('chat', 'GroupMessage')
+
+    def created_at(messages, message_id):
+        return Subquery(messages.filter(id__lte=OuterRef(message_id)).order_by('-id').values('created_at')[:1])
+
+    pair = Message.objects.filter(user_low_id=OuterRef('user_low_id'), user_high_id=OuterRef('user_high_id'))
+    Conversation.objects.exclude(user_low_last_read_id=0).update(
+        user_low_last_read_at=created_at(pair, 'user_low_last_read_id'),
+    )
+    Conversation.objects.exclude(user_high_last_read_id=0).update(
+        user_high_last_read_at=created_at(pair, 'user_high_last_read_id'),
+    )
+    Group.objects.exclude(latest_message_id=0).update(
+        latest_message_at=created_at(GroupMessage.objects.filter(group_id=OuterRef('pk')), 'latest_message_id'),
+    )
+    GroupMembership.objects.exclude(last_read_message_id=0).update(
+        last_read_message_at=created_at(GroupMessage.objects.filter(group_id=OuterRef('group_id')), 'last_read_message_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_message_conversation_pair'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='groupmessage',
+            name='groupmsg_group_id_idx',
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high_last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low_last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='latest_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupmembership',
+            name='last_read_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_keys, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 # Create your models here.
@@ -72,11 +76,43 @@ class FriendRequest(models.Model):
 
     class Meta:
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            # Friend lookups only ever look at accepted requests, in both directions.
+            models.Index(
+                fields=['from_user', 'to_user'],
+                condition=models.Q(status='accepted'),
+                name='friendreq_accepted_from_idx',
+            ),
+            models.Index(
+                fields=['to_user', 'from_user'],
+                condition=models.Q(status='accepted'),
+                name='friendreq_accepted_to_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.from_user} → {self.to_user} ({self.status})"
     
 
+class Friendship(models.Model):
+    """
+    Symmetric edge table derived from accepted friend requests: one row per
+    direction, so "is B a friend of A" is a single point lookup on (user, friend).
+    Kept in sync by the FriendRequest signals in chat.signals.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friendships')
+    friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='friendship_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} ↔ {self.friend}"
+
+
 class Message(models.Model):
     MESSAGE_TYPE_CHOICES = [
         ('text', 'Text'),
@@ -89,12 +125,255 @@ class Message(models.Model):
     content = models.TextField()
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPE_CHOICES, default='text')
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind persistence stamps messages when they are received.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # The conversation's ordered pair, as in Conversation, computed by the
+    # database. Filtering on both columns is one equality lookup whichever way
+    # each message went, so history pages are read in index order.
+    user_low_id = models.GeneratedField(
+        expression=Least('sender', 'receiver'), output_field=models.BigIntegerField(), db_persist=True,
+    )
+    user_high_id = models.GeneratedField(
+        expression=Greatest('sender', 'receiver'), output_field=models.BigIntegerField(), db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Chat history and reconnect sync: filter on the pair, sort by (created_at, id).
+            models.Index(fields=['user_low_id', 'user_high_id', 'created_at', 'id'], name='message_conversation_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} → {self.receiver}: {self.content[:30]}"
     
 
+def _pk(user):
+    return getattr(user, "pk", user)
+
+
+# Messages are ordered by (created_at, id): created_at is stamped when a message
+# is received, and ids, which write-behind hands out from per-process blocks,
+# only break ties. Read watermarks and latest-message pointers use the same key.
+
+def newer_than(created_at, pk):
+    """Rows after (created_at, pk)."""
+    return models.Q(created_at__gte=created_at) & (models.Q(created_at__gt=created_at) | models.Q(id__gt=pk))
+
+
+def older_than(created_at, pk):
+    """Rows before (created_at, pk)."""
+    return models.Q(created_at__lte=created_at) & (models.Q(created_at__lt=created_at) | models.Q(id__lt=pk))
+
+
+def key_before(at_field, id_field, created_at, pk):
+    """Rows whose (at_field, id_field) key is before (created_at, pk); a null at_field is before everything."""
+    return (
+        models.Q(**{f"{at_field}__isnull": True})
+        | models.Q(**{f"{at_field}__lt": created_at})
+        | models.Q(**{at_field: created_at, f"{id_field}__lt": pk})
+    )
+
+
+def message_key(message):
+    return (message.created_at, message.id)
+
+
+def is_read(watermark, created_at, pk):
+    """Whether the message keyed (created_at, pk) is at or before `watermark`, a (created_at, id) pair."""
+    read_at, read_id = watermark
+    return read_at is not None and (created_at, pk) <= (read_at, read_id)
+
+
+# Before every message: stands in for a watermark that has not been set.
+NEVER_READ = models.Value(datetime(1970, 1, 1, tzinfo=dt_timezone.utc), output_field=models.DateTimeField())
+
+
+class ConversationManager(models.Manager):
+    @staticmethod
+    def ordered_pair(user_a_id, user_b_id):
+        return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+    def involving(self, user):
+        return self.filter(models.Q(user_low=user) | models.Q(user_high=user))
+
+    def record_message(self, message):
+        """
+        Point the conversation at `message` and bump the receiver's unread counter.
+        Call this in the same transaction that created the message.
+        """
+        self.record_messages([message])
+
+    def record_messages(self, messages):
+        """
+        Batch form of record_message: one locked get_or_create and one UPDATE
+        per pair. A message that lands after the receiver has read past it
+        (a late write-behind batch) is not counted as unread.
+        """
+        by_pair = {}
+        for message in messages:
+            by_pair.setdefault(self.ordered_pair(message.sender_id, message.receiver_id), []).append(message)
+
+        with transaction.atomic():
+            for (low, high), pair_messages in by_pair.items():
+                conversation, _ = self.select_for_update().get_or_create(user_low_id=low, user_high_id=high)
+                changes = {}
+                latest = max(pair_messages, key=message_key)
+                # Never move last_message back.
+                if conversation.last_activity_at is None or message_key(latest) > (
+                    conversation.last_activity_at, conversation.last_message_id or 0,
+                ):
+                    changes.update(last_message_id=latest.id, last_activity_at=latest.created_at)
+                for side, user_id in (("user_low", low), ("user_high", high)):
+                    watermark = conversation.last_read_for(user_id)
+                    count = sum(
+                        1 for message in pair_messages
+                        if message.receiver_id == user_id and not is_read(watermark, *message_key(message))
+                    )
+                    if count:
+                        changes[f"{side}_unread"] = models.F(f"{side}_unread") + count
+                if changes:
+                    self.filter(pk=conversation.pk).update(**changes)
+
+    def read_watermarks(self, user, other_user):
+        """{user_id: (created_at, id) of the last message read} for both sides of the conversation."""
+        low, high = self.ordered_pair(_pk(user), _pk(other_user))
+        row = (
+            self.filter(user_low_id=low, user_high_id=high)
+            .values_list("user_low_last_read_at", "user_low_last_read_id", "user_high_last_read_at", "user_high_last_read_id")
+            .first()
+        )
+        return {low: row[:2], high: row[2:]} if row else {}
+
+    def mark_read(self, user, other_user, message_id=None):
+        """
+        Advance `user`'s read watermark in their conversation with `other_user`
+        to `message_id`, a message in the conversation (default: the latest
+        message), and recompute their unread count from it. Watermarks never
+        move backwards, so reading an already-read conversation matches no
+        rows. Returns the number of rows updated.
+        """
+        user_id, other_id = _pk(user), _pk(other_user)
+        low, high = self.ordered_pair(user_id, other_id)
+        side = "user_low" if user_id == low else "user_high"
+        read_at, read_id, unread = f"{side}_last_read_at", f"{side}_last_read_id", f"{side}_unread"
+        conversation = self.filter(user_low_id=low, user_high_id=high)
+
+        if message_id is None:
+            return conversation.filter(
+                key_before(read_at, read_id, models.F("last_activity_at"), models.F("last_message_id")),
+                last_message__isnull=False,
+            ).update(**{read_at: models.F("last_activity_at"), read_id: models.F("last_message_id"), unread: 0})
+
+        messages = Message.objects.filter(user_low_id=low, user_high_id=high)
+        created_at = messages.filter(id=message_id).values_list("created_at", flat=True).first()
+        if created_at is None:
+            return 0
+        remaining = (
+            messages
+            .filter(newer_than(created_at, message_id), sender_id=other_id)
+            .order_by()
+            .values("user_low_id")
+            .annotate(count=models.Count("id"))
+            .values("count")
+        )
+        return conversation.filter(key_before(read_at, read_id, created_at, message_id)).update(**{
+            read_at: created_at,
+            read_id: message_id,
+            unread: Coalesce(models.Subquery(remaining), 0),
+        })
+
+
+class Conversation(models.Model):
+    """
+    One row per pair of users who have exchanged messages, ordered so that
+    user_low.id < user_high.id. Keeps the inbox a single indexed read.
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    user_low_unread = models.PositiveIntegerField(default=0)
+    user_high_unread = models.PositiveIntegerField(default=0)
+    # Read watermarks: the (created_at, id) of the newest message each side has
+    # read, null/0 before anything is. The unread counters above are recomputed
+    # from them whenever a watermark moves.
+    user_low_last_read_at = models.DateTimeField(null=True, blank=True)
+    user_low_last_read_id = models.BigIntegerField(default=0)
+    user_high_last_read_at = models.DateTimeField(null=True, blank=True)
+    user_high_last_read_id = models.BigIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='conversation_pair_unique'),
+            models.CheckConstraint(condition=models.Q(user_low__lt=models.F('user_high')), name='conversation_pair_ordered'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity_at'], name='conversation_low_activity_idx'),
+            models.Index(fields=['user_high', '-last_activity_at'], name='conversation_high_activity_idx'),
+        ]
+
+    def other_user_id(self, user):
+        return self.user_high_id if user.id == self.user_low_id else self.user_low_id
+
+    def unread_count_for(self, user):
+        return self.user_low_unread if user.id == self.user_low_id else self.user_high_unread
+
+    def last_read_id_for(self, user_id):
+        return self.user_low_last_read_id if user_id == self.user_low_id else self.user_high_last_read_id
+
+    def last_read_for(self, user_id):
+        if user_id == self.user_low_id:
+            return self.user_low_last_read_at, self.user_low_last_read_id
+        return self.user_high_last_read_at, self.user_high_last_read_id
+
+    def __str__(self):
+        return f"{self.user_low} ↔ {self.user_high}"
+
+
+class GroupQuerySet(models.QuerySet):
+    def with_unread_counts(self, user):
+        """
+        Annotate each group with `unread_count` for `user` in the same query.
+        Groups whose cached latest message is at or before the member's
+        watermark short-circuit to 0 without counting.
+        """
+        membership = GroupMembership.objects.filter(group=models.OuterRef("pk"), user_id=_pk(user))
+        unread = (
+            GroupMessage.objects
+            .filter(newer_than(models.OuterRef("last_read_at"), models.OuterRef("last_read_id")), group=models.OuterRef("pk"))
+            .order_by().values("group").annotate(count=models.Count("id")).values("count")
+        )
+        return self.annotate(
+            last_read_at=Coalesce(models.Subquery(membership.values("last_read_message_at")[:1]), NEVER_READ),
+            last_read_id=Coalesce(models.Subquery(membership.values("last_read_message_id")[:1]), 0),
+        ).annotate(
+            unread_count=models.Case(
+                models.When(latest_message_at__isnull=True, then=0),
+                models.When(latest_message_at__lt=models.F("last_read_at"), then=0),
+                models.When(
+                    latest_message_at=models.F("last_read_at"), latest_message_id__lte=models.F("last_read_id"), then=0,
+                ),
+                default=Coalesce(models.Subquery(unread), 0),
+            ),
+        )
+
+
+class GroupManager(models.Manager.from_queryset(GroupQuerySet)):
+    def record_messages(self, messages):
+        """Move each group's latest message forward to the newest of `messages`."""
+        latest = {}
+        for message in messages:
+            group_id = int(message.group_id)
+            if group_id not in latest or message_key(message) > message_key(latest[group_id]):
+                latest[group_id] = message
+        for group_id, message in latest.items():
+            self.filter(
+                key_before("latest_message_at", "latest_message_id", message.created_at, message.id), pk=group_id,
+            ).update(latest_message_at=message.created_at, latest_message_id=message.id)
+
+
 class Group(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -102,15 +381,43 @@ class Group(models.Model):
     image_url = models.URLField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # (created_at, id) of the newest message in the group, kept current by GroupManager.record_messages.
+    latest_message_at = models.DateTimeField(null=True, blank=True)
+    latest_message_id = models.BigIntegerField(default=0)
+
+    objects = GroupManager()
 
     def __str__(self):
         return self.name
 
 
+class GroupMembershipManager(models.Manager):
+    def mark_read(self, group, user, message_id=None):
+        """
+        Advance `user`'s read watermark in `group` to `message_id`, a message
+        in the group, or by default to the group's latest message. Never moves
+        backwards; returns rows updated.
+        """
+        if message_id is None:
+            key = Group.objects.filter(pk=_pk(group)).values_list("latest_message_at", "latest_message_id").first()
+        else:
+            key = GroupMessage.objects.filter(group_id=_pk(group), id=message_id).values_list("created_at", "id").first()
+        if key is None or key[0] is None:
+            return 0
+        return self.filter(
+            key_before("last_read_message_at", "last_read_message_id", *key), group_id=_pk(group), user_id=_pk(user),
+        ).update(last_read_message_at=key[0], last_read_message_id=key[1])
+
+
 class GroupMembership(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='memberships')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_memberships')
     joined_at = models.DateTimeField(auto_now_add=True)
+    # (created_at, id) of the newest group message this member has read, null/0 before any.
+    last_read_message_at = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    objects = GroupMembershipManager()
 
     class Meta:
         unique_together = ('group', 'user')
@@ -131,7 +438,13 @@ class GroupMessage(models.Model):
     content = models.TextField()
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPE_CHOICES, default='text')
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # History pages, reconnect sync and unread counts after a member's watermark.
+            models.Index(fields=['group', 'created_at', 'id'], name='groupmsg_group_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} in {self.group}: {self.content[:30]}"
@@ -0,0 +1,131 @@
+"""
+A bounded outbound queue per WebSocket connection.
+
+Consumer handlers used to await `self.send` for every event, so a client that
+reads slowly held up its consumer, and the events behind it piled up in the
+connection's channel-layer inbox until the layer hit capacity. Now handlers
+put the frame in the connection's Outbox and return at once. A task per
+connection sends the queued frames in order, and exits when the queue is
+empty.
+
+At most WS_OUTBOX["SIZE"] frames wait. WS_OUTBOX["POLICY"] decides what
+happens when the queue is full:
+
+  drop_oldest  the oldest queued frame is dropped
+  coalesce     as drop_oldest, but a presence frame also replaces the queued
+               one for the same user and room, and a typing batch is merged
+               into the room's queued batch (newest state per user), instead
+               of queueing behind it. Messages and inbox deltas, which
+               clients count, are never coalesced.
+  disconnect   the queue is dropped and the client gets
+                   {"type": "overflow", "error": "...", "resume": {"group_3": 41, ...}}
+               then the socket is closed with 4008. "resume" has the last
+               message id sent in each room, so the client reconnects with
+               ?since=<id> (or a stream subscribe with "since") and misses
+               nothing.
+
+Acknowledgements and errors for the client's own frames are sent directly,
+not queued.
+"""
+import asyncio
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from prometheus_client import Counter, Gauge
+
+from chat.encoding import dumps_text
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+queue_depth = Gauge("websocket_outbound_queue_depth", "Frames waiting in WebSocket outbound queues in this process")
+frames_dropped = Counter(
+    "websocket_frames_dropped_total",
+    "Frames not sent because a WebSocket outbound queue was full, by policy outcome",
+    ["outcome"],
+)
+
+
+def outbox_setting(name):
+    defaults = {"SIZE": 1000, "POLICY": "disconnect"}
+    return getattr(settings, "WS_OUTBOX", {}).get(name, defaults[name])
+
+
+class Outbox:
+    def __init__(self, send, close):
+        self.send = send
+        self.close = close
+        self.size = outbox_setting("SIZE")
+        self.policy = outbox_setting("POLICY")
+        if self.policy not in POLICIES:
+            raise ImproperlyConfigured(f"WS_OUTBOX['POLICY'] must be one of {', '.join(POLICIES)}.")
+        self.queue = deque()  # [text, room, message id, coalescing key]
+        self.keyed = {}  # coalescing key -> its queued entry
+        self.sent = {}  # room -> last message id sent
+        self.sender = None
+        self.overflowed = False
+
+    def put(self, text, room=None, message_id=None, key=None, merge=None):
+        """
+        Queue `text`. Under "coalesce", a frame with the `key` of a queued one
+        replaces it, or is combined with it by merge(queued text, text).
+        """
+        if self.overflowed:
+            return
+        if key is not None and self.policy == "coalesce" and key in self.keyed:
+            entry = self.keyed[key]
+            entry[0] = text if merge is None else merge(entry[0], text)
+            frames_dropped.labels("coalesced").inc()
+            return
+        if len(self.queue) >= self.size:
+            if self.policy == "disconnect":
+                self.overflow()
+                return
+            self.pop()
+            frames_dropped.labels("dropped").inc()
+        entry = [text, room, message_id, key]
+        self.queue.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+        queue_depth.inc()
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.ensure_future(self.drain())
+
+    def pop(self):
+        entry = self.queue.popleft()
+        if entry[3] is not None and self.keyed.get(entry[3]) is entry:
+            del self.keyed[entry[3]]
+        queue_depth.dec()
+        return entry
+
+    def overflow(self):
+        frames_dropped.labels("disconnected").inc(len(self.queue))
+        self.discard()
+        self.overflowed = True
+        self.queue.append([
+            dumps_text({
+                "type": "overflow",
+                "error": "Connection too slow; reconnect with 'since' from 'resume'.",
+                "resume": self.sent,
+            }),
+            None, None, None,
+        ])
+        queue_depth.inc()
+        self.sender = asyncio.ensure_future(self.drain())
+
+    async def drain(self):
+        while self.queue:
+            text, room, message_id, _ = self.pop()
+            await self.send(text_data=text)
+            if message_id is not None:
+                self.sent[room] = message_id
+        if self.overflowed:
+            await self.close(code=4008)
+
+    def discard(self):
+        """Drop everything queued; the connection is closing."""
+        if self.sender is not None:
+            self.sender.cancel()
+        queue_depth.dec(len(self.queue))
+        self.queue.clear()
+        self.keyed.clear()
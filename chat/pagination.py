@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from chat.models import newer_than, older_than
+
+
+class MessagePagination(PageNumberPagination):
+    """
+    Page-number pagination for message lists with an optional keyset (cursor) mode.
+
+    Cursor mode is enabled with `?mode=cursor`, or implicitly by passing a
+    `before`/`after` message id. Pages are keyed on (created_at, id) and always
+    returned newest first, so no COUNT(*) or OFFSET scan is needed. The anchor
+    condition leads with a plain created_at bound, which an index on
+    (<room columns>, created_at, id) can seek to; every page is then read in
+    index order, whatever its depth:
+
+        ?mode=cursor            latest page
+        ?before=<message_id>    older messages than the anchor
+        ?after=<message_id>     newer messages than the anchor
+    """
+    mode_query_param = "mode"
+    before_query_param = "before"
+    after_query_param = "after"
+    ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_request(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        before = self.get_anchor(request, self.before_query_param)
+        after = self.get_anchor(request, self.after_query_param)
+        if before is not None and after is not None:
+            raise ValidationError({"error": "Use either `before` or `after`, not both."})
+
+        queryset = queryset.order_by(*self.ordering)
+        if after is not None:
+            created_at, pk = self.get_anchor_key(queryset, after, self.after_query_param)
+            queryset = queryset.filter(newer_than(created_at, pk)).order_by("created_at", "id")
+        elif before is not None:
+            created_at, pk = self.get_anchor_key(queryset, before, self.before_query_param)
+            queryset = queryset.filter(older_than(created_at, pk))
+
+        # Fetch one extra row to find out whether there is another page.
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if after is not None:
+            rows.reverse()
+            self.has_newer, self.has_older = has_more, True
+        else:
+            self.has_newer, self.has_older = before is not None, has_more
+
+        self.page_rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_cursor_link(self.before_query_param, -1) if self.has_older else None,
+            "previous": self.get_cursor_link(self.after_query_param, 0) if self.has_newer else None,
+            "results": data,
+        })
+
+    def is_cursor_request(self, request):
+        params = request.query_params
+        return (
+            params.get(self.mode_query_param) == "cursor"
+            or self.before_query_param in params
+            or self.after_query_param in params
+        )
+
+    def get_anchor(self, request, param):
+        value = request.query_params.get(param)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({param: "Must be a message id."})
+
+    def get_anchor_key(self, queryset, pk, param):
+        anchor = queryset.filter(id=pk).values_list("created_at", "id").first()
+        if anchor is None:
+            raise ValidationError({param: "Message not found in this conversation."})
+        return anchor
+
+    def get_cursor_link(self, param, index):
+        if not self.page_rows:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        url = remove_query_param(url, self.page_query_param)
+        row = self.page_rows[index]
+        # Row serializers page over `.values_list()` tuples that lead with the id.
+        row_id = row[0] if isinstance(row, tuple) else row.id
+        return replace_query_param(url, param, row_id)
+
+
+class MessageSearchPagination(BasePagination):
+    """
+    Keyset pagination over rows from several message tables merged newest
+    first, for results whose ids are only unique per table.
+
+    `paginate_querysets` takes {type: rows}, where each `rows` is a
+    `.values_list()` queryset that leads with the id and ends with
+    created_at (as the message row serializers do). Hits are ordered by
+    (created_at, type, id) descending, and `?cursor=` is an opaque encoding
+    of that key for the last hit on the previous page.
+    """
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_querysets(self, querysets, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request)
+        hits = []
+        for kind, rows in querysets.items():
+            rows = rows.order_by("-created_at", "-id")
+            if cursor is not None:
+                rows = rows.filter(self.older_than(kind, *cursor))
+            hits.extend((kind, row) for row in rows[:self.page_size + 1])
+        hits.sort(key=lambda hit: (hit[1][-1], hit[0], hit[1][0]), reverse=True)
+        self.has_more = len(hits) > self.page_size
+        self.page_hits = hits[:self.page_size]
+        return self.page_hits
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    @staticmethod
+    def older_than(kind, created_at, cursor_kind, pk):
+        if kind < cursor_kind:
+            return Q(created_at__lte=created_at)
+        if kind > cursor_kind:
+            return Q(created_at__lt=created_at)
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        kind, row = self.page_hits[-1]
+        cursor = json.dumps([row[-1].isoformat(), kind, row[0]], separators=(",", ":"))
+        token = base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None
+        try:
+            created_at, kind, pk = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            created_at = parse_datetime(created_at)
+            if created_at is None or not isinstance(kind, str) or not isinstance(pk, int):
+                raise ValueError
+        except (binascii.Error, TypeError, ValueError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor."})
+        return created_at, kind, pk
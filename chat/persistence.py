@@ -0,0 +1,207 @@
+"""
+Write-behind persistence for WebSocket messages.
+
+With CHAT_MESSAGE_PERSISTENCE = "write_behind" the consumers reserve a message
+id up front, fan the message out immediately and leave the INSERT to a
+per-process buffer that flushes with bulk_create once CHAT_WRITE_BEHIND
+["MAX_BATCH"] messages are pending or CHAT_WRITE_BEHIND["MAX_DELAY"] seconds
+have passed since the first one.
+
+Durability contract:
+  * A message may be delivered to recipients before it is committed. Until the
+    next flush (at most MAX_DELAY seconds or MAX_BATCH messages) it only
+    exists in this process's memory.
+  * A clean shutdown drains every pending message (atexit).
+  * A hard crash (SIGKILL, OOM) loses whatever was still buffered.
+  * A failed flush is retried with the next batch, up to MAX_RETRIES times,
+    after which the batch is logged and counted in
+    chat_messages_persist_failed_total.
+
+Ordering contract: messages are ordered by (created_at, id) everywhere (history
+pages, reconnect sync, each conversation's and group's latest message, read
+watermarks and unread counts), and created_at is stamped when the consumer
+receives the message, so across processes send order is as good as their
+clocks. Ids only break ties and need not follow send order, so each process
+reserves CHAT_WRITE_BEHIND["ID_BLOCK"] ids per database round trip and hands
+them out from memory. A batch that lands after a newer message never moves a
+conversation's or group's latest message back, and a message that lands after
+its receiver has read past it is not counted as unread. A read frame flushes
+this process's buffer first; a message still buffered in another process
+cannot be marked read until that process flushes it.
+
+The default "sync" mode keeps the old behaviour: the message is committed
+before anything is sent.
+"""
+import asyncio
+import atexit
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from prometheus_client import Counter
+
+from chat.db import db_sync_to_async
+from chat.models import Conversation, Group, GroupMessage, Message
+
+logger = logging.getLogger('chat')
+
+messages_flushed = Counter("chat_messages_persisted_total", "Messages written by write-behind flushes", ["model"])
+messages_failed = Counter("chat_messages_persist_failed_total", "Messages dropped after failed write-behind flushes", ["model"])
+
+
+def write_behind_enabled():
+    return getattr(settings, "CHAT_MESSAGE_PERSISTENCE", "sync") == "write_behind"
+
+
+def write_behind_setting(name):
+    defaults = {"MAX_BATCH": 200, "MAX_DELAY": 0.05, "ID_BLOCK": 100, "MAX_RETRIES": 3}
+    return getattr(settings, "CHAT_WRITE_BEHIND", {}).get(name, defaults[name])
+
+
+class IdAllocator:
+    """
+    Hands out primary keys from blocks reserved in the database, so ids are
+    unique across processes and never collide with regular INSERTs. Ids from
+    different processes' blocks interleave out of send order, which the
+    ordering contract above allows.
+    """
+
+    def __init__(self, model, block_size):
+        self.model = model
+        self.block_size = block_size
+        self.next_id = 0
+        self.last_id = -1
+
+    async def allocate(self):
+        if self.next_id > self.last_id:
+            self.next_id, self.last_id = await db_sync_to_async(self.reserve_block)()
+        allocated = self.next_id
+        self.next_id += 1
+        return allocated
+
+    def reserve_block(self):
+        table = self.model._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [table, self.block_size],
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                # Sequence values are normally contiguous; fall back to the first run if not.
+                first = ids[0]
+                last = first
+                for value in ids[1:]:
+                    if value != last + 1:
+                        break
+                    last = value
+                return first, last
+            if connection.vendor == "sqlite":
+                # AUTOINCREMENT tables never reuse ids below sqlite_sequence.seq.
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"')
+                    current = cursor.fetchone()[0]
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, current])
+                else:
+                    current = row[0]
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s",
+                    [current + self.block_size, table],
+                )
+                return current + 1, current + self.block_size
+        raise ImproperlyConfigured(f"Write-behind persistence does not support the {connection.vendor} backend.")
+
+
+class WriteBehindBuffer:
+    def __init__(self, model, after_write=None):
+        self.model = model
+        self.after_write = after_write
+        self.allocator = IdAllocator(model, write_behind_setting("ID_BLOCK"))
+        self.pending = []
+        self.retries = 0
+        self.flush_handle = None
+
+    async def submit(self, obj):
+        """Assign `obj` an id and queue it for the next flush. Returns immediately."""
+        obj.id = await self.allocator.allocate()
+        self.pending.append(obj)
+        if len(self.pending) >= write_behind_setting("MAX_BATCH"):
+            await self.flush()
+        else:
+            self.schedule_flush()
+        return obj
+
+    def schedule_flush(self):
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(
+                write_behind_setting("MAX_DELAY"), lambda: loop.create_task(self.flush())
+            )
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            await db_sync_to_async(self.write)(batch)
+        except Exception:
+            self.handle_failure(batch)
+            if self.pending:
+                self.schedule_flush()
+
+    def drain(self):
+        """Synchronously write everything still buffered. Registered with atexit."""
+        batch, self.pending = self.pending, []
+        while batch:
+            try:
+                self.write(batch)
+                return
+            except Exception:
+                self.handle_failure(batch)
+                batch, self.pending = self.pending, []
+
+    def write(self, batch):
+        with transaction.atomic():
+            self.model.objects.bulk_create(batch)
+            if self.after_write:
+                self.after_write(batch)
+        self.retries = 0
+        messages_flushed.labels(self.model.__name__).inc(len(batch))
+
+    def handle_failure(self, batch):
+        self.retries += 1
+        if self.retries > write_behind_setting("MAX_RETRIES"):
+            self.retries = 0
+            messages_failed.labels(self.model.__name__).inc(len(batch))
+            logger.error(
+                f"[WRITE-BEHIND] Dropping {len(batch)} {self.model.__name__} rows after repeated failures",
+                exc_info=True,
+            )
+            return
+        logger.warning(f"[WRITE-BEHIND] Flush of {len(batch)} {self.model.__name__} rows failed, retrying", exc_info=True)
+        self.pending = batch + self.pending
+
+
+_buffers = {}
+
+
+def get_buffer(model):
+    if model not in _buffers:
+        after_write = Conversation.objects.record_messages if model is Message else Group.objects.record_messages
+        _buffers[model] = WriteBehindBuffer(model, after_write)
+        atexit.register(_buffers[model].drain)
+    return _buffers[model]
+
+
+def message_buffer():
+    return get_buffer(Message)
+
+
+def group_message_buffer():
+    return get_buffer(GroupMessage)
@@ -0,0 +1,190 @@
+"""
+Presence (online/away/offline) and typing indicators for the WebSocket
+consumers. Neither is ever written to the database.
+
+Presence is tracked per connection: each one stores its status with an
+expiry of CHAT_PRESENCE["TTL"] seconds, pushed forward by every heartbeat.
+A user is "online" if any live connection is online, "away" if all of them
+are away, and "offline" once every connection has closed or expired, which
+is how a crashed worker's connections age out. Writing a connection's
+status returns the user's status before and after the write, so consumers
+announce a change only when there is one: opening a second tab or closing
+one of two leaves the user online.
+
+CHAT_PRESENCE["BACKEND"] picks the store (see chat/stores.py):
+
+  "redis"  a hash per user at REDIS_URL mapping connection -> "status:expiry",
+           with the key itself expiring TTL seconds after the last write.
+           `statuses()` reads any number of users in one pipelined round trip.
+  "local"  the same in this process's memory.
+
+Typing frames are debounced per connection (an unchanged state is resent at
+most every TYPING_REFRESH seconds) and then coalesced per room by
+TypingCoalescer, which sends one event per TYPING_WINDOW seconds listing
+every user whose state changed, however many are typing.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+from prometheus_client import Counter
+
+from chat.encoding import dumps_text
+from chat.stores import Stores
+from chat.redis_client import get_async_redis, get_redis
+
+STATUSES = ("online", "away")
+OFFLINE = "offline"
+
+typing_frames = Counter("chat_typing_frames_total", "Typing frames received, by what happened to them", ["outcome"])
+
+
+def combined_status(connections, now):
+    """The user's status from their connections' (status, expires_at) pairs."""
+    live = [status for status, expires_at in connections if expires_at > now]
+    if "online" in live:
+        return "online"
+    return "away" if live else OFFLINE
+
+
+class LocalPresence:
+    def __init__(self):
+        self.users = {}
+
+    async def set(self, user_id, connection, status):
+        """Record `connection`'s status (also the heartbeat); returns the user's (previous, new) status."""
+        now = time.time()
+        previous = self.status(user_id, now)
+        self.users.setdefault(user_id, {})[connection] = (status, now + settings.CHAT_PRESENCE["TTL"])
+        return previous, self.status(user_id, now)
+
+    async def remove(self, user_id, connection):
+        """Forget `connection`; returns the user's (previous, new) status."""
+        now = time.time()
+        previous = self.status(user_id, now)
+        connections = self.users.get(user_id, {})
+        connections.pop(connection, None)
+        if not connections:
+            self.users.pop(user_id, None)
+        return previous, self.status(user_id, now)
+
+    def status(self, user_id, now):
+        return combined_status(self.users.get(user_id, {}).values(), now)
+
+    def statuses(self, user_ids):
+        now = time.time()
+        return {user_id: self.status(user_id, now) for user_id in user_ids}
+
+
+class RedisPresence:
+    prefix = "chat:presence"
+
+    def __init__(self, client=None, async_client=None):
+        self._client = client
+        self._async_client = async_client
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_redis()
+
+    @property
+    def async_client(self):
+        return self._async_client if self._async_client is not None else get_async_redis()
+
+    def key(self, user_id):
+        return f"{self.prefix}:{user_id}"
+
+    @staticmethod
+    def parse(entries):
+        for value in entries.values():
+            status, _, expires_at = value.decode().partition(":")
+            yield status, float(expires_at)
+
+    async def set(self, user_id, connection, status):
+        """Record `connection`'s status (also the heartbeat); returns the user's (previous, new) status."""
+        ttl = settings.CHAT_PRESENCE["TTL"]
+        now = time.time()
+        key = self.key(user_id)
+        pipe = self.async_client.pipeline()
+        pipe.hgetall(key)
+        pipe.hset(key, connection, f"{status}:{now + ttl}")
+        pipe.expire(key, ttl)
+        pipe.hgetall(key)
+        previous, *_, entries = await pipe.execute()
+        # Connections whose worker died without removing them.
+        expired = [field for field, value in entries.items() if float(value.split(b":")[1]) <= now]
+        if expired:
+            await self.async_client.hdel(key, *expired)
+        return combined_status(self.parse(previous), now), combined_status(self.parse(entries), now)
+
+    async def remove(self, user_id, connection):
+        """Forget `connection`; returns the user's (previous, new) status."""
+        key = self.key(user_id)
+        pipe = self.async_client.pipeline()
+        pipe.hgetall(key)
+        pipe.hdel(key, connection)
+        pipe.hgetall(key)
+        previous, _, entries = await pipe.execute()
+        now = time.time()
+        return combined_status(self.parse(previous), now), combined_status(self.parse(entries), now)
+
+    def statuses(self, user_ids):
+        user_ids = list(user_ids)
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(self.key(user_id))
+        now = time.time()
+        return {
+            user_id: combined_status(self.parse(entries), now)
+            for user_id, entries in zip(user_ids, pipe.execute())
+        }
+
+
+_backends = Stores("CHAT_PRESENCE", {"redis": RedisPresence, "local": LocalPresence})
+
+
+def get_presence():
+    return _backends.get()
+
+
+class TypingCoalescer:
+    """
+    Buffers typing changes per room and flushes each room's buffer as a single
+    group_send TYPING_WINDOW seconds after its first change. Each process
+    coalesces the connections it serves.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.tasks = set()
+
+    def push(self, channel_layer, room, user_id, typing):
+        if room not in self.pending:
+            self.pending[room] = {}
+            asyncio.get_running_loop().call_later(
+                settings.CHAT_PRESENCE["TYPING_WINDOW"], self.schedule_flush, channel_layer, room
+            )
+            typing_frames.labels("sent").inc()
+        else:
+            typing_frames.labels("coalesced").inc()
+        self.pending[room][user_id] = typing
+
+    def schedule_flush(self, channel_layer, room):
+        task = asyncio.ensure_future(self.flush(channel_layer, room))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self, channel_layer, room):
+        users = self.pending.pop(room, None)
+        if users:
+            await channel_layer.group_send(room, {
+                "type": "typing_update",
+                "room": room,
+                "text": dumps_text({
+                    "type": "typing",
+                    "users": [{"id": user_id, "typing": typing} for user_id, typing in users.items()],
+                }),
+            })
+
+
+typing_coalescer = TypingCoalescer()
@@ -0,0 +1,243 @@
+"""
+Token-bucket rate limits for sending messages, over WebSocket and REST.
+
+A rate is "<tokens>/<period>" with a period of s, min, h or day: "10/s" lets
+a burst of 10 through and then one every tenth of a second. Limits are looked
+up by what is being done and where:
+
+  types      "message" (posting, over any endpoint), and the WebSocket frames
+             "typing", "read", "sync" and "subscribe"
+  endpoints  "ws_chat", "ws_group", "ws_stream", "rest_message",
+             "rest_group_message"
+
+A rate under "<endpoint>:<type>" applies to that endpoint alone; one under
+"<type>" applies everywhere the type has no endpoint rate, with one bucket
+across all those endpoints. A type with no rate is not limited.
+
+CHAT_RATE_LIMIT["USER"] rates are per user, shared by all of the user's
+connections and requests. Their buckets are kept by CHAT_RATE_LIMIT["BACKEND"]
+(see chat/stores.py):
+
+  "redis"  a hash per bucket at REDIS_URL, updated by one Lua script call, so
+           every worker shares the limit. A worker that has been told a
+           bucket is empty refuses it locally until the wait is over, without
+           asking Redis again.
+  "local"  this process's memory.
+
+CHAT_RATE_LIMIT["CONNECTION"] rates are per WebSocket connection and always
+kept in the connection itself.
+
+A refused WebSocket frame gets
+{"error": "Rate limit exceeded.", "code": "rate_limited", "scope": "message",
+"retry_after": 0.25}. A refused REST request gets the same body with a 429
+status and a Retry-After header. Each refusal counts in
+chat_rate_limited_total.
+"""
+import time
+
+from django.conf import settings
+from prometheus_client import Counter
+from rest_framework import exceptions
+from rest_framework.throttling import BaseThrottle
+
+from chat.stores import Stores
+from chat.redis_client import get_async_redis, get_redis
+from chat.rooms import RoomError
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+rate_limited = Counter("chat_rate_limited_total", "Messages and frames refused by rate limits", ["endpoint", "scope"])
+
+
+def parse_rate(rate):
+    """"10/s" -> (capacity 10, refilled at 10 tokens per second)."""
+    tokens, _, period = rate.partition("/")
+    return int(tokens), int(tokens) / PERIODS[period[0]]
+
+
+def find_rate(kind, endpoint, frame_type):
+    """The (scope, capacity, tokens per second) limiting `frame_type` on `endpoint`, or None."""
+    rates = settings.CHAT_RATE_LIMIT[kind]
+    for scope in (f"{endpoint}:{frame_type}", frame_type):
+        if rates.get(scope):
+            return (scope, *parse_rate(rates[scope]))
+    return None
+
+
+class RateLimited(RoomError):
+    def __init__(self, scope, retry_after):
+        super().__init__("Rate limit exceeded.", code="rate_limited", scope=scope, retry_after=round(retry_after, 3))
+
+
+class Throttled(exceptions.Throttled):
+    """The REST form of RateLimited: 429, Retry-After and the same body."""
+
+    def __init__(self, limited):
+        super().__init__(wait=limited.fields["retry_after"])
+        self.detail = {"error": str(limited), **limited.fields}
+
+
+def take(buckets, key, capacity, rate, now):
+    """Take a token from buckets[key] = (tokens, updated); returns the seconds to wait, 0 if taken."""
+    tokens, updated = buckets.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+    buckets[key] = (tokens - 1, now)
+    return 0.0
+
+
+class LocalLimiter:
+    max_buckets = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.rates = {}  # key -> (capacity, rate), to tell when a bucket is full again
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        if len(self.buckets) >= self.max_buckets:
+            self.prune(now)
+        self.rates[key] = (capacity, rate)
+        return take(self.buckets, key, capacity, rate, now)
+
+    async def atake(self, key, capacity, rate):
+        return self.take(key, capacity, rate)
+
+    def prune(self, now):
+        # A bucket that has refilled is the same as no bucket.
+        for key, (tokens, updated) in list(self.buckets.items()):
+            capacity, rate = self.rates[key]
+            if tokens + (now - updated) * rate >= capacity:
+                del self.buckets[key]
+                del self.rates[key]
+
+
+class RedisLimiter:
+    prefix = "chat:ratelimit"
+    max_blocked = 10000
+    script = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens < 1 then
+            wait = (1 - tokens) / rate
+        else
+            tokens = tokens - 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, client=None, async_client=None):
+        self._client = client
+        self._async_client = async_client
+        self.blocked = {}  # key -> monotonic time the bucket has a token again
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_redis()
+
+    @property
+    def async_client(self):
+        return self._async_client if self._async_client is not None else get_async_redis()
+
+    def key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def known_wait(self, key):
+        until = self.blocked.get(key)
+        if until is None:
+            return 0.0
+        wait = until - time.monotonic()
+        if wait <= 0:
+            del self.blocked[key]
+            return 0.0
+        return wait
+
+    def record(self, key, wait):
+        wait = float(wait)
+        if wait > 0:
+            if len(self.blocked) >= self.max_blocked:
+                now = time.monotonic()
+                self.blocked = {k: until for k, until in self.blocked.items() if until > now}
+            self.blocked[key] = time.monotonic() + wait
+        return wait
+
+    def take(self, key, capacity, rate):
+        return self.known_wait(key) or self.record(
+            key, self.client.register_script(self.script)(keys=[self.key(key)], args=[capacity, rate])
+        )
+
+    async def atake(self, key, capacity, rate):
+        return self.known_wait(key) or self.record(
+            key, await self.async_client.register_script(self.script)(keys=[self.key(key)], args=[capacity, rate])
+        )
+
+
+_limiters = Stores("CHAT_RATE_LIMIT", {"redis": RedisLimiter, "local": LocalLimiter})
+
+
+def get_limiter():
+    return _limiters.get()
+
+
+def refuse(endpoint, scope, wait):
+    rate_limited.labels(endpoint, scope).inc()
+    raise RateLimited(scope, wait)
+
+
+def check_user(endpoint, frame_type, user_id):
+    """Take a token from the user's bucket for `frame_type` on `endpoint`; raises RateLimited if it is empty."""
+    rate = find_rate("USER", endpoint, frame_type)
+    if rate is not None:
+        scope, capacity, per_second = rate
+        wait = get_limiter().take(f"{scope}:{user_id}", capacity, per_second)
+        if wait:
+            refuse(endpoint, scope, wait)
+
+
+class ConnectionLimits:
+    """The limits on one WebSocket connection's frames, per connection and per user."""
+
+    def __init__(self, endpoint, user_id):
+        self.endpoint = endpoint
+        self.user_id = user_id
+        self.buckets = {}
+
+    async def check(self, frame_type):
+        rate = find_rate("CONNECTION", self.endpoint, frame_type)
+        if rate is not None:
+            scope, capacity, per_second = rate
+            wait = take(self.buckets, scope, capacity, per_second, time.monotonic())
+            if wait:
+                refuse(self.endpoint, scope, wait)
+        rate = find_rate("USER", self.endpoint, frame_type)
+        if rate is not None:
+            scope, capacity, per_second = rate
+            wait = await get_limiter().atake(f"{scope}:{self.user_id}", capacity, per_second)
+            if wait:
+                refuse(self.endpoint, scope, wait)
+
+
+class MessageRateThrottle(BaseThrottle):
+    """
+    Applies the user's "message" rate to a view's POSTs. The view names its
+    endpoint in `rate_limit_endpoint`.
+    """
+
+    def allow_request(self, request, view):
+        if request.method == "POST":
+            try:
+                check_user(view.rate_limit_endpoint, "message", request.user.id)
+            except RateLimited as e:
+                raise Throttled(e)
+        return True
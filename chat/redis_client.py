@@ -0,0 +1,32 @@
+"""
+Redis clients for features that use Redis directly rather than through the
+cache or the channel layer (autocomplete, presence). All connect to
+settings.REDIS_URL.
+"""
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def redis_cache_configured():
+    return settings.CACHES["default"]["BACKEND"] == "django.core.cache.backends.redis.RedisCache"
+
+
+def get_redis():
+    if settings.REDIS_URL not in _clients:
+        _clients[settings.REDIS_URL] = redis.Redis.from_url(settings.REDIS_URL)
+    return _clients[settings.REDIS_URL]
+
+
+def get_async_redis():
+    """A client for the running event loop; asyncio connections cannot be shared between loops."""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+    return _async_clients[loop]
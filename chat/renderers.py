@@ -0,0 +1,60 @@
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+from chat.encoding import dumps, json_backend
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes through chat.encoding, so orjson is used when
+    available. Indented output (the browsable API, `?indent=`) keeps DRF's
+    stdlib path.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or json_backend() == "json" or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps(data, default=self.encoder_class().default)
+        # Match DRF: escape U+2028/U+2029 so the output is a strict JavaScript subset.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+# Paths whose responses are never wrapped (docs, admin). Substring match, compiled once.
+ENVELOPE_EXCLUDED_PATHS = ["/swagger/", "/docs/", "/admin/", "/redoc/"]
+_excluded_paths = re.compile("|".join(re.escape(path) for path in ENVELOPE_EXCLUDED_PATHS))
+
+
+def envelope(data, status_code):
+    is_success = 200 <= status_code < 300
+    return {
+        "success": is_success,
+        "data": data if is_success else None,
+        "errors": data if not is_success else None,
+        "status": status_code,
+    }
+
+
+class EnvelopeJSONRenderer(FastJSONRenderer):
+    """
+    Wraps dict responses in the API's {"success", "data", "errors", "status"}
+    envelope while rendering, so each body is encoded exactly once.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get("response")
+        request = renderer_context.get("request")
+        if (
+            response is not None
+            and isinstance(data, dict)
+            and not (request is not None and _excluded_paths.search(request.path))
+        ):
+            data = envelope(data, response.status_code)
+        return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,305 @@
+"""
+The rooms a WebSocket connection can join. ChatConsumer and GroupChatConsumer
+serve one room per socket and StreamConsumer multiplexes any number of them
+over one socket; all three authorize, post and mark read through these
+classes, so every endpoint behaves the same way.
+
+Each event a room sends to its channel-layer group carries the room's name
+under "room" next to the pre-encoded "text", so a multiplexed connection can
+tell which room a frame came from without decoding it. Message events also
+carry the message's "id", which the connection's outbox records as the point
+to resume from (see chat/outbox.py).
+
+Events sent while a socket is down are lost, so a reconnecting client passes
+the last message id it saw and gets what it missed in one frame,
+
+    {"type": "sync", "messages": [<message frames, oldest first>], "more": false}
+
+in the order of the history endpoints' ?after=<id> pages: a primary-key
+lookup of the anchor's created_at, then one (created_at, id) range scan on
+message_conversation_idx or groupmsg_group_created_idx, read in index order.
+At most
+WS_SYNC_MAX_MESSAGES are sent; "more" means the client should continue from
+the history endpoint with ?after=<last id>. The connection is already
+subscribed when the query runs, so a message can arrive both live and in the
+batch, never in neither; clients drop duplicates by id.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from prometheus_client import Counter
+
+from chat import inbox
+from chat.db import db_sync_to_async
+from chat.encoding import dumps_text
+from chat.models import Conversation, Friendship, Group, GroupMembership, GroupMessage, Message, newer_than
+from chat.persistence import group_message_buffer, message_buffer, write_behind_enabled
+from chat.utils import aget_friend_ids, aget_group_ids
+
+private_msg_counter = Counter("private_messages_total", "Total private messages")
+group_msg_counter = Counter("group_messages_total", "Total group messages")
+messages_sent = Counter("chat_messages_sent_total", "Total number of messages sent")
+
+# Authorization outcomes
+ALLOWED, MISSING, FORBIDDEN = "allowed", "missing", "forbidden"
+
+logger = logging.getLogger('chat')
+
+User = get_user_model()
+
+
+class RoomError(Exception):
+    """A frame the room refused; its message is sent back as {"error": ...}, with any `fields` alongside."""
+
+    def __init__(self, message, **fields):
+        super().__init__(message)
+        self.fields = fields
+
+
+def read_message_id(data, key="message_id"):
+    message_id = data.get(key)
+    if not isinstance(message_id, int) or isinstance(message_id, bool):
+        raise RoomError(f"'{key}' must be a message id.")
+    return message_id
+
+
+class Room:
+    def broadcast_on_commit(self, message):
+        """
+        `broadcast` for request handlers: sent once the current transaction
+        commits, and a channel-layer failure is logged rather than failing the
+        request, whose message is already stored.
+        """
+        def send():
+            try:
+                async_to_sync(self.broadcast)(get_channel_layer(), message)
+            except Exception:
+                logger.exception(f"[BROADCAST] Could not send message {message.id} to {self.name}")
+
+        transaction.on_commit(send)
+
+    async def sync(self, since):
+        """The {"type": "sync"} frame for messages after `since` (see the module docstring)."""
+        if write_behind_enabled():
+            await self.buffer().flush()  # messages this process has broadcast but not yet written
+        messages = self.messages()
+        anchor = await messages.filter(id=since).values_list("created_at", flat=True).afirst()
+        if anchor is None:
+            raise RoomError("'since' must be a message in this room.")
+        rows = (
+            messages
+            .filter(newer_than(anchor, since))
+            .order_by("created_at", "id")
+            .values_list(*self.frame_fields)
+        )
+        limit = settings.WS_SYNC_MAX_MESSAGES
+        frames = [self.message_frame(*row) async for row in rows[:limit + 1]]
+        return {"type": "sync", "messages": frames[:limit], "more": len(frames) > limit}
+
+
+class DirectRoom(Room):
+    """A one-on-one chat between `user` and `friend_id`."""
+    missing_error = "The user you're trying to chat with does not exist."
+    forbidden_error = "You can only chat with users you're friends with."
+    buffer = staticmethod(message_buffer)
+    frame_fields = ("id", "sender__email", "receiver_id", "content", "message_type", "created_at")
+
+    def __init__(self, user, friend_id):
+        self.user = user
+        self.friend_id = friend_id
+
+    @property
+    def name(self):
+        return f"chat_{min(self.user.id, self.friend_id)}_{max(self.user.id, self.friend_id)}"
+
+    async def authorize(self):
+        """
+        Decide whether the user may chat with the friend: a cached friend set
+        when WS_AUTHZ_CACHE is on, otherwise (or on a negative cached answer)
+        a single query that checks both existence and friendship.
+        """
+        if settings.WS_AUTHZ_CACHE and self.user.is_authenticated and self.friend_id in await aget_friend_ids(self.user):
+            return ALLOWED
+        row = await (
+            User.objects
+            .filter(id=self.friend_id)
+            .annotate(is_friend=Exists(Friendship.objects.filter(user=self.user.pk, friend=OuterRef("pk"))))
+            .values_list("is_friend", flat=True)
+            .afirst()
+        )
+        if row is None:
+            return MISSING
+        return ALLOWED if row else FORBIDDEN
+
+    async def post(self, channel_layer, data):
+        if "content" not in data:
+            logger.warning(f"[KEY ERROR] Message payload missing 'content' by {self.user}")
+            raise RoomError("Missing 'content' in message payload.")
+        content = data["content"]
+        message = Message(
+            sender=self.user, receiver_id=self.friend_id, content=content,
+            message_type=data.get("message_type", "text"),
+        )
+        if write_behind_enabled():
+            await message_buffer().submit(message)
+        else:
+            await db_sync_to_async(self.save_message)(message)
+        logger.info(f"[MESSAGE SENT] {self.user} → {self.friend_id}: {content}")
+        await self.broadcast(channel_layer, message)
+        private_msg_counter.inc()
+        messages_sent.inc() # Promotheus
+
+    async def broadcast(self, channel_layer, message):
+        """Send a stored `message` to the room and the inbox deltas to both users."""
+        # Encoded once here; every recipient's consumer forwards the same text.
+        await channel_layer.group_send(self.name, {
+            "type": "chat_message",
+            "room": self.name,
+            "id": message.id,
+            "text": dumps_text(self.message_frame(
+                message.id, self.user.email, self.friend_id, message.content, message.message_type, message.created_at,
+            )),
+        })
+        await inbox.publish(channel_layer, self.name, (self.user.id, self.friend_id), inbox.direct_delta(message))
+
+    @staticmethod
+    def message_frame(message_id, sender_email, receiver_id, content, message_type, created_at):
+        return {
+            "id": message_id,
+            "sender": sender_email,
+            "receiver": receiver_id,
+            "content": content,
+            "message_type": message_type,
+            "created_at": str(created_at),
+        }
+
+    def messages(self):
+        # Both directions in one equality lookup on message_conversation_idx; ChatHistoryView pages this too.
+        user_low_id, user_high_id = Conversation.objects.ordered_pair(self.user.pk, self.friend_id)
+        return Message.objects.filter(user_low_id=user_low_id, user_high_id=user_high_id)
+
+    @staticmethod
+    def save_message(message):
+        # The conversation row is updated by a post_save signal in the same transaction.
+        with transaction.atomic():
+            message.save()
+        return message
+
+    async def mark_read(self, channel_layer, data):
+        """
+        Handle a {"type": "read", "message_id": <id>} frame: advance the user's
+        read watermark and send a read receipt to the room if it moved.
+        Returns None; the receipt reaches this connection through the room.
+        """
+        message_id = read_message_id(data)
+        if write_behind_enabled():
+            await self.buffer().flush()  # the message may not be written yet
+        updated = await db_sync_to_async(Conversation.objects.mark_read)(self.user, self.friend_id, message_id)
+        if updated:
+            await channel_layer.group_send(self.name, {
+                "type": "chat_read",
+                "room": self.name,
+                "text": dumps_text({"type": "read", "reader": self.user.id, "message_id": message_id}),
+            })
+
+
+class GroupRoom(Room):
+    """A group chat. `group_id` is kept as a string, as it arrives in the URL and has always appeared in frames."""
+    missing_error = "This group does not exist."
+    forbidden_error = "You are not a member of this group."
+    buffer = staticmethod(group_message_buffer)
+    frame_fields = ("id", "sender__email", "content", "message_type", "created_at")
+
+    def __init__(self, user, group_id):
+        self.user = user
+        self.group_id = str(group_id)
+
+    @property
+    def name(self):
+        return f"group_{self.group_id}"
+
+    async def authorize(self):
+        """Same contract as DirectRoom.authorize, for group membership."""
+        group_id = int(self.group_id)
+        if settings.WS_AUTHZ_CACHE and self.user.is_authenticated and group_id in await aget_group_ids(self.user):
+            return ALLOWED
+        row = await (
+            Group.objects
+            .filter(id=group_id)
+            .annotate(is_member=Exists(GroupMembership.objects.filter(group=OuterRef("pk"), user=self.user.pk)))
+            .values_list("is_member", flat=True)
+            .afirst()
+        )
+        if row is None:
+            return MISSING
+        return ALLOWED if row else FORBIDDEN
+
+    async def post(self, channel_layer, data):
+        content = data.get("content")
+        if not content:
+            raise RoomError("Message content is required.")
+        if len(content) > 1000:
+            raise RoomError("Message too long (max 1000 characters).")
+
+        msg = GroupMessage(
+            group_id=self.group_id, sender=self.user, content=content,
+            message_type=data.get("message_type", "text"),
+        )
+        if write_behind_enabled():
+            await group_message_buffer().submit(msg)
+        else:
+            await db_sync_to_async(self.save_message)(msg)
+        logger.info(f"[GROUP MESSAGE SENT] {self.user} → Group {self.group_id}: {content}")
+        await self.broadcast(channel_layer, msg)
+        group_msg_counter.inc()
+        messages_sent.inc() # Promotheus
+
+    async def broadcast(self, channel_layer, msg):
+        """Send a stored `msg` to the room and the inbox deltas to every member."""
+        await channel_layer.group_send(self.name, {
+            "type": "group_message",
+            "room": self.name,
+            "id": msg.id,
+            "text": dumps_text(self.message_frame(
+                msg.id, self.user.email, msg.content, msg.message_type, msg.created_at,
+            )),
+        })
+        members = GroupMembership.objects.filter(group_id=self.group_id).values_list("user_id", flat=True)
+        await inbox.publish(channel_layer, self.name, [user_id async for user_id in members], inbox.group_delta(msg))
+
+    def message_frame(self, message_id, sender_email, content, message_type, created_at):
+        return {
+            "id": message_id,
+            "sender": sender_email,
+            "group": self.group_id,
+            "content": content,
+            "message_type": message_type,
+            "created_at": str(created_at),
+        }
+
+    def messages(self):
+        return GroupMessage.objects.filter(group_id=self.group_id)
+
+    @staticmethod
+    def save_message(msg):
+        # Group.latest_message_id is advanced by a post_save signal in the same transaction.
+        with transaction.atomic():
+            msg.save()
+        return msg
+
+    async def mark_read(self, channel_layer, data):
+        """
+        Handle a {"type": "read", "message_id": <id>} frame: advance the user's
+        read watermark in this group. Returns the acknowledgement, which goes
+        to this connection only.
+        """
+        message_id = read_message_id(data)
+        if write_behind_enabled():
+            await self.buffer().flush()  # the message may not be written yet
+        await db_sync_to_async(GroupMembership.objects.mark_read)(self.group_id, self.user, message_id)
+        return {"type": "read", "group": self.group_id, "message_id": message_id}
@@ -1,8 +1,9 @@
 
 from django.urls import re_path
-from chat.consumers import ChatConsumer, GroupChatConsumer
+from chat.consumers import ChatConsumer, GroupChatConsumer, StreamConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<friend_id>\d+)/$", ChatConsumer.as_asgi()),
     re_path(r"ws/group/(?P<group_id>\d+)/$", GroupChatConsumer.as_asgi()),
+    re_path(r"ws/stream/$", StreamConsumer.as_asgi()),
 ]
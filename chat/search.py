@@ -0,0 +1,283 @@
+"""
+Search for users, groups and message content.
+
+A query matches a row when every word in it is the prefix of a word in one of
+the row's searchable fields, so "joh bra" finds "Johnny Bravo" while the user
+is still typing. Matches are ranked, best first:
+
+  3  the name field equals the query
+  2  the name field starts with the query
+  1  a word in the name field starts with the first query word
+  0  the match is only in the other fields
+
+Ties are broken by name, then primary key. At most CHAT_SEARCH["MAX_RESULTS"]
+matches are returned.
+
+CHAT_SEARCH["BACKEND"] picks the implementation ("auto": "postgres" on
+PostgreSQL, "memory" otherwise; see chat/stores.py):
+
+  "postgres"  word-start regex filters served by the pg_trgm GIN indexes from
+              migration 0011, ranked in SQL.
+  "memory"    a PrefixIndex per searchable model, built from the database on
+              first use and kept current by the post_save/post_delete signals.
+              Each process only sees its own writes.
+
+Message search (`match_content`) uses the same word-prefix matching against
+Message.content and GroupMessage.content. It runs in the database on an
+index maintained on every insert: a GIN index on to_tsvector('simple',
+content) on PostgreSQL, and FTS5 tables kept current by triggers on SQLite
+(migration 0012). Other databases fall back to icontains.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from chat.stores import Stores
+from chat.models import Group, UserProfile
+
+_word = re.compile(r"\w+")
+
+
+def words(text):
+    return _word.findall(text.lower()) if text else []
+
+
+class Searchable:
+    """A model's searchable fields; `name` is the field used for ranking and ordering."""
+
+    def __init__(self, model, name, fields):
+        self.model = model
+        self.name = name
+        self.fields = fields
+
+
+USERS = Searchable(UserProfile, "username", ("username", "full_name"))
+GROUPS = Searchable(Group, "name", ("name", "description"))
+SEARCHABLES = (USERS, GROUPS)
+
+
+def rank(query, name, first_word):
+    """The rank described in the module docstring, for a lowercased query and name."""
+    if name == query:
+        return 3
+    if name.startswith(query):
+        return 2
+    if any(word.startswith(first_word) for word in words(name)):
+        return 1
+    return 0
+
+
+class PrefixIndex:
+    """
+    Sorted (term, key) pairs. A prefix lookup is a bisect to the first term
+    with that prefix followed by a scan over the matching entries.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.terms = {}
+
+    def build(self, items):
+        """Replace the contents with `items`, an iterable of (key, terms)."""
+        self.terms = {key: tuple(set(terms)) for key, terms in items}
+        self.entries = sorted((term, key) for key, terms in self.terms.items() for term in terms)
+
+    def add(self, key, terms):
+        self.remove(key)
+        self.terms[key] = tuple(set(terms))
+        for term in self.terms[key]:
+            insort(self.entries, (term, key))
+
+    def remove(self, key):
+        for term in self.terms.pop(key, ()):
+            i = bisect_left(self.entries, (term, key))
+            if i < len(self.entries) and self.entries[i] == (term, key):
+                del self.entries[i]
+
+    def prefix(self, prefix, limit=None):
+        """Keys with a term starting with `prefix`, in term order, at most `limit` of them."""
+        keys = []
+        i = bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and self.entries[i][0].startswith(prefix):
+            keys.append(self.entries[i][1])
+            if limit is not None and len(keys) >= limit:
+                break
+            i += 1
+        return keys
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, key):
+        return key in self.terms
+
+
+class PostgresSearchBackend:
+    def search(self, searchable, query, exclude=None):
+        query = query.strip().lower()
+        terms = words(query)
+        if not terms:
+            return []
+        queryset = searchable.model.objects.all()
+        for term in terms:
+            pattern = r"\m" + re.escape(term)
+            queryset = queryset.filter(
+                Q(*(Q(**{f"{field}__iregex": pattern}) for field in searchable.fields), _connector=Q.OR)
+            )
+        if exclude:
+            queryset = queryset.exclude(**exclude)
+        name = searchable.name
+        queryset = queryset.annotate(search_rank=Case(
+            When(**{f"{name}__iexact": query}, then=Value(3)),
+            When(**{f"{name}__istartswith": query}, then=Value(2)),
+            When(**{f"{name}__iregex": r"\m" + re.escape(terms[0])}, then=Value(1)),
+            default=Value(0),
+        ))
+        ranked = queryset.order_by("-search_rank", Lower(name), "pk").values_list("pk", flat=True)
+        return list(ranked[:settings.CHAT_SEARCH["MAX_RESULTS"]])
+
+    def update(self, instance):
+        pass  # the GIN indexes are maintained by PostgreSQL
+
+    def delete(self, instance):
+        pass
+
+
+class MemorySearchBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.names = {}
+
+    def index_for(self, searchable):
+        model = searchable.model
+        if model not in self.indexes:
+            rows = model.objects.values_list("pk", searchable.name, *searchable.fields).iterator(chunk_size=10000)
+            names = {}
+            items = []
+            for pk, name, *fields in rows:
+                names[pk] = (name or "").lower()
+                items.append((pk, [word for field in fields for word in words(field)]))
+            index = PrefixIndex()
+            index.build(items)
+            self.names[model], self.indexes[model] = names, index
+        return self.indexes[model]
+
+    def search(self, searchable, query, exclude=None):
+        query = query.strip().lower()
+        terms = words(query)
+        if not terms:
+            return []
+        with self.lock:
+            index = self.index_for(searchable)
+            names = self.names[searchable.model]
+            matches = None
+            for term in sorted(set(terms), key=len, reverse=True):  # longest terms match fewest rows
+                keys = set(index.prefix(term))
+                matches = keys if matches is None else matches & keys
+                if not matches:
+                    return []
+            best = heapq.nsmallest(
+                settings.CHAT_SEARCH["MAX_RESULTS"], matches,
+                key=lambda pk: (-rank(query, names[pk], terms[0]), names[pk], pk),
+            )
+        # Also drops rows this process never saw deleted (or rolled back).
+        existing = searchable.model.objects.filter(pk__in=best)
+        if exclude:
+            existing = existing.exclude(**exclude)
+        existing = set(existing.values_list("pk", flat=True))
+        return [pk for pk in best if pk in existing]
+
+    def update(self, instance):
+        searchable = searchable_for(instance)
+        with self.lock:
+            if searchable.model in self.indexes:
+                self.names[searchable.model][instance.pk] = (getattr(instance, searchable.name) or "").lower()
+                self.indexes[searchable.model].add(
+                    instance.pk, [word for field in searchable.fields for word in words(getattr(instance, field))]
+                )
+
+    def delete(self, instance):
+        searchable = searchable_for(instance)
+        with self.lock:
+            if searchable.model in self.indexes:
+                self.names[searchable.model].pop(instance.pk, None)
+                self.indexes[searchable.model].remove(instance.pk)
+
+
+def searchable_for(instance):
+    return next(searchable for searchable in SEARCHABLES if isinstance(instance, searchable.model))
+
+
+_backends = Stores(
+    "CHAT_SEARCH",
+    {"postgres": PostgresSearchBackend, "memory": MemorySearchBackend},
+    auto=lambda: "postgres" if connection.vendor == "postgresql" else "memory",
+)
+
+
+def search_backend():
+    return _backends.name()
+
+
+def get_search_backend():
+    return _backends.get()
+
+
+def in_order(queryset, pks):
+    """Filter `queryset` to `pks` and return the rows in that order."""
+    if not pks:
+        return queryset.none()
+    position = Case(*(When(pk=pk, then=Value(i)) for i, pk in enumerate(pks)))
+    return queryset.filter(pk__in=pks).order_by(position)
+
+
+SNIPPET_LENGTH = 160
+
+
+def match_content(queryset, query):
+    """Filter a Message or GroupMessage queryset to rows whose content matches `query`."""
+    terms = words(query)
+    if not terms:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    if connection.vendor == "postgresql":
+        return queryset.filter(RawSQL(
+            f'''to_tsvector('simple', "{table}"."content") @@ to_tsquery('simple', %s)''',
+            [" & ".join(f"{term}:*" for term in terms)],
+            output_field=BooleanField(),
+        ))
+    if connection.vendor == "sqlite":
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM "{table}_fts" WHERE "{table}_fts" MATCH %s',
+            [" ".join(f'"{term}"*' for term in terms)],
+        ))
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    return queryset
+
+
+def highlight(content, query, length=SNIPPET_LENGTH):
+    """
+    Return a window of `content` around the first match of `query`, and the
+    [start, end) offsets of the matching words within it. Offsets rather than
+    markup, so clients never render HTML built from message text.
+    """
+    terms = tuple(words(query))
+    matches = [m.span() for m in _word.finditer(content) if terms and m.group().lower().startswith(terms)]
+    start = 0
+    if matches and len(content) > length:
+        start = max(0, min(matches[0][0] - length // 4, len(content) - length))
+    end = min(len(content), start + length)
+    prefix = "\u2026" if start else ""
+    suffix = "\u2026" if end < len(content) else ""
+    shift = len(prefix) - start
+    spans = [[s + shift, e + shift] for s, e in matches if s >= start and e <= end]
+    return prefix + content[start:end] + suffix, spans
@@ -2,3 +2,4 @@ from .user_serializers import *
 from .friend_serializers import *
 from .message_serializers import *
 from .group_serializers import *
+from .row_serializers import *
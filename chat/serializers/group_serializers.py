@@ -11,6 +11,13 @@ class GroupSerializer(serializers.ModelSerializer):
         model = Group
         fields = ['id', 'name', 'description', 'creator', 'image_url', 'created_at', 'updated_at']
 
+class GroupListSerializer(GroupSerializer):
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta(GroupSerializer.Meta):
+        fields = GroupSerializer.Meta.fields + ['unread_count']
+
+
 class GroupMembershipSerializer(serializers.ModelSerializer):
     group = serializers.PrimaryKeyRelatedField(queryset=Group.objects.all())
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -18,3 +18,9 @@ class MessageSerializer(serializers.ModelSerializer):
     def get_receiver_username(self, obj):
         return obj.receiver.profile.username if hasattr(obj.receiver, "profile") else None
 
+
+class ChatInboxSerializer(MessageSerializer):
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['unread_count']
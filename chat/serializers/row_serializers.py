@@ -0,0 +1,89 @@
+"""
+Read-only serializers for hot list endpoints.
+
+Each one pulls just the columns it needs with `.values_list()` and builds the
+response dicts directly, skipping ModelSerializer's per-row field machinery.
+The output matches the ModelSerializer named in each class docstring; views
+opt in through `RowSerializerMixin.row_serializer_class`.
+
+Message rows lead with the message id, which MessagePagination reads from
+`row[0]` to build cursor links.
+"""
+from rest_framework import serializers
+
+__all__ = ["MessageRowSerializer", "GroupMessageRowSerializer", "UserSearchResultRowSerializer"]
+
+# Formats datetimes exactly like the ModelSerializers' DateTimeFields.
+_datetime_field = serializers.DateTimeField()
+
+
+class RowSerializer:
+    columns = ()
+
+    def __init__(self, rows, many=True):
+        self.rows = rows
+
+    @classmethod
+    def select(cls, queryset):
+        return queryset.values_list(*cls.columns)
+
+    @staticmethod
+    def to_representation(row):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in self.rows]
+
+
+class MessageRowSerializer(RowSerializer):
+    """Same output as MessageSerializer."""
+    columns = (
+        "id", "sender__email", "receiver_id", "receiver__profile__username",
+        "content", "message_type", "is_read", "created_at",
+    )
+
+    @staticmethod
+    def to_representation(row):
+        return {
+            "id": row[0],
+            "sender": row[1],
+            "receiver": row[2],
+            "receiver_username": row[3],
+            "content": row[4],
+            "message_type": row[5],
+            "is_read": row[6],
+            "created_at": _datetime_field.to_representation(row[7]),
+        }
+
+
+class GroupMessageRowSerializer(RowSerializer):
+    """Same output as GroupMessageSerializer."""
+    columns = ("id", "group_id", "sender__email", "content", "message_type", "is_read", "created_at")
+
+    @staticmethod
+    def to_representation(row):
+        return {
+            "id": row[0],
+            "group": row[1],
+            "sender": row[2],
+            "content": row[3],
+            "message_type": row[4],
+            "is_read": row[5],
+            "created_at": _datetime_field.to_representation(row[6]),
+        }
+
+
+class UserSearchResultRowSerializer(RowSerializer):
+    """Same output as UserSearchResultSerializer."""
+    columns = ("user_id", "username", "full_name", "avatar_url")
+
+    @staticmethod
+    def to_representation(row):
+        return {
+            "user_id": row[0],
+            "username": row[1],
+            "full_name": row[2],
+            "avatar_url": row[3],
+        }
@@ -1,9 +1,105 @@
-# # chat/signals.py
-# from django.db.models.signals import post_save
-# from django.dispatch import receiver
-# from chat.models import User, UserProfile
-
-# @receiver(post_save, sender=User)
-# def create_profile(sender, instance, created, **kwargs):
-#     if created:
-#         UserProfile.objects.create(user=instance)
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from chat.models import Conversation, FriendRequest, Friendship, Group, GroupMembership, GroupMessage, Message, User, UserProfile
+from chat import autocomplete
+from chat.search import get_search_backend
+from chat.utils import invalidate_friend_cache, invalidate_group_cache
+from djangochatapi.middlewares import auth_user_cache
+
+
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, **kwargs):
+    if created:
+        Conversation.objects.record_message(instance)
+
+
+@receiver(post_save, sender=GroupMessage)
+def update_group_latest_message(sender, instance, created, **kwargs):
+    if created:
+        Group.objects.record_messages([instance])
+
+
+@receiver(post_save, sender=FriendRequest)
+def sync_friendship_on_save(sender, instance, **kwargs):
+    if instance.status == 'accepted':
+        Friendship.objects.bulk_create(
+            [
+                Friendship(user_id=instance.from_user_id, friend_id=instance.to_user_id),
+                Friendship(user_id=instance.to_user_id, friend_id=instance.from_user_id),
+            ],
+            ignore_conflicts=True,
+        )
+    else:
+        remove_friendship(instance)
+    refresh_friend_cache(instance)
+
+
+@receiver(post_delete, sender=FriendRequest)
+def sync_friendship_on_delete(sender, instance, **kwargs):
+    remove_friendship(instance)
+    refresh_friend_cache(instance)
+
+
+@receiver(post_save, sender=GroupMembership)
+def start_membership_caught_up(sender, instance, created, **kwargs):
+    # New members should not see the whole existing history as unread.
+    if created:
+        GroupMembership.objects.mark_read(instance.group_id, instance.user_id)
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def refresh_group_cache(sender, instance, **kwargs):
+    user_id = instance.user_id
+    invalidate_group_cache(user_id)
+    transaction.on_commit(lambda: invalidate_group_cache(user_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_caches(sender, instance, created, **kwargs):
+    # Covers deactivation as well as any change to fields exposed over the socket.
+    auth_user_cache.invalidate(instance.pk)
+    if created:
+        # Ids can be handed out again after a rolled-back transaction (e.g. on SQLite),
+        # so never let a new user inherit another user's cached state.
+        invalidate_friend_cache(instance)
+        invalidate_group_cache(instance)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_caches_on_delete(sender, instance, **kwargs):
+    auth_user_cache.invalidate(instance.pk)
+    invalidate_friend_cache(instance)
+    invalidate_group_cache(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Group)
+def update_search_index(sender, instance, **kwargs):
+    get_search_backend().update(instance)
+    autocomplete.index_saved(instance)
+
+
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Group)
+def remove_from_search_index(sender, instance, **kwargs):
+    get_search_backend().delete(instance)
+    autocomplete.index_deleted(instance)
+
+
+def remove_friendship(friend_request):
+    pair = [friend_request.from_user_id, friend_request.to_user_id]
+    # A request the other way, or an older one, can still make them friends.
+    if FriendRequest.objects.filter(from_user_id__in=pair, to_user_id__in=pair, status='accepted').exists():
+        return
+    Friendship.objects.filter(user_id__in=pair, friend_id__in=pair).delete()
+
+
+def refresh_friend_cache(friend_request):
+    users = (friend_request.from_user_id, friend_request.to_user_id)
+    # Drop now for this request, and again after commit in case another request
+    # re-cached the old set before our transaction was visible.
+    invalidate_friend_cache(*users)
+    transaction.on_commit(lambda: invalidate_friend_cache(*users))
+
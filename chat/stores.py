@@ -0,0 +1,45 @@
+"""
+Pluggable stores for search, autocomplete, presence and rate limits.
+
+Each feature's setting (CHAT_SEARCH, CHAT_AUTOCOMPLETE, CHAT_PRESENCE,
+CHAT_RATE_LIMIT) names its store under "BACKEND". "auto" lets the feature
+choose from the environment: the Redis-backed store when the default cache is
+Redis, and the per-process one, meant for development and CI, otherwise. The
+settings and their defaults are in djangochatapi/settings.py.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from chat.redis_client import redis_cache_configured
+
+
+def redis_if_cached():
+    return "redis" if redis_cache_configured() else "local"
+
+
+class Stores:
+    """
+    The store `setting` names, one of `factories` or "auto", which resolves to
+    `auto()`. Each store is created once, on first use, and then shared.
+    """
+
+    def __init__(self, setting, factories, auto=redis_if_cached):
+        self.setting = setting
+        self.factories = factories
+        self.auto = auto
+        self.instances = {}
+
+    def name(self):
+        name = getattr(settings, self.setting)["BACKEND"]
+        if name == "auto":
+            return self.auto()
+        if name not in self.factories:
+            choices = ", ".join(("auto", *self.factories))
+            raise ImproperlyConfigured(f"{self.setting}['BACKEND'] must be one of {choices}, not {name!r}.")
+        return name
+
+    def get(self):
+        name = self.name()
+        if name not in self.instances:
+            self.instances[name] = self.factories[name]()
+        return self.instances[name]
@@ -1,9 +1,15 @@
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.testing import WebsocketCommunicator
+from django.urls import reverse
+from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
 from djangochatapi.asgi import application
 from django.contrib.auth import get_user_model
-from chat.models import FriendRequest
+from chat.models import Conversation, FriendRequest, Message
+from chat.persistence import WriteBehindBuffer, message_buffer
+from chat.rooms import ALLOWED, FORBIDDEN, MISSING, DirectRoom
+from chat.utils import get_friend_ids
 
 
 User = get_user_model()
@@ -110,3 +116,232 @@ async def test_missing_content_key_in_message():
     assert error["error"] == "Missing 'content' in message payload."
 
     await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_write_behind_mode_broadcasts_before_persisting(settings):
+    settings.CHAT_MESSAGE_PERSISTENCE = "write_behind"
+    settings.CHAT_WRITE_BEHIND = {"MAX_BATCH": 100, "MAX_DELAY": 60}
+
+    user1 = await User.objects.acreate(email="alice3@example.com", password="pass")
+    user2 = await User.objects.acreate(email="bob3@example.com", password="pass")
+    await FriendRequest.objects.acreate(from_user=user1, to_user=user2, status="accepted")
+    token = str(AccessToken.for_user(user1))
+
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{user2.id}/?token={token}")
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"content": "Buffered"})
+    response = await communicator.receive_json_from()
+    assert response["content"] == "Buffered"
+    assert not await Message.objects.filter(id=response["id"]).aexists()
+
+    await message_buffer().flush()
+    message = await Message.objects.aget(id=response["id"])
+    assert message.content == "Buffered"
+    conversation = await Conversation.objects.aget(user_low=user1, user_high=user2)
+    assert conversation.last_message_id == message.id
+    assert conversation.user_high_unread == 1
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_write_behind_id_blocks_from_two_processes_keep_send_order(settings):
+    settings.CHAT_WRITE_BEHIND = {**settings.CHAT_WRITE_BEHIND, "ID_BLOCK": 10, "MAX_DELAY": 60}
+    user1 = await User.objects.acreate(email="alice5@example.com", password="pass")
+    user2 = await User.objects.acreate(email="bob5@example.com", password="pass")
+    first_process = WriteBehindBuffer(Message, Conversation.objects.record_messages)
+    second_process = WriteBehindBuffer(Message, Conversation.objects.record_messages)
+
+    one = await first_process.submit(Message(sender=user2, receiver=user1, content="One"))
+    two = await second_process.submit(Message(sender=user2, receiver=user1, content="Two"))
+    three = await first_process.submit(Message(sender=user2, receiver=user1, content="Three"))
+    assert one.id < three.id < two.id
+    await second_process.flush()
+    await first_process.flush()
+
+    conversation = await Conversation.objects.aget(user_low=user1, user_high=user2)
+    assert conversation.last_message_id == three.id
+    assert conversation.user_low_unread == 3
+    await sync_to_async(Conversation.objects.mark_read)(user1, user2, two.id)
+    conversation = await Conversation.objects.aget(pk=conversation.pk)
+    assert conversation.user_low_unread == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_read_frame_advances_watermark_and_sends_receipt():
+    user1 = await User.objects.acreate(email="alice4@example.com", password="pass")
+    user2 = await User.objects.acreate(email="bob4@example.com", password="pass")
+    await FriendRequest.objects.acreate(from_user=user1, to_user=user2, status="accepted")
+    first = await Message.objects.acreate(sender=user2, receiver=user1, content="One")
+    await Message.objects.acreate(sender=user2, receiver=user1, content="Two")
+    token = str(AccessToken.for_user(user1))
+
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{user2.id}/?token={token}")
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"type": "read", "message_id": first.id})
+    receipt = await communicator.receive_json_from()
+    assert receipt == {"type": "read", "reader": user1.id, "message_id": first.id}
+    conversation = await Conversation.objects.aget(user_low=user1, user_high=user2)
+    assert conversation.user_low_last_read_id == first.id
+    assert conversation.user_low_unread == 1
+
+    # Re-reading the same message does not move the watermark, so no receipt.
+    await communicator.send_json_to({"type": "read", "message_id": first.id})
+    assert await communicator.receive_nothing()
+
+    await communicator.send_json_to({"type": "read", "message_id": "latest"})
+    error = await communicator.receive_json_from()
+    assert error["error"] == "'message_id' must be a message id."
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+def test_connect_authorization_is_a_single_query(settings, django_assert_num_queries):
+    settings.WS_AUTHZ_CACHE = False
+    user1 = User.objects.create(email="carol@example.com")
+    user2 = User.objects.create(email="dave@example.com")
+    stranger = User.objects.create(email="erin@example.com")
+    FriendRequest.objects.create(from_user=user1, to_user=user2, status="accepted")
+
+    with django_assert_num_queries(1):
+        assert async_to_sync(DirectRoom(user1, user2.id).authorize)() == ALLOWED
+    with django_assert_num_queries(1):
+        assert async_to_sync(DirectRoom(user1, stranger.id).authorize)() == FORBIDDEN
+    with django_assert_num_queries(1):
+        assert async_to_sync(DirectRoom(user1, 999999).authorize)() == MISSING
+
+
+@pytest.mark.django_db
+def test_connect_authorization_uses_cached_friend_set(settings, django_assert_num_queries):
+    settings.WS_AUTHZ_CACHE = True
+    user1 = User.objects.create(email="frank@example.com")
+    user2 = User.objects.create(email="grace@example.com")
+    FriendRequest.objects.create(from_user=user1, to_user=user2, status="accepted")
+    get_friend_ids(user1)
+
+    with django_assert_num_queries(0):
+        assert async_to_sync(DirectRoom(user1, user2.id).authorize)() == ALLOWED
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_presence_and_coalesced_typing_reach_the_friend(settings):
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local", "TYPING_WINDOW": 0.05}
+    alice = await User.objects.acreate(email="present-alice@example.com")
+    bob = await User.objects.acreate(email="present-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=alice, to_user=bob, status="accepted")
+
+    alice_ws = WebsocketCommunicator(application, f"/ws/chat/{bob.id}/?token={AccessToken.for_user(alice)}")
+    assert (await alice_ws.connect())[0]
+    bob_ws = WebsocketCommunicator(application, f"/ws/chat/{alice.id}/?token={AccessToken.for_user(bob)}")
+    assert (await bob_ws.connect())[0]
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "online"}
+
+    for _ in range(5):
+        await bob_ws.send_json_to({"type": "typing"})
+    await bob_ws.send_json_to({"type": "presence", "status": "away"})
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "away"}
+    # Five keystrokes, one event.
+    assert await alice_ws.receive_json_from() == {"type": "typing", "users": [{"id": bob.id, "typing": True}]}
+    assert await bob_ws.receive_json_from() == {"type": "typing", "users": [{"id": bob.id, "typing": True}]}
+
+    await bob_ws.send_json_to({"type": "heartbeat"})
+    await bob_ws.send_json_to({"type": "presence", "status": "busy"})
+    assert "error" in await bob_ws.receive_json_from()
+    assert await alice_ws.receive_nothing()
+
+    await bob_ws.disconnect()
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "offline"}
+    assert await alice_ws.receive_json_from() == {"type": "typing", "users": [{"id": bob.id, "typing": False}]}
+    assert await Message.objects.filter(sender__in=[alice, bob]).acount() == 0
+    await alice_ws.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_presence_is_sent_only_when_the_combined_status_changes(settings):
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    alice = await User.objects.acreate(email="tabs-alice@example.com")
+    bob = await User.objects.acreate(email="tabs-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=alice, to_user=bob, status="accepted")
+
+    alice_ws = WebsocketCommunicator(application, f"/ws/chat/{bob.id}/?token={AccessToken.for_user(alice)}")
+    assert (await alice_ws.connect())[0]
+    bob_tabs = [WebsocketCommunicator(application, f"/ws/chat/{alice.id}/?token={AccessToken.for_user(bob)}") for _ in range(2)]
+    assert (await bob_tabs[0].connect())[0]
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "online"}
+
+    # A second tab, and it going away, leave Bob online.
+    assert (await bob_tabs[1].connect())[0]
+    await bob_tabs[1].send_json_to({"type": "presence", "status": "away"})
+    assert await alice_ws.receive_nothing()
+
+    await bob_tabs[0].disconnect()
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "away"}
+    await bob_tabs[1].disconnect()
+    assert await alice_ws.receive_json_from() == {"type": "presence", "user": bob.id, "status": "offline"}
+    await alice_ws.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_reconnect_with_since_syncs_missed_messages(settings):
+    settings.WS_SYNC_MAX_MESSAGES = 2
+    user1 = await User.objects.acreate(email="sync-alice@example.com")
+    user2 = await User.objects.acreate(email="sync-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=user1, to_user=user2, status="accepted")
+    seen = await Message.objects.acreate(sender=user1, receiver=user2, content="Seen")
+    missed = [
+        await Message.objects.acreate(sender=user2, receiver=user1, content=f"Missed {n}") for n in range(3)
+    ]
+
+    token = AccessToken.for_user(user1)
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{user2.id}/?token={token}&since={seen.id}")
+    assert (await communicator.connect())[0]
+    sync = await communicator.receive_json_from()
+    assert sync["type"] == "sync"
+    assert [m["id"] for m in sync["messages"]] == [missed[0].id, missed[1].id]
+    assert sync["messages"][0] == {
+        "id": missed[0].id, "sender": user2.email, "receiver": user1.id, "content": "Missed 0",
+        "message_type": "text", "created_at": str(missed[0].created_at),
+    }
+    assert sync["more"] is True
+
+    await communicator.send_json_to({"type": "sync", "since": missed[1].id})
+    sync = await communicator.receive_json_from()
+    assert ([m["id"] for m in sync["messages"]], sync["more"]) == ([missed[2].id], False)
+
+    await communicator.send_json_to({"type": "sync", "since": 999999})
+    assert (await communicator.receive_json_from())["error"] == "'since' must be a message in this room."
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_rest_send_reaches_the_open_chat_socket(settings):
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    alice = await User.objects.acreate(email="rest-alice@example.com")
+    bob = await User.objects.acreate(email="rest-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=alice, to_user=bob, status="accepted")
+
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{alice.id}/?token={AccessToken.for_user(bob)}")
+    assert (await communicator.connect())[0]
+
+    client = APIClient()
+    client.force_authenticate(user=alice)
+    response = await sync_to_async(client.post)(reverse("send-message"), {"receiver": bob.id, "content": "Over REST"})
+    assert response.status_code == 201
+
+    frame = await communicator.receive_json_from()
+    assert (frame["id"], frame["sender"], frame["content"]) == (response.json()["data"]["id"], alice.email, "Over REST")
+    assert await communicator.receive_nothing()  # the inbox delta is skipped, the room already has the message
+    await communicator.disconnect()
@@ -1,8 +1,16 @@
+import asyncio
+from unittest import mock
+
 import pytest
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from channels.testing import WebsocketCommunicator
 from rest_framework_simplejwt.tokens import AccessToken
 from djangochatapi.asgi import application
-from chat.models import Group, GroupMembership
+from channels.layers import InMemoryChannelLayer
+from chat.fanout import LocalRooms
+from chat.models import Group, GroupMembership, GroupMessage
+from chat.rooms import ALLOWED, FORBIDDEN, MISSING, GroupRoom
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -33,3 +41,150 @@ async def test_group_websocket_connection():
     assert response["sender"] == user.email
 
     await communicator.disconnect()
+
+
+@pytest.mark.django_db
+def test_group_connect_authorization(settings, django_assert_num_queries):
+    settings.WS_AUTHZ_CACHE = True
+    member = User.objects.create(email="member@example.com")
+    outsider = User.objects.create(email="outsider@example.com")
+    group = Group.objects.create(name="Auth Group", creator=member)
+    GroupMembership.objects.create(user=member, group=group)
+
+    with django_assert_num_queries(1):
+        assert async_to_sync(GroupRoom(member, group.id).authorize)() == ALLOWED
+    with django_assert_num_queries(0):
+        assert async_to_sync(GroupRoom(member, group.id).authorize)() == ALLOWED
+
+    assert async_to_sync(GroupRoom(outsider, group.id).authorize)() == FORBIDDEN
+    assert async_to_sync(GroupRoom(outsider, 999999).authorize)() == MISSING
+
+    GroupMembership.objects.create(user=outsider, group=group)
+    assert async_to_sync(GroupRoom(outsider, group.id).authorize)() == ALLOWED
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_group_read_frame_advances_watermark_and_acks():
+    user = await User.objects.acreate(email="reader@example.com")
+    sender = await User.objects.acreate(email="sender@example.com")
+    group = await Group.objects.acreate(name="Read Group", creator=sender)
+    await GroupMembership.objects.acreate(user=user, group=group)
+    message = await GroupMessage.objects.acreate(group=group, sender=sender, content="Unread")
+
+    token = str(AccessToken.for_user(user))
+    communicator = WebsocketCommunicator(application, f"/ws/group/{group.id}/?token={token}")
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"type": "read", "message_id": message.id})
+    response = await communicator.receive_json_from()
+    assert response == {"type": "read", "group": str(group.id), "message_id": message.id}
+    membership = await GroupMembership.objects.aget(user=user, group=group)
+    assert membership.last_read_message_id == message.id
+
+    await communicator.send_json_to({"type": "read", "message_id": "latest"})
+    assert "error" in await communicator.receive_json_from()
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_group_reconnect_with_since_syncs_missed_messages():
+    user = await User.objects.acreate(email="group-sync@example.com")
+    group = await Group.objects.acreate(name="Sync Group", creator=user)
+    await GroupMembership.objects.acreate(user=user, group=group)
+    seen = await GroupMessage.objects.acreate(group=group, sender=user, content="Seen")
+    missed = await GroupMessage.objects.acreate(group=group, sender=user, content="Missed")
+
+    token = str(AccessToken.for_user(user))
+    communicator = WebsocketCommunicator(application, f"/ws/group/{group.id}/?token={token}&since={seen.id}")
+    assert (await communicator.connect())[0]
+    sync = await communicator.receive_json_from()
+    assert sync["more"] is False
+    assert [(m["id"], m["group"], m["content"]) for m in sync["messages"]] == [(missed.id, str(group.id), "Missed")]
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_local_fanout_joins_the_room_once_per_worker(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    settings.WS_LOCAL_FANOUT = True
+    users = [await User.objects.acreate(email=f"fanout{n}@example.com") for n in range(3)]
+    group = await Group.objects.acreate(name="Fanout Group", creator=users[0])
+    for user in users:
+        await GroupMembership.objects.acreate(user=user, group=group)
+
+    sockets = []
+    for user in users:
+        communicator = WebsocketCommunicator(application, f"/ws/group/{group.id}/?token={AccessToken.for_user(user)}")
+        assert (await communicator.connect())[0]
+        sockets.append(communicator)
+    layer = get_channel_layer()
+    assert len(layer.groups[f"group_{group.id}"]) == 1
+
+    await sockets[0].send_json_to({"content": "Hello everyone"})
+    for communicator in sockets:
+        frame = await communicator.receive_json_from()
+        while frame.get("type") == "presence":
+            frame = await communicator.receive_json_from()
+        assert frame["content"] == "Hello everyone"
+
+    await sockets[0].disconnect()
+    assert len(layer.groups[f"group_{group.id}"]) == 1
+    for communicator in sockets[1:]:
+        await communicator.disconnect()
+    assert f"group_{group.id}" not in layer.groups
+
+
+class Listener:
+    user = "listener"
+
+    def __init__(self):
+        self.events = []
+
+    async def chat_message(self, event):
+        self.events.append(event)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_group_post_saves_the_message_and_latest_message_together():
+    user = await User.objects.acreate(email="group-atomic@example.com")
+    group = await Group.objects.acreate(name="Atomic Group", creator=user)
+    room = GroupRoom(user, group.id)
+    with mock.patch.object(Group.objects, "record_messages", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            await room.post(InMemoryChannelLayer(), {"content": "Lost"})
+    assert not await GroupMessage.objects.filter(group=group).aexists()
+
+
+@pytest.mark.asyncio
+async def test_local_fanout_keeps_listening_after_a_receive_failure():
+    layer = InMemoryChannelLayer()
+    rooms = LocalRooms(layer)
+    rooms.retry_delay = 0
+    consumer = Listener()
+    receive = layer.receive
+    failures = [ConnectionError("Redis went away")]
+
+    async def flaky_receive(channel):
+        if failures:
+            raise failures.pop()
+        return await receive(channel)
+
+    with mock.patch.object(layer, "receive", flaky_receive):
+        await rooms.join("group_1", consumer)
+        await layer.group_send("group_1", {"type": "chat.message", "room": "group_1", "content": "After"})
+        for _ in range(100):
+            if consumer.events:
+                break
+            await asyncio.sleep(0.01)
+    assert not failures
+    assert [event["content"] for event in consumer.events] == ["After"]
+    await rooms.leave("group_1", consumer)
+    for task in rooms.tasks:
+        task.cancel()
@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+
+import pytest
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from djangochatapi.asgi import application
+from django.contrib.auth import get_user_model
+from chat.layers import RedisStreamsChannelLayer
+from chat.models import Group, GroupMembership
+
+User = get_user_model()
+
+
+def workers(count):
+    """Layers sharing one fake Redis, as separate worker processes would share a server."""
+    prefix = f"test:{uuid.uuid4().hex}"
+    return [RedisStreamsChannelLayer(url="fakeredis://", prefix=prefix, block=10) for _ in range(count)]
+
+
+async def receive(layer, channel):
+    return await asyncio.wait_for(layer.receive(channel), timeout=2)
+
+
+@pytest.mark.asyncio
+async def test_group_send_is_written_once_and_read_by_every_worker():
+    first, second = workers(2)
+    channels = [await first.new_channel(), await first.new_channel(), await second.new_channel()]
+    await first.group_add("room", channels[0])
+    await first.group_add("room", channels[1])
+    await second.group_add("room", channels[2])
+
+    for n in range(3):
+        await second.group_send("room", {"type": "chat.message", "n": n})
+
+    assert await first.redis.xlen(first.group_key("room")) == 3
+    for layer, channel in zip((first, first, second), channels):
+        assert [(await receive(layer, channel))["n"] for _ in range(3)] == [0, 1, 2]
+    await first.flush()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_group_membership_bounds_delivery():
+    first, second = workers(2)
+    channel = await first.new_channel()
+    await second.group_send("room", {"type": "chat.message", "n": "before"})
+    await first.group_add("room", channel)
+    await second.group_send("room", {"type": "chat.message", "n": "member"})
+    assert (await receive(first, channel))["n"] == "member"
+
+    await first.group_discard("room", channel)
+    await second.group_send("room", {"type": "chat.message", "n": "after"})
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(first.receive(channel), timeout=0.2)
+    await first.flush()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_send_reaches_a_channel_on_another_worker():
+    first, second = workers(2)
+    channel = await first.new_channel()
+    await second.send(channel, {"type": "chat.message", "n": 1})
+    assert await receive(first, channel) == {"type": "chat.message", "n": 1}
+    await first.flush()
+    await second.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_group_consumer_runs_on_streams_layer(settings):
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chat.layers.RedisStreamsChannelLayer",
+            "CONFIG": {"url": "fakeredis://", "prefix": f"test:{uuid.uuid4().hex}", "block": 10},
+        },
+    }
+    user = await User.objects.acreate(email="streams-member@example.com")
+    group = await Group.objects.acreate(name="Streams Group", creator=user)
+    await GroupMembership.objects.acreate(user=user, group=group)
+
+    communicator = WebsocketCommunicator(application, f"/ws/group/{group.id}/?token={AccessToken.for_user(user)}")
+    assert (await communicator.connect())[0]
+    await communicator.send_json_to({"content": "Over streams"})
+    response = await communicator.receive_json_from(timeout=2)
+    assert response["content"] == "Over streams"
+    await communicator.disconnect()
+    await get_channel_layer().flush()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+from prometheus_client import REGISTRY
+from chat.consumers import ChatConsumer, StreamConsumer
+from chat.outbox import Outbox
+
+
+class SlowClient:
+    """Stands in for a socket: send blocks until the test opens the gate."""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+        self.gate = asyncio.Event()
+
+    async def send(self, text_data):
+        await self.gate.wait()
+        self.frames.append(json.loads(text_data))
+
+    async def close(self, code):
+        self.closed = code
+
+
+def dropped(outcome):
+    return REGISTRY.get_sample_value("websocket_frames_dropped_total", {"outcome": outcome}) or 0
+
+
+async def drained(outbox, client):
+    client.gate.set()
+    await outbox.sender
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_the_newest_frames(settings):
+    settings.WS_OUTBOX = {"SIZE": 2, "POLICY": "drop_oldest"}
+    client = SlowClient()
+    outbox = Outbox(client.send, client.close)
+    before = dropped("dropped")
+    for n in range(4):
+        outbox.put(json.dumps({"n": n}))
+    await drained(outbox, client)
+    assert client.frames == [{"n": 2}, {"n": 3}]
+    assert dropped("dropped") - before == 2
+    assert client.closed is None
+
+
+@pytest.mark.asyncio
+async def test_coalesce_replaces_superseded_state_frames(settings):
+    settings.WS_OUTBOX = {"SIZE": 10, "POLICY": "coalesce"}
+    client = SlowClient()
+    outbox = Outbox(client.send, client.close)
+    key = ("presence", "group_1", 7)
+    outbox.put(json.dumps({"type": "presence", "status": "online"}), key=key)
+    outbox.put(json.dumps({"content": "hi"}), "group_1", 1)
+    outbox.put(json.dumps({"type": "presence", "status": "away"}), key=key)
+    await drained(outbox, client)
+    assert client.frames == [{"type": "presence", "status": "away"}, {"content": "hi"}]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_sends_resume_ids_and_closes(settings):
+    settings.WS_OUTBOX = {"SIZE": 2, "POLICY": "disconnect"}
+    client = SlowClient()
+    outbox = Outbox(client.send, client.close)
+    outbox.put(json.dumps({"id": 1}), "group_1", 1)
+    await drained(outbox, client)
+    client.gate.clear()
+
+    before = dropped("disconnected")
+    for message_id in (2, 3, 4):
+        outbox.put(json.dumps({"id": message_id}), "group_1", message_id)
+    outbox.put(json.dumps({"id": 5}), "group_1", 5)  # ignored once the connection is closing
+    await drained(outbox, client)
+    assert client.frames[1:] == [{
+        "type": "overflow",
+        "error": "Connection too slow; reconnect with 'since' from 'resume'.",
+        "resume": {"group_1": 1},
+    }]
+    assert dropped("disconnected") - before == 2
+    assert client.closed == 4008
+
+
+def typing(*users):
+    return {"type": "typing", "users": [{"id": user_id, "typing": state} for user_id, state in users]}
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_typing_batches_per_user(settings):
+    settings.WS_OUTBOX = {"SIZE": 10, "POLICY": "coalesce"}
+    client = SlowClient()
+    consumer = StreamConsumer()
+    consumer.rooms = {"group_1": None}
+    consumer.outbox = Outbox(client.send, client.close)
+    for users in (((1, True), (2, True)), ((1, False),)):
+        await consumer.typing_update({"type": "typing_update", "room": "group_1", "text": json.dumps(typing(*users))})
+    await drained(consumer.outbox, client)
+    assert client.frames == [{"room": "group_1", "data": typing((1, False), (2, True))}]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_never_merges_inbox_deltas(settings):
+    settings.WS_OUTBOX = {"SIZE": 10, "POLICY": "coalesce"}
+    client = SlowClient()
+    consumer = ChatConsumer()
+    consumer.room_name = "chat_1_2"
+    consumer.outbox = Outbox(client.send, client.close)
+    for message_id in (41, 42):
+        await consumer.inbox_update({
+            "type": "inbox_update", "room": "user_1", "conversation": "group_3",
+            "text": json.dumps({"type": "inbox", "id": message_id}),
+        })
+    await drained(consumer.outbox, client)
+    assert [frame["id"] for frame in client.frames] == [41, 42]
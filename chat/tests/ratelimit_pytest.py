@@ -0,0 +1,59 @@
+from unittest import mock
+
+import fakeredis
+import pytest
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from djangochatapi.asgi import application
+from django.contrib.auth import get_user_model
+from chat.models import FriendRequest, Message
+from chat.ratelimit import RedisLimiter
+
+User = get_user_model()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_websocket_frames_are_rate_limited(settings):
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    settings.CHAT_RATE_LIMIT = {
+        "BACKEND": "local",
+        "USER": {"ws_chat:message": "1/min"},
+        "CONNECTION": {"typing": "1/min"},
+    }
+    alice = await User.objects.acreate(email="limited-alice@example.com")
+    bob = await User.objects.acreate(email="limited-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=alice, to_user=bob, status="accepted")
+
+    with mock.patch.dict("chat.ratelimit._limiters.instances", clear=True):
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{bob.id}/?token={AccessToken.for_user(alice)}")
+        assert (await communicator.connect())[0]
+        await communicator.send_json_to({"content": "First"})
+        assert (await communicator.receive_json_from())["content"] == "First"
+        await communicator.send_json_to({"content": "Second"})
+        error = await communicator.receive_json_from()
+        assert (error["error"], error["code"], error["scope"]) == ("Rate limit exceeded.", "rate_limited", "ws_chat:message")
+        assert 59 < error["retry_after"] <= 60
+
+        await communicator.send_json_to({"type": "typing"})
+        await communicator.send_json_to({"type": "typing", "typing": False})
+        assert (await communicator.receive_json_from())["scope"] == "typing"
+        await communicator.disconnect()
+    assert await Message.objects.filter(sender=alice).acount() == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_limiter_is_shared_between_workers():
+    server = fakeredis.FakeServer()
+    workers = [
+        RedisLimiter(client=fakeredis.FakeRedis(server=server), async_client=fakeredis.aioredis.FakeRedis(server=server))
+        for _ in range(2)
+    ]
+    assert workers[0].take("message:1", 2, 2 / 60) == 0
+    assert await workers[1].atake("message:1", 2, 2 / 60) == 0
+    assert 29 < await workers[0].atake("message:1", 2, 2 / 60) <= 30
+    assert workers[1].take("message:2", 2, 2 / 60) == 0  # another user's bucket
+
+    # The refused worker now answers from memory until the bucket refills.
+    with mock.patch.object(workers[0], "_async_client", None):
+        assert 29 < await workers[0].atake("message:1", 2, 2 / 60) <= 30
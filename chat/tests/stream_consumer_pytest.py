@@ -0,0 +1,92 @@
+import pytest
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from djangochatapi.asgi import application
+from django.contrib.auth import get_user_model
+from chat.models import FriendRequest, Group, GroupMembership, GroupMessage, Message
+
+
+User = get_user_model()
+
+
+def stream_for(user):
+    return WebsocketCommunicator(application, f"/ws/stream/?token={AccessToken.for_user(user)}")
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_stream_multiplexes_direct_and_group_rooms(settings):
+    settings.CHAT_PRESENCE = {**settings.CHAT_PRESENCE, "BACKEND": "local"}
+    alice = await User.objects.acreate(email="stream-alice@example.com")
+    bob = await User.objects.acreate(email="stream-bob@example.com")
+    await FriendRequest.objects.acreate(from_user=alice, to_user=bob, status="accepted")
+    group = await Group.objects.acreate(name="Stream Group", creator=alice)
+    await GroupMembership.objects.acreate(user=alice, group=group)
+
+    stream = stream_for(alice)
+    assert (await stream.connect())[0]
+    chat_room = f"chat_{min(alice.id, bob.id)}_{max(alice.id, bob.id)}"
+    await stream.send_json_to({"type": "subscribe", "chat": bob.id})
+    assert await stream.receive_json_from() == {"type": "subscribed", "room": chat_room}
+    await stream.send_json_to({"type": "subscribe", "group": group.id})
+    assert await stream.receive_json_from() == {"type": "subscribed", "room": f"group_{group.id}"}
+
+    # Bob, on the single-room endpoint, sees Alice's presence and her message.
+    bob_ws = WebsocketCommunicator(application, f"/ws/chat/{alice.id}/?token={AccessToken.for_user(bob)}")
+    assert (await bob_ws.connect())[0]
+    assert await stream.receive_json_from() == {
+        "room": chat_room, "data": {"type": "presence", "user": bob.id, "status": "online"},
+    }
+    await stream.send_json_to({"room": chat_room, "content": "Hi Bob"})
+    frame = await stream.receive_json_from()
+    assert frame["room"] == chat_room
+    assert frame["data"]["content"] == "Hi Bob"
+    assert (await bob_ws.receive_json_from())["content"] == "Hi Bob"
+    assert await Message.objects.filter(sender=alice, receiver=bob).acount() == 1
+
+    await stream.send_json_to({"room": f"group_{group.id}", "content": "Hi group"})
+    frame = await stream.receive_json_from()
+    assert frame["room"] == f"group_{group.id}"
+    assert frame["data"]["group"] == str(group.id)
+    assert await GroupMessage.objects.filter(group=group).acount() == 1
+
+    await stream.send_json_to({"type": "unsubscribe", "room": chat_room})
+    assert await stream.receive_json_from() == {"type": "unsubscribed", "room": chat_room}
+    # The conversation now only reaches the stream as an inbox delta.
+    await bob_ws.send_json_to({"content": "Still there?"})
+    assert (await bob_ws.receive_json_from())["content"] == "Still there?"
+    frame = await stream.receive_json_from()
+    assert frame["room"] == f"user_{alice.id}"
+    assert frame["data"]["type"] == "inbox"
+    assert (frame["data"]["sender"], frame["data"]["preview"]) == (bob.id, "Still there?")
+
+    await stream.send_json_to({"room": chat_room, "content": "Gone"})
+    assert (await stream.receive_json_from())["error"] == f"Not subscribed to room {chat_room!r}."
+
+    await bob_ws.disconnect()
+    await stream.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_stream_subscribe_reuses_room_authorization():
+    user = await User.objects.acreate(email="stream-outsider@example.com")
+    stranger = await User.objects.acreate(email="stream-stranger@example.com")
+    group = await Group.objects.acreate(name="Closed Group", creator=stranger)
+
+    stream = stream_for(user)
+    assert (await stream.connect())[0]
+    await stream.send_json_to({"type": "subscribe", "chat": stranger.id})
+    assert (await stream.receive_json_from())["error"] == "You can only chat with users you're friends with."
+    await stream.send_json_to({"type": "subscribe", "group": group.id})
+    assert await stream.receive_json_from() == {
+        "error": "You are not a member of this group.", "room": f"group_{group.id}",
+    }
+    await stream.send_json_to({"type": "subscribe", "group": "all"})
+    assert (await stream.receive_json_from())["error"] == "'group' must be an id."
+    await stream.disconnect()
+
+    anonymous = WebsocketCommunicator(application, "/ws/stream/")
+    connected, close_code = await anonymous.connect()
+    assert not connected
+    assert close_code == 4003
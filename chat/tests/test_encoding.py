@@ -0,0 +1,59 @@
+import datetime
+import decimal
+import uuid
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from chat.encoding import dumps_text, loads
+from chat.renderers import EnvelopeJSONRenderer, FastJSONRenderer
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    data = {
+        "created_at": datetime.datetime(2025, 1, 2, 3, 4, 5, 600000, tzinfo=datetime.timezone.utc),
+        "date": datetime.date(2025, 1, 2),
+        "amount": decimal.Decimal("1.50"),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "content": "h\u00e9llo \u2028 w\u00f6rld \u2029",
+        "results": [{"id": 1, "is_read": False, "receiver": None}],
+    }
+
+    def test_output_matches_drf_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        for backend in ("orjson", "json"):
+            with self.subTest(backend=backend), override_settings(CHAT_JSON_BACKEND=backend):
+                self.assertEqual(FastJSONRenderer().render(self.data), expected)
+
+    def test_indented_output_uses_drf_path(self):
+        rendered = FastJSONRenderer().render({"a": 1}, "application/json; indent=2")
+        self.assertEqual(rendered, b'{\n  "a": 1\n}')
+
+    def test_frames_round_trip_on_both_backends(self):
+        frame = {"id": 7, "content": "héllo", "receiver": 3}
+        for backend in ("orjson", "json"):
+            with self.subTest(backend=backend), override_settings(CHAT_JSON_BACKEND=backend):
+                text = dumps_text(frame)
+                self.assertEqual(text, '{"id":7,"content":"héllo","receiver":3}')
+                self.assertEqual(loads(text), frame)
+
+
+class EnvelopeJSONRendererTests(SimpleTestCase):
+    def render(self, data, status_code=200, path="/api/messages/inbox/"):
+        context = {"request": RequestFactory().get(path), "response": Response(data, status=status_code)}
+        return loads(EnvelopeJSONRenderer().render(data, "application/json", context))
+
+    def test_success_is_wrapped(self):
+        self.assertEqual(
+            self.render({"results": []}),
+            {"success": True, "data": {"results": []}, "errors": None, "status": 200},
+        )
+
+    def test_errors_are_wrapped(self):
+        self.assertEqual(
+            self.render({"detail": "Not found."}, status_code=404),
+            {"success": False, "data": None, "errors": {"detail": "Not found."}, "status": 404},
+        )
+
+    def test_lists_and_excluded_paths_are_not_wrapped(self):
+        self.assertEqual(self.render([1, 2]), [1, 2])
+        self.assertEqual(self.render({"swagger": "2.0"}, path="/swagger/"), {"swagger": "2.0"})
@@ -1,8 +1,17 @@
+from unittest import mock
+import fakeredis
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from chat.models import FriendRequest, UserProfile
+from django.core.cache import cache
+from chat.models import FriendRequest, Friendship, UserProfile
+from chat.presence import LocalPresence, RedisPresence
+from chat.utils import are_friends, get_friend_ids
+from chat.tests.utils import QueryCountMixin, RowSerializerParityMixin
+from chat.views.friend_views import FriendListView, SearchUsersView
 
 User = get_user_model()
 
@@ -148,3 +157,131 @@ class UserSearchTests(APITestCase):
         json_response = response.json()
         self.assertEqual(json_response["status"], status.HTTP_400_BAD_REQUEST)
         self.assertIn("error", json_response["errors"])
+
+
+class FriendshipSyncTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(email="user1@example.com", password="pass1234")
+        self.user2 = User.objects.create_user(email="user2@example.com", password="pass1234")
+
+    def test_accepting_request_creates_both_edges(self):
+        fr = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        self.assertFalse(Friendship.objects.exists())
+
+        self.client.force_authenticate(user=self.user1)
+        self.client.post(reverse("accept-friend-request", args=[fr.id]))
+        self.assertTrue(Friendship.objects.filter(user=self.user1, friend=self.user2).exists())
+        self.assertTrue(Friendship.objects.filter(user=self.user2, friend=self.user1).exists())
+
+    def test_removing_friend_deletes_edges_and_cached_sets(self):
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        self.assertEqual(get_friend_ids(self.user1), {self.user2.id})
+        self.assertEqual(get_friend_ids(self.user2), {self.user1.id})
+
+        self.client.force_authenticate(user=self.user1)
+        self.client.post(reverse("remove-friend"), {"user_id": self.user2.id})
+        self.assertFalse(Friendship.objects.exists())
+        self.assertEqual(get_friend_ids(self.user1), set())
+        self.assertFalse(are_friends(self.user2, self.user1))
+
+    def test_reverse_request_keeps_accepted_friendship(self):
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        self.client.force_authenticate(user=self.user2)
+        response = self.client.post(reverse("send-friend-request"), {"to_user": self.user1.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(are_friends(self.user1, self.user2))
+
+        reverse_request = FriendRequest.objects.get(from_user=self.user2, to_user=self.user1)
+        self.client.force_authenticate(user=self.user1)
+        self.client.post(reverse("decline-friend-request", args=[reverse_request.id]))
+        self.assertTrue(are_friends(self.user1, self.user2))
+        reverse_request.delete()
+        self.assertEqual(Friendship.objects.count(), 2)
+        self.assertTrue(are_friends(self.user2, self.user1))
+
+    def test_cached_friend_check_skips_database(self):
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        get_friend_ids(self.user1)
+        with self.assertNumQueries(0):
+            self.assertTrue(are_friends(self.user1, self.user2))
+
+    def test_uncached_friend_check_is_a_single_query(self):
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        with self.assertNumQueries(1):
+            self.assertTrue(are_friends(self.user2, self.user1))
+
+
+class FriendListQueryCountTests(QueryCountMixin, RowSerializerParityMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@example.com")
+        UserProfile.objects.create(user=self.user, username="owner")
+        self.client.force_authenticate(user=self.user)
+        for i in range(10):
+            friend = User.objects.create(email=f"friend{i}@example.com")
+            UserProfile.objects.create(user=friend, username=f"friend{i}", full_name=f"Friend {i}")
+            FriendRequest.objects.create(from_user=self.user, to_user=friend, status="accepted")
+            requester = User.objects.create(email=f"requester{i}@example.com")
+            UserProfile.objects.create(user=requester, username=f"requester{i}")
+            FriendRequest.objects.create(from_user=requester, to_user=self.user, status="pending")
+
+    def test_friend_list(self):
+        self.assertConstantQueriesPerPage(reverse("friend-list"))
+
+    def test_pending_requests(self):
+        self.assertConstantQueriesPerPage(reverse("pending-friend-requests"))
+
+    def test_user_search(self):
+        self.assertConstantQueriesPerPage(reverse("user-search"), {"q": "friend"})
+
+    def test_row_serializer_output(self):
+        self.assertMatchesModelSerializer(FriendListView, reverse("friend-list"))
+        self.assertMatchesModelSerializer(SearchUsersView, reverse("user-search"), {"q": "friend"})
+
+
+class FriendPresenceTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@example.com")
+        self.friends = []
+        for i in range(3):
+            friend = User.objects.create(email=f"friend{i}@example.com")
+            UserProfile.objects.create(user=friend, username=f"friend{i}")
+            FriendRequest.objects.create(from_user=self.user, to_user=friend, status="accepted")
+            self.friends.append(friend)
+        self.presence = LocalPresence()
+        patcher = mock.patch("chat.views.friend_views.get_presence", return_value=self.presence)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(user=self.user)
+
+    def test_friend_list_includes_presence(self):
+        set_status = async_to_sync(self.presence.set)
+        set_status(self.friends[0].id, "tab-1", "away")
+        set_status(self.friends[0].id, "tab-2", "online")
+        set_status(self.friends[1].id, "tab-1", "away")
+
+        results = self.client.get(reverse("friend-list")).json()["data"]["results"]
+        self.assertEqual([friend["status"] for friend in results], ["online", "away", "offline"])
+
+        async_to_sync(self.presence.remove)(self.friends[0].id, "tab-2")
+        results = self.client.get(reverse("friend-list")).json()["data"]["results"]
+        self.assertEqual(results[0]["status"], "away")
+
+
+class RedisPresenceTests(SimpleTestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.presence = RedisPresence(fakeredis.FakeRedis(server=server), fakeredis.FakeAsyncRedis(server=server))
+
+    def test_connections_combine_and_expire(self):
+        set_status = async_to_sync(self.presence.set)
+        self.assertEqual(set_status(1, "tab-1", "away"), ("offline", "away"))
+        self.assertEqual(set_status(1, "tab-2", "online"), ("away", "online"))
+        self.assertEqual(set_status(2, "tab-1", "online"), ("offline", "online"))
+        self.assertEqual(self.presence.statuses([1, 2, 3]), {1: "online", 2: "online", 3: "offline"})
+
+        self.assertEqual(async_to_sync(self.presence.remove)(1, "tab-2"), ("online", "away"))
+        self.assertEqual(self.presence.client.ttl("chat:presence:1"), 60)
+        with mock.patch("chat.presence.time.time", return_value=10**10):
+            self.assertEqual(self.presence.statuses([1, 2]), {1: "offline", 2: "offline"})
+
@@ -1,12 +1,18 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
 from chat.models import Group, GroupMembership, GroupMessage
+from chat.encoding import loads
+from chat.tests.utils import ChannelLayerMixin, QueryCountMixin, RowSerializerParityMixin
+from chat.views.group_views import GroupMessagesView
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class GroupMessagingTests(APITestCase):
+class GroupMessagingTests(ChannelLayerMixin, APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(email="user1@example.com", password="pass1234")
         self.user2 = User.objects.create_user(email="user2@example.com", password="pass1234")
@@ -42,6 +48,17 @@ class GroupMessagingTests(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_send_group_message_publishes_inbox_delta_to_members(self):
+        GroupMembership.objects.create(group=self.group, user=self.user2)
+        receive = self.listen(f"user_{self.user2.id}")
+        self.client.force_authenticate(user=self.user1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("send-group-message"), {"group": self.group.id, "content": "Hello"})
+        event = receive()
+        self.assertEqual(event["conversation"], f"group_{self.group.id}")
+        delta = loads(event["text"])
+        self.assertEqual((delta["kind"], delta["group"], delta["preview"]), ("group", str(self.group.id), "Hello"))
+
     def test_send_group_message_as_non_member(self):
         self.client.force_authenticate(user=self.user2)
         url = reverse("send-group-message")
@@ -56,6 +73,54 @@ class GroupMessagingTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_view_group_messages_advances_read_watermark(self):
+        message = GroupMessage.objects.create(group=self.group, sender=self.user2, content="Msg")
+        self.client.force_authenticate(user=self.user1)
+        self.client.get(reverse("group-messages", kwargs={"group_id": self.group.id}))
+        membership = GroupMembership.objects.get(group=self.group, user=self.user1)
+        self.assertEqual(membership.last_read_message_id, message.id)
+        self.assertEqual(GroupMembership.objects.mark_read(self.group, self.user1), 0)
+
+    def test_group_watermarks_follow_send_order_not_ids(self):
+        # Write-behind id blocks can give a later message a lower id.
+        sent_at = timezone.now()
+        later = GroupMessage.objects.create(group=self.group, sender=self.user2, content="Later", created_at=sent_at + timedelta(seconds=1))
+        earlier = GroupMessage.objects.create(group=self.group, sender=self.user2, content="Earlier", created_at=sent_at)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).latest_message_id, later.id)
+
+        self.assertEqual(GroupMembership.objects.mark_read(self.group, self.user1, earlier.id), 1)
+        self.assertEqual(Group.objects.with_unread_counts(self.user1).get(pk=self.group.pk).unread_count, 1)
+        GroupMembership.objects.mark_read(self.group, self.user1)
+        self.assertEqual(Group.objects.with_unread_counts(self.user1).get(pk=self.group.pk).unread_count, 0)
+
+    def test_older_group_page_leaves_newer_messages_unread(self):
+        older = GroupMessage.objects.create(group=self.group, sender=self.user2, content="Older")
+        newer = GroupMessage.objects.create(group=self.group, sender=self.user2, content="Newer")
+        self.client.force_authenticate(user=self.user1)
+        self.client.get(reverse("group-messages", kwargs={"group_id": self.group.id}), {"before": newer.id})
+        membership = GroupMembership.objects.get(group=self.group, user=self.user1)
+        self.assertEqual(membership.last_read_message_id, older.id)
+
+    def test_group_list_reports_unread_counts(self):
+        other = Group.objects.create(name="Other Group", creator=self.user2)
+        GroupMembership.objects.create(group=other, user=self.user2)
+        GroupMessage.objects.create(group=other, sender=self.user2, content="Before joining")
+        GroupMembership.objects.create(group=other, user=self.user1)
+        first = GroupMessage.objects.create(group=self.group, sender=self.user1, content="Mine")
+        GroupMessage.objects.create(group=other, sender=self.user2, content="After joining")
+        GroupMessage.objects.create(group=other, sender=self.user2, content="Again")
+        self.assertEqual(Group.objects.get(pk=self.group.pk).latest_message_id, first.id)
+
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(reverse("group-list"))
+        unread = {group["id"]: group["unread_count"] for group in response.json()["data"]["results"]}
+        self.assertEqual(unread, {self.group.id: 1, other.id: 2})
+
+        GroupMembership.objects.mark_read(other, self.user1)
+        GroupMembership.objects.mark_read(self.group, self.user1)
+        response = self.client.get(reverse("group-list"))
+        self.assertEqual([group["unread_count"] for group in response.json()["data"]["results"]], [0, 0])
+
     def test_view_group_messages_as_non_member(self):
         url = reverse("group-messages", kwargs={"group_id": self.group.id})
         self.client.force_authenticate(user=self.user2)
@@ -75,3 +140,46 @@ class GroupMessagingTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertIn("results", response.json()['data'])
+
+    def test_view_group_messages_with_cursor(self):
+        messages = [
+            GroupMessage.objects.create(group=self.group, sender=self.user1, content=f"Msg {i}")
+            for i in range(12)
+        ]
+        url = reverse("group-messages", kwargs={"group_id": self.group.id})
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(url, {"before": messages[-1].id})
+        data = response.json()["data"]
+        self.assertEqual([m["id"] for m in data["results"]], [m.id for m in reversed(messages[1:11])])
+        self.assertIn(f"before={messages[1].id}", data["next"])
+
+
+class GroupListQueryCountTests(QueryCountMixin, RowSerializerParityMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@example.com")
+        self.client.force_authenticate(user=self.user)
+        for i in range(10):
+            creator = User.objects.create(email=f"creator{i}@example.com")
+            group = Group.objects.create(name=f"Group {i}", description="Study group", creator=creator)
+            GroupMembership.objects.create(group=group, user=self.user)
+            GroupMembership.objects.create(group=group, user=creator)
+            GroupMessage.objects.create(group=group, sender=creator, content=f"Welcome {i}")
+        self.group = group
+        for i in range(10):
+            sender = User.objects.create(email=f"sender{i}@example.com")
+            GroupMembership.objects.create(group=self.group, user=sender)
+            GroupMessage.objects.create(group=self.group, sender=sender, content=f"Message {i}")
+
+    def test_group_list(self):
+        self.assertConstantQueriesPerPage(reverse("group-list"))
+
+    def test_group_search(self):
+        self.assertConstantQueriesPerPage(reverse("search-group"), {"q": "group"})
+
+    def test_group_messages(self):
+        self.assertConstantQueriesPerPage(reverse("group-messages", kwargs={"group_id": self.group.id}))
+
+    def test_group_messages_row_serializer_output(self):
+        url = reverse("group-messages", kwargs={"group_id": self.group.id})
+        self.assertMatchesModelSerializer(GroupMessagesView, url)
+        self.assertMatchesModelSerializer(GroupMessagesView, url, {"mode": "cursor"})
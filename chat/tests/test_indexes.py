@@ -0,0 +1,109 @@
+import re
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from chat.models import FriendRequest, Group, GroupMembership, GroupMessage, Message
+from chat.rooms import DirectRoom, GroupRoom
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN regression tests: the hot chat queries must stay on their indexes
+    and be read in index order. The history tests explain the SQL the views
+    and rooms actually run, captured while serving them.
+    """
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(email="user1@example.com", password="testpass")
+        self.user2 = User.objects.create_user(email="user2@example.com", password="testpass")
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        self.group = Group.objects.create(name="Test Group", creator=self.user1)
+        GroupMembership.objects.create(group=self.group, user=self.user1)
+        self.messages = [
+            Message.objects.create(sender=sender, receiver=receiver, content=f"Message {n}")
+            for n, (sender, receiver) in enumerate([(self.user1, self.user2), (self.user2, self.user1)] * 3)
+        ]
+        self.group_messages = [
+            GroupMessage.objects.create(group=self.group, sender=self.user1, content=f"Group message {n}")
+            for n in range(6)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user1)
+        if connection.vendor == "postgresql":
+            # Tiny test tables would otherwise always be cheaper to scan.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(f"EXPLAIN {sql}")
+                return "\n".join(row[0] for row in cursor.fetchall())
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return "\n".join(row[-1] for row in cursor.fetchall())
+
+    def assertIndexOrdered(self, plan, index_name):
+        self.assertIn(index_name, plan, f"Expected {index_name} in query plan:\n{plan}")
+        # A full scan or a sort of the matching rows grows with the table.
+        unwanted = ("Seq Scan", "Sort") if connection.vendor == "postgresql" else ("SCAN ", "USE TEMP B-TREE")
+        for step in unwanted:
+            self.assertNotIn(step, plan, f"Unexpected {step!r} in query plan:\n{plan}")
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIndexOrdered(queryset.explain(), index_name)
+
+    def page_queries(self, serve):
+        """The SQL of the ordered message reads made by `serve()`, leaving out anchor lookups by id."""
+        with CaptureQueriesContext(connection) as queries:
+            serve()
+        found = [
+            query["sql"] for query in queries
+            if re.match(r'SELECT .* FROM "chat_(group)?message" .*ORDER BY', query["sql"])
+            and not re.search(r'"chat_(group)?message"\."id" = \d+\)', query["sql"])
+        ]
+        self.assertTrue(found, "No message page was read")
+        return found
+
+    def assertPagesIndexOrdered(self, serve, index_name):
+        for sql in self.page_queries(serve):
+            self.assertIndexOrdered(self.explain(sql), index_name)
+
+    def test_chat_history_pages_are_read_in_index_order(self):
+        url = reverse("chat-history", kwargs={"id": self.user2.id})
+        middle = self.messages[3].id
+        for params in ({"mode": "cursor"}, {"before": middle}, {"after": middle}):
+            with self.subTest(**params):
+                self.assertPagesIndexOrdered(lambda: self.client.get(url, params), "message_conversation_idx")
+
+    def test_group_history_pages_are_read_in_index_order(self):
+        url = reverse("group-messages", kwargs={"group_id": self.group.id})
+        middle = self.group_messages[3].id
+        for params in ({"mode": "cursor"}, {"before": middle}, {"after": middle}):
+            with self.subTest(**params):
+                self.assertPagesIndexOrdered(lambda: self.client.get(url, params), "groupmsg_group_created_idx")
+
+    def test_reconnect_sync_is_read_in_index_order(self):
+        rooms = (
+            (DirectRoom(self.user1, self.user2.id), self.messages[0].id, "message_conversation_idx"),
+            (GroupRoom(self.user1, self.group.id), self.group_messages[0].id, "groupmsg_group_created_idx"),
+        )
+        for room, since, index_name in rooms:
+            with self.subTest(room=room.name):
+                self.assertPagesIndexOrdered(lambda: async_to_sync(room.sync)(since), index_name)
+
+    def test_friend_lookups_use_accepted_indexes(self):
+        self.assertUsesIndex(
+            FriendRequest.objects.filter(from_user=self.user1, status="accepted"),
+            "friendreq_accepted_from_idx",
+        )
+        self.assertUsesIndex(
+            FriendRequest.objects.filter(to_user=self.user1, status="accepted"),
+            "friendreq_accepted_to_idx",
+        )
@@ -1,12 +1,23 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from chat.models import Message, FriendRequest
+from chat.models import Conversation, Message, FriendRequest, Group, GroupMembership, GroupMessage
+from chat.pagination import MessageSearchPagination
+from chat.models import UserProfile
+from chat.tests.utils import ChannelLayerMixin, QueryCountMixin, RowSerializerParityMixin
+from chat.views.message_views import ChatHistoryView
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from chat.encoding import loads
 
 User = get_user_model()
 
-class ChatAPITests(APITestCase):
+class ChatAPITests(ChannelLayerMixin, APITestCase):
     def setUp(self):
         # Create users
         self.user1 = User.objects.create_user(email="user1@example.com", password="testpass")
@@ -36,6 +47,41 @@ class ChatAPITests(APITestCase):
         self.assertEqual(json_response["status"], status.HTTP_201_CREATED)
         self.assertEqual(json_response["data"]["content"], "How are you?")
 
+    def test_send_message_publishes_inbox_delta_after_commit(self):
+        receive = self.listen(f"user_{self.user2.id}")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('send-message'), {"receiver": self.user2.id, "content": "x" * 150})
+        event = receive()
+        self.assertEqual(event["conversation"], f"chat_{self.user1.id}_{self.user2.id}")
+        delta = loads(event["text"])
+        self.assertEqual(delta["id"], response.json()["data"]["id"])
+        self.assertEqual(
+            (delta["kind"], delta["sender"], delta["receiver"], delta["preview"]),
+            ("direct", self.user1.id, self.user2.id, "x" * 100),
+        )
+
+    def test_send_message_succeeds_when_inbox_publish_fails(self):
+        with mock.patch("chat.rooms.get_channel_layer", side_effect=ConnectionError("layer down")):
+            with self.assertLogs("chat", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('send-message'), {"receiver": self.user2.id, "content": "Hi"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(CHAT_RATE_LIMIT={"BACKEND": "local", "USER": {"message": "2/min"}, "CONNECTION": {}})
+    def test_send_message_is_rate_limited_per_user(self):
+        url = reverse('send-message')
+        with mock.patch.dict("chat.ratelimit._limiters.instances", clear=True):
+            for _ in range(2):
+                self.assertEqual(self.client.post(url, {"receiver": self.user2.id, "content": "Again"}).status_code, 201)
+            response = self.client.post(url, {"receiver": self.user2.id, "content": "Again"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "30")
+        errors = response.json()["errors"]
+        self.assertEqual(
+            (errors["error"], errors["code"], errors["scope"]), ("Rate limit exceeded.", "rate_limited", "message")
+        )
+        self.assertAlmostEqual(errors["retry_after"], 30, delta=1)
+        self.assertEqual(Message.objects.filter(content="Again").count(), 2)
+
     def test_send_message_to_non_friend_should_fail(self):
         url = reverse('send-message')
         data = {
@@ -53,6 +99,111 @@ class ChatAPITests(APITestCase):
         self.assertEqual(json_response["status"], status.HTTP_200_OK)
         self.assertGreaterEqual(len(json_response["data"]["results"]), 1)
 
+    def test_inbox_has_one_entry_per_friend_with_unread_count(self):
+        user4 = User.objects.create_user(email="user4@example.com", password="testpass")
+        FriendRequest.objects.create(from_user=user4, to_user=self.user1, status="accepted")
+        latest = Message.objects.create(sender=user4, receiver=self.user1, content="Newest")
+        Message.objects.create(sender=self.user3, receiver=self.user1, content="Not a friend")
+
+        response = self.client.get(reverse('chat-inbox'))
+        results = response.json()["data"]["results"]
+        self.assertEqual([r["id"] for r in results], [latest.id, self.message2.id])
+        self.assertEqual([r["unread_count"] for r in results], [1, 1])
+
+    def test_chat_history_resets_unread_count(self):
+        self.client.get(reverse('chat-history', kwargs={"id": self.user2.id}))
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.unread_count_for(self.user1), 0)
+        self.assertEqual(conversation.unread_count_for(self.user2), 1)
+
+    def test_chat_history_advances_watermark_without_flipping_rows(self):
+        response = self.client.get(reverse('chat-history', kwargs={"id": self.user2.id}))
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_read_id_for(self.user1.id), self.message2.id)
+        self.assertEqual(conversation.last_read_id_for(self.user2.id), 0)
+        self.assertFalse(Message.objects.filter(is_read=True).exists())
+        read = {m["id"]: m["is_read"] for m in response.json()["data"]["results"]}
+        self.assertEqual(read, {self.message2.id: True, self.message1.id: False})
+
+    def test_older_history_page_leaves_newer_messages_unread(self):
+        newer = Message.objects.create(sender=self.user2, receiver=self.user1, content="Newer")
+        url = reverse('chat-history', kwargs={"id": self.user2.id})
+        response = self.client.get(url, {"before": newer.id})
+        self.assertEqual([m["id"] for m in response.json()["data"]["results"]], [self.message2.id, self.message1.id])
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_read_id_for(self.user1.id), self.message2.id)
+        self.assertEqual(conversation.unread_count_for(self.user1), 1)
+
+    def test_watermarks_follow_send_order_not_ids(self):
+        # Write-behind id blocks can give a later message a lower id.
+        sent_at = timezone.now()
+        later = Message.objects.create(sender=self.user2, receiver=self.user1, content="Later", created_at=sent_at + timedelta(seconds=1))
+        earlier = Message.objects.create(sender=self.user2, receiver=self.user1, content="Earlier", created_at=sent_at)
+        self.assertEqual(Conversation.objects.get(user_low=self.user1, user_high=self.user2).last_message_id, later.id)
+
+        self.assertEqual(Conversation.objects.mark_read(self.user1, self.user2, earlier.id), 1)
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.unread_count_for(self.user1), 1)
+        response = self.client.get(reverse('chat-inbox'))
+        self.assertFalse(response.json()["data"]["results"][0]["is_read"])
+
+    def test_message_landing_after_a_newer_one_was_read_is_not_unread(self):
+        sent_at = timezone.now()
+        newer = Message.objects.create(sender=self.user2, receiver=self.user1, content="Newer")
+        Conversation.objects.mark_read(self.user1, self.user2)
+        Message.objects.create(sender=self.user2, receiver=self.user1, content="Flushed late", created_at=sent_at)
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_message_id, newer.id)
+        self.assertEqual(conversation.unread_count_for(self.user1), 0)
+
+    def test_chat_history_marks_read_once(self):
+        url = reverse('chat-history', kwargs={"id": self.user2.id})
+        self.client.get(url)
+        self.assertEqual(Conversation.objects.mark_read(self.user1, self.user2), 0)
+
+    def test_mark_read_up_to_message_recounts_unread(self):
+        newer = Message.objects.create(sender=self.user2, receiver=self.user1, content="Newer")
+        Message.objects.create(sender=self.user2, receiver=self.user1, content="Newest")
+        self.assertEqual(Conversation.objects.mark_read(self.user1, self.user2, newer.id), 1)
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.unread_count_for(self.user1), 1)
+        # Watermarks never move backwards.
+        self.assertEqual(Conversation.objects.mark_read(self.user1, self.user2, self.message2.id), 0)
+
+    def test_inbox_is_read_follows_watermark(self):
+        self.client.force_authenticate(user=self.user2)
+        self.assertFalse(self.client.get(reverse('chat-inbox')).json()["data"]["results"][0]["is_read"])
+        self.client.force_authenticate(user=self.user1)
+        self.client.get(reverse('chat-history', kwargs={"id": self.user2.id}))
+        self.client.force_authenticate(user=self.user2)
+        self.assertTrue(self.client.get(reverse('chat-inbox')).json()["data"]["results"][0]["is_read"])
+
+    def test_backfill_keeps_watermarks_and_recounts_unread(self):
+        self.client.get(reverse('chat-history', kwargs={"id": self.user2.id}))
+        Message.objects.create(sender=self.user2, receiver=self.user1, content="After reading")
+        Conversation.objects.update(user_low_unread=99, user_high_unread=99)
+        call_command("backfill_conversations", stdout=StringIO())
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_read_id_for(self.user1.id), self.message2.id)
+        self.assertEqual(conversation.unread_count_for(self.user1), 1)
+        self.assertEqual(conversation.unread_count_for(self.user2), 1)
+
+    def test_backfill_conversations_rebuilds_rows(self):
+        Conversation.objects.all().delete()
+        call_command("backfill_conversations", stdout=StringIO())
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_message_id, self.message2.id)
+        self.assertEqual(conversation.user_low_unread, 1)
+        self.assertEqual(conversation.user_high_unread, 1)
+
+    def test_late_recorded_batch_keeps_newest_last_message(self):
+        # A write-behind flush can record an older message after a newer one.
+        Conversation.objects.record_messages([self.message1])
+        conversation = Conversation.objects.get(user_low=self.user1, user_high=self.user2)
+        self.assertEqual(conversation.last_message_id, self.message2.id)
+        self.assertEqual(conversation.last_activity_at, self.message2.created_at)
+        self.assertEqual(conversation.unread_count_for(self.user2), 2)
+
     def test_get_chat_inbox_with_no_messages_should_return_empty(self):
         # Clear messages
         Message.objects.all().delete()
@@ -60,4 +211,157 @@ class ChatAPITests(APITestCase):
         response = self.client.get(url)
         json_response = response.json()
         self.assertEqual(json_response["status"], status.HTTP_200_OK)
-        self.assertEqual(json_response["data"]["results"], [])
\ No newline at end of file
+        self.assertEqual(json_response["data"]["results"], [])
+
+class ChatHistoryCursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(email="user1@example.com", password="testpass")
+        self.user2 = User.objects.create_user(email="user2@example.com", password="testpass")
+        FriendRequest.objects.create(from_user=self.user1, to_user=self.user2, status="accepted")
+        self.messages = [
+            Message.objects.create(sender=self.user1, receiver=self.user2, content=f"msg {i}")
+            for i in range(25)
+        ]
+        self.client.force_authenticate(user=self.user1)
+        self.url = reverse('chat-history', kwargs={"id": self.user2.id})
+
+    def result_ids(self, response):
+        return [msg["id"] for msg in response.json()["data"]["results"]]
+
+    def test_cursor_mode_returns_latest_page_without_count(self):
+        response = self.client.get(self.url, {"mode": "cursor"})
+        data = response.json()["data"]
+        self.assertNotIn("count", data)
+        self.assertEqual(self.result_ids(response), [m.id for m in reversed(self.messages[-10:])])
+        self.assertIn(f"before={self.messages[-10].id}", data["next"])
+        self.assertIsNone(data["previous"])
+
+    def test_before_anchor_walks_back_to_oldest_message(self):
+        response = self.client.get(self.url, {"before": self.messages[5].id})
+        data = response.json()["data"]
+        self.assertEqual(self.result_ids(response), [m.id for m in reversed(self.messages[:5])])
+        self.assertIsNone(data["next"])
+        self.assertIn(f"after={self.messages[4].id}", data["previous"])
+
+    def test_after_anchor_returns_newer_messages_newest_first(self):
+        response = self.client.get(self.url, {"after": self.messages[2].id})
+        self.assertEqual(self.result_ids(response), [m.id for m in reversed(self.messages[3:13])])
+
+    def test_anchor_from_another_conversation_is_rejected(self):
+        user3 = User.objects.create_user(email="user3@example.com", password="testpass")
+        other = Message.objects.create(sender=self.user2, receiver=user3, content="elsewhere")
+        response = self.client.get(self.url, {"before": other.id})
+        self.assertEqual(response.json()["status"], status.HTTP_400_BAD_REQUEST)
+
+    def test_page_number_mode_is_still_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["data"]["count"], 25)
+
+
+class MessageSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="searcher@example.com")
+        self.friend = User.objects.create(email="friend@example.com")
+        self.stranger = User.objects.create(email="stranger@example.com")
+        self.group = Group.objects.create(name="Book Club", creator=self.friend)
+        GroupMembership.objects.create(group=self.group, user=self.user)
+        other_group = Group.objects.create(name="Private", creator=self.stranger)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("message-search")
+
+        Message.objects.create(sender=self.friend, receiver=self.stranger, content="pizza without me")
+        GroupMessage.objects.create(group=other_group, sender=self.stranger, content="pizza in private")
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_finds_word_prefixes_in_the_users_conversations_and_groups(self):
+        sent = Message.objects.create(sender=self.user, receiver=self.friend, content="Pizza tonight?")
+        received = Message.objects.create(sender=self.friend, receiver=self.user, content="pizzas are great")
+        posted = GroupMessage.objects.create(group=self.group, sender=self.friend, content="Bring PIZZA to the club")
+        Message.objects.create(sender=self.user, receiver=self.friend, content="spizza is not a word")
+
+        results = self.search(q="piz")["results"]
+        self.assertEqual(
+            [(r["type"], r["id"]) for r in results],
+            [("group", posted.id), ("direct", received.id), ("direct", sent.id)],
+        )
+        self.assertEqual(results[0]["group"], self.group.id)
+        self.assertEqual(results[1]["receiver"], self.user.id)
+        self.assertEqual([r["id"] for r in self.search(q="pizza club")["results"]], [posted.id])
+
+    def test_snippet_highlights_matching_words(self):
+        content = "filler " * 40 + "the meeting moved to Friday, meet at noon " + "filler " * 40
+        Message.objects.create(sender=self.friend, receiver=self.user, content=content)
+
+        result = self.search(q="meet")["results"][0]
+        snippet = result["snippet"]
+        self.assertTrue(snippet.startswith("\u2026") and snippet.endswith("\u2026"))
+        self.assertEqual([snippet[start:end] for start, end in result["highlights"]], ["meeting", "meet"])
+
+    def test_index_follows_edits_and_deletes(self):
+        message = Message.objects.create(sender=self.user, receiver=self.friend, content="draft")
+        message.content = "final version"
+        message.save()
+        self.assertEqual(self.search(q="draft")["results"], [])
+        self.assertEqual(len(self.search(q="final")["results"]), 1)
+        message.delete()
+        self.assertEqual(self.search(q="final")["results"], [])
+
+    def test_cursor_walks_merged_results_without_gaps(self):
+        now = timezone.now()
+        hits = []
+        for i in range(4):
+            created_at = now - timezone.timedelta(minutes=i // 2)  # pairs share a timestamp
+            message = Message.objects.create(sender=self.user, receiver=self.friend, content=f"topic {i}", created_at=created_at)
+            group_message = GroupMessage.objects.create(group=self.group, sender=self.friend, content=f"topic {i}")
+            GroupMessage.objects.filter(pk=group_message.pk).update(created_at=created_at)
+            hits += [(created_at, "direct", message.id), (created_at, "group", group_message.id)]
+
+        seen = []
+        with mock.patch.object(MessageSearchPagination, "page_size", 3):
+            data = self.search(q="topic")
+            while True:
+                seen += [(r["type"], r["id"]) for r in data["results"]]
+                if data["next"] is None:
+                    break
+                data = self.client.get(data["next"]).json()["data"]
+        self.assertEqual(seen, [(kind, pk) for _, kind, pk in sorted(hits, reverse=True)])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).json()["status"], status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"q": "pizza", "cursor": "nonsense"})
+        self.assertEqual(response.json()["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.search(q="!!")["results"], [])
+
+
+class MessageListQueryCountTests(QueryCountMixin, RowSerializerParityMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="owner@example.com")
+        self.client.force_authenticate(user=self.user)
+        self.friends = []
+        for i in range(10):
+            friend = User.objects.create(email=f"friend{i}@example.com")
+            UserProfile.objects.create(user=friend, username=f"friend{i}")
+            FriendRequest.objects.create(from_user=self.user, to_user=friend, status="accepted")
+            Message.objects.create(sender=friend, receiver=self.user, content=f"Hi from {i}")
+            Message.objects.create(sender=self.user, receiver=friend, content=f"Hi back {i}")
+            self.friends.append(friend)
+        for i in range(10):
+            Message.objects.create(sender=self.friends[0], receiver=self.user, content=f"More {i}")
+
+    def test_chat_history(self):
+        self.assertConstantQueriesPerPage(reverse("chat-history", kwargs={"id": self.friends[0].id}))
+
+    def test_chat_history_cursor_mode(self):
+        self.assertConstantQueriesPerPage(reverse("chat-history", kwargs={"id": self.friends[0].id}), {"mode": "cursor"})
+
+    def test_chat_inbox(self):
+        self.assertConstantQueriesPerPage(reverse("chat-inbox"))
+
+    def test_chat_history_row_serializer_output(self):
+        url = reverse("chat-history", kwargs={"id": self.friends[0].id})
+        self.assertMatchesModelSerializer(ChatHistoryView, url)
+        self.assertMatchesModelSerializer(ChatHistoryView, url, {"mode": "cursor"})
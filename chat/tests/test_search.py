@@ -0,0 +1,146 @@
+from unittest import mock
+import fakeredis
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from chat.autocomplete import LocalAutocomplete, RedisAutocomplete
+from chat.models import Group, User, UserProfile
+from chat.search import GROUPS, USERS, MemorySearchBackend, PrefixIndex, get_search_backend, search_backend
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def test_prefix_lookup_add_and_remove(self):
+        index = PrefixIndex()
+        index.build([(1, ["johnny", "bravo"]), (2, ["john", "smith"]), (3, ["jane"])])
+        self.assertEqual(sorted(index.prefix("joh")), [1, 2])
+        self.assertEqual(index.prefix("j", limit=2), [3, 2])
+
+        index.add(2, ["joan"])
+        self.assertEqual(index.prefix("joh"), [1])
+        self.assertEqual(index.prefix("jo"), [2, 1])
+
+        index.remove(1)
+        self.assertEqual(index.prefix("joh"), [])
+        self.assertNotIn(1, index)
+        self.assertEqual(len(index), 2)
+
+    def test_backend_setting_is_validated(self):
+        with override_settings(CHAT_SEARCH={**settings.CHAT_SEARCH, "BACKEND": "elastic"}):
+            with self.assertRaises(ImproperlyConfigured):
+                search_backend()
+        with override_settings(CHAT_SEARCH={**settings.CHAT_SEARCH, "BACKEND": "auto"}):
+            self.assertEqual(search_backend(), "memory")
+
+
+class MemorySearchBackendTests(TestCase):
+    def setUp(self):
+        self.backend = MemorySearchBackend()
+        self.profiles = {}
+        for username, full_name in [
+            ("john", "John Smith"),
+            ("johnny", "Johnny Bravo"),
+            ("big.john", "Big John"),
+            ("alice", "Alice Johnson"),
+            ("bob", "Bob Builder"),
+        ]:
+            user = User.objects.create(email=f"{username}@example.com")
+            self.profiles[username] = UserProfile.objects.create(user=user, username=username, full_name=full_name)
+
+    def search(self, query, **kwargs):
+        ids = self.backend.search(USERS, query, **kwargs)
+        usernames = dict(UserProfile.objects.filter(pk__in=ids).values_list("pk", "username"))
+        return [usernames[pk] for pk in ids]
+
+    def test_ranks_exact_then_prefix_then_word_then_other_fields(self):
+        self.assertEqual(self.search("john"), ["john", "johnny", "big.john", "alice"])
+
+    def test_every_query_word_must_match_a_word_prefix(self):
+        self.assertEqual(self.search("joh bra"), ["johnny"])
+        self.assertEqual(self.search("ohn"), [])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_exclude_and_result_cap(self):
+        self.assertEqual(self.search("john", exclude={"user__email": "john@example.com"})[0], "johnny")
+        with override_settings(CHAT_SEARCH={**settings.CHAT_SEARCH, "MAX_RESULTS": 2}):
+            self.assertEqual(self.search("john"), ["john", "johnny"])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search("bob")  # build the index
+        profile = self.profiles["bob"]
+        profile.full_name = "Roberta Johns"
+        self.backend.update(profile)
+        self.assertEqual(self.search("roberta"), ["bob"])
+        self.backend.delete(profile)
+        self.assertEqual(self.search("roberta"), [])
+
+    def test_signals_update_the_active_backend(self):
+        get_search_backend().search(GROUPS, "warmup")
+        group = Group.objects.create(name="Zebra Crossing", creator=self.profiles["bob"].user)
+        self.assertEqual(get_search_backend().search(GROUPS, "zeb cro"), [group.pk])
+        group.delete()
+        self.assertEqual(get_search_backend().search(GROUPS, "zeb"), [])
+
+
+class AutocompleteTests(APITestCase):
+    backend_class = LocalAutocomplete
+
+    def setUp(self):
+        self.user = User.objects.create(email="me@example.com")
+        UserProfile.objects.create(user=self.user, username="joe", full_name="Joe Self")
+        for username in ("Johnny", "jonas", "bob"):
+            user = User.objects.create(email=f"{username}@example.com")
+            UserProfile.objects.create(user=user, username=username, full_name=username.title())
+        Group.objects.create(name="Jogging Club", creator=self.user)
+        self.backend = self.make_backend()
+        patcher = mock.patch("chat.autocomplete.get_autocomplete", return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("autocomplete")
+
+    def make_backend(self):
+        return self.backend_class()
+
+    def complete(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_prefix_matches_in_name_order_without_the_caller(self):
+        data = self.complete(q="Jo")
+        self.assertEqual([user["username"] for user in data["users"]], ["Johnny", "jonas"])
+        self.assertEqual(data["groups"], [{"id": Group.objects.get().id, "name": "Jogging Club"}])
+        self.assertEqual(self.complete(q="joh", type="users", limit=1), {"users": [
+            {"user_id": User.objects.get(email="Johnny@example.com").id, "username": "Johnny", "full_name": "Johnny"},
+        ]})
+
+    def test_index_follows_committed_changes(self):
+        self.complete(q="x")  # build the index
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(username="bob")
+            profile.username = "jolene"
+            profile.save()
+            Group.objects.get().delete()
+        data = self.complete(q="jo")
+        self.assertEqual([user["username"] for user in data["users"]], ["Johnny", "jolene", "jonas"])
+        self.assertEqual(data["groups"], [])
+        self.assertEqual(self.complete(q="bob")["users"], [])
+
+    def test_bad_requests(self):
+        for params in ({}, {"q": "jo", "type": "messages"}, {"q": "jo", "limit": "ten"}, {"q": "jo", "limit": 0}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class RedisAutocompleteTests(AutocompleteTests):
+    def make_backend(self):
+        return RedisAutocomplete(fakeredis.FakeRedis())
+
+    def test_rebuild_swaps_in_a_fresh_index(self):
+        self.complete(q="x")
+        UserProfile.objects.filter(username="bob").update(username="jody")  # no signal
+        self.assertEqual(self.complete(q="jod")["users"], [])
+        self.backend.rebuild("users")
+        self.assertEqual([user["username"] for user in self.complete(q="jod")["users"]], ["jody"])
@@ -1,7 +1,12 @@
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.test import TestCase
+from djangochatapi.middlewares import AuthUserCache, JWTAuthMiddleware, auth_user_cache
 
 User = get_user_model()
 
@@ -100,3 +105,63 @@ class RegisterTests(APITestCase):
         self.client.post(self.register_url, self.user_data, format='json')
         response = self.client.post(self.login_url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AuthUserCacheTests(TestCase):
+    def setUp(self):
+        auth_user_cache.clear()
+        self.user = User.objects.create_user(email="cached@example.com", password="pass1234")
+
+    def test_lru_evicts_least_recently_used_entry(self):
+        user_cache = AuthUserCache(max_size=2, ttl=60, shared=False)
+        async_to_sync(user_cache.aset)(1, "a", "user-a", 0)
+        async_to_sync(user_cache.aset)(2, "b", "user-b", 0)
+        async_to_sync(user_cache.aget)(1, "a")
+        async_to_sync(user_cache.aset)(3, "c", "user-c", 0)
+        self.assertEqual(async_to_sync(user_cache.aget)(1, "a"), ("user-a", 0))
+        self.assertIsNone(async_to_sync(user_cache.aget)(2, "b")[0])
+
+    def test_entries_expire_after_ttl(self):
+        user_cache = AuthUserCache(max_size=10, ttl=0, shared=False)
+        async_to_sync(user_cache.aset)(1, "a", "user-a", 0)
+        self.assertIsNone(async_to_sync(user_cache.aget)(1, "a")[0])
+
+    def test_invalidation_reaches_other_workers(self):
+        # Two workers' caches over one shared cache.
+        worker_a, worker_b = (AuthUserCache(max_size=10, ttl=60, shared=True) for _ in range(2))
+        user, version = async_to_sync(worker_a.aget)(self.user.id, "jti")
+        async_to_sync(worker_a.aset)(self.user.id, "jti", self.user, version)
+        self.assertEqual(async_to_sync(worker_b.aget)(self.user.id, "jti")[0], self.user)
+
+        worker_b.invalidate(self.user.id)
+        self.assertIsNone(async_to_sync(worker_a.aget)(self.user.id, "jti")[0])
+        self.assertIsNone(async_to_sync(worker_b.aget)(self.user.id, "jti")[0])
+
+    def test_handshake_uses_cached_user(self):
+        token = AccessToken.for_user(self.user)
+        _, version = async_to_sync(auth_user_cache.aget)(self.user.id, token["jti"])
+        async_to_sync(auth_user_cache.aset)(self.user.id, token["jti"], self.user, version)
+        with self.assertNumQueries(0):
+            user = async_to_sync(JWTAuthMiddleware(None).get_user)(token)
+        self.assertEqual(user, self.user)
+
+    def test_handshake_loads_user_with_async_orm(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            user = async_to_sync(JWTAuthMiddleware(None).get_user)(token)
+        self.assertEqual(user, self.user)
+
+    def test_handshake_rejects_inactive_user(self):
+        token = AccessToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            async_to_sync(JWTAuthMiddleware(None).get_user_from_token)(token)
+
+    def test_deactivating_user_invalidates_cached_entries(self):
+        for jti in ("jti-1", "jti-2"):
+            async_to_sync(auth_user_cache.aset)(self.user.id, jti, self.user, 0)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(async_to_sync(auth_user_cache.aget)(self.user.id, "jti-1")[0])
+        self.assertIsNone(async_to_sync(auth_user_cache.aget)(self.user.id, "jti-2")[0])
@@ -0,0 +1,63 @@
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+
+
+class QueryCountMixin:
+    """
+    Guards list endpoints against N+1 regressions: the number of queries for a
+    page must not depend on how many rows the page holds.
+    """
+
+    def assertConstantQueriesPerPage(self, url, params=None, page_sizes=(1, 10)):
+        self.client.get(url, params)  # warm per-user caches so every run does the same work
+        counts = {}
+        for page_size in page_sizes:
+            with mock.patch.object(PageNumberPagination, "page_size", page_size):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(
+                len(response.json()["data"]["results"]), page_size,
+                f"Need at least {page_size} rows to compare page sizes",
+            )
+            counts[page_size] = queries
+        baseline = len(counts[page_sizes[0]])
+        for page_size, queries in counts.items():
+            self.assertEqual(
+                len(queries), baseline,
+                f"Page of {page_size} rows ran {len(queries)} queries, page of {page_sizes[0]} ran {baseline}:\n"
+                + "\n".join(query["sql"] for query in queries.captured_queries),
+            )
+
+
+class RowSerializerParityMixin:
+    """Checks that a view's row serializer returns exactly what its ModelSerializer would."""
+
+    def assertMatchesModelSerializer(self, view_class, url, params=None):
+        fast = self.client.get(url, params)
+        with mock.patch.object(view_class, "row_serializer_class", None):
+            model = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200, fast.content)
+        self.assertTrue(fast.json()["data"]["results"])
+        self.assertEqual(fast.json(), model.json())
+
+
+class ChannelLayerMixin:
+    """Runs the tests on an in-memory channel layer, with a way to read what was sent to a group."""
+
+    def setUp(self):
+        super().setUp()
+        layers = override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+        layers.enable()
+        self.addCleanup(layers.disable)
+
+    def listen(self, group):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(group, channel)
+        return lambda: async_to_sync(channel_layer.receive)(channel)
@@ -3,7 +3,8 @@ from chat.views.user_views import (RegisterView, UserProfileView)
 from chat.views.friend_views import (SendFriendRequestView, AcceptFriendRequestView,
                                     DeclineFriendRequestView, RemoveFriendView, FriendListView,
                                       PendingFriendRequestsView, SearchUsersView)
-from chat.views.message_views import (SendMessageView, ChatInboxView, ChatHistoryView)
+from chat.views.autocomplete_views import AutocompleteView
+from chat.views.message_views import (SendMessageView, ChatInboxView, ChatHistoryView, MessageSearchView)
 from chat.views.group_views import (
     GroupViewSet, AddGroupMemberView, RemoveGroupMemberView,
     SendGroupMessageView, GroupMessagesView,
@@ -34,11 +35,13 @@ urlpatterns = [
 
     # User Search
     path('users/search/', SearchUsersView.as_view(), name='user-search'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
 
     # One-on-one messaging
     path('messages/send/', SendMessageView.as_view(), name='send-message'),
     path('messages/user/<int:id>/', ChatHistoryView.as_view(), name='chat-history'),
     path('messages/inbox/', ChatInboxView.as_view(), name='chat-inbox'),
+    path('messages/search/', MessageSearchView.as_view(), name='message-search'),
 
     # Group actions outside of ViewSet
     path('groups/<int:group_id>/add-member/', AddGroupMemberView.as_view(), name='add-group-member'),
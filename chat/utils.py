@@ -1,25 +1,67 @@
-from chat.models import UserProfile, FriendRequest
+from django.conf import settings
+from django.core.cache import cache
+from chat.models import UserProfile, Friendship, GroupMembership
+
+FRIEND_IDS_CACHE_KEY = "chat:friend_ids:{}"
+GROUP_IDS_CACHE_KEY = "chat:group_ids:{}"
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
 
 def get_friends(user):
-    sent = FriendRequest.objects.filter(from_user=user, status='accepted').values_list('to_user', flat=True)
-    received = FriendRequest.objects.filter(to_user=user, status='accepted').values_list('from_user', flat=True)
-    friend_ids = set(sent).union(set(received))
-    return UserProfile.objects.filter(user__id__in=friend_ids).order_by("id")
+    return UserProfile.objects.filter(user_id__in=get_friend_ids(user)).select_related("user").order_by("id")
 
 
 def are_friends(user1, user2):
-    return FriendRequest.objects.filter(
-        from_user=user1,
-        to_user=user2,
-        status='accepted'
-    ).exists() or FriendRequest.objects.filter(
-        from_user=user2,
-        to_user=user1,
-        status='accepted'
-    ).exists()
+    # A cached friend set answers without touching the database.
+    friend_ids = cache.get(FRIEND_IDS_CACHE_KEY.format(_user_id(user1)))
+    if friend_ids is not None:
+        return _user_id(user2) in friend_ids
+    return Friendship.objects.filter(user=user1, friend=user2).exists()
 
 
 def get_friend_ids(user):
-    sent = FriendRequest.objects.filter(from_user=user, status='accepted').values_list('to_user', flat=True)
-    received = FriendRequest.objects.filter(to_user=user, status='accepted').values_list('from_user', flat=True)
-    return list(set(sent).union(set(received)))
+    key = FRIEND_IDS_CACHE_KEY.format(_user_id(user))
+    friend_ids = cache.get(key)
+    if friend_ids is None:
+        friend_ids = set(Friendship.objects.filter(user=user).values_list("friend_id", flat=True))
+        cache.set(key, friend_ids, settings.FRIEND_CACHE_TIMEOUT)
+    return friend_ids
+
+
+async def aget_friend_ids(user):
+    key = FRIEND_IDS_CACHE_KEY.format(_user_id(user))
+    friend_ids = await cache.aget(key)
+    if friend_ids is None:
+        friend_ids = {friend_id async for friend_id in Friendship.objects.filter(user=user).values_list("friend_id", flat=True)}
+        await cache.aset(key, friend_ids, settings.FRIEND_CACHE_TIMEOUT)
+    return friend_ids
+
+
+def invalidate_friend_cache(*users):
+    cache.delete_many([FRIEND_IDS_CACHE_KEY.format(_user_id(user)) for user in users])
+
+
+def get_group_ids(user):
+    """Ids of the groups `user` is a member of, cached like get_friend_ids."""
+    key = GROUP_IDS_CACHE_KEY.format(_user_id(user))
+    group_ids = cache.get(key)
+    if group_ids is None:
+        group_ids = set(GroupMembership.objects.filter(user=user).values_list("group_id", flat=True))
+        cache.set(key, group_ids, settings.FRIEND_CACHE_TIMEOUT)
+    return group_ids
+
+
+async def aget_group_ids(user):
+    key = GROUP_IDS_CACHE_KEY.format(_user_id(user))
+    group_ids = await cache.aget(key)
+    if group_ids is None:
+        group_ids = {group_id async for group_id in GroupMembership.objects.filter(user=user).values_list("group_id", flat=True)}
+        await cache.aset(key, group_ids, settings.FRIEND_CACHE_TIMEOUT)
+    return group_ids
+
+
+def invalidate_group_cache(*users):
+    cache.delete_many([GROUP_IDS_CACHE_KEY.format(_user_id(user)) for user in users])
@@ -0,0 +1,52 @@
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from chat.autocomplete import KINDS, complete
+
+MAX_LIMIT = 20
+
+
+class AutocompleteView(APIView):
+    """
+    Typeahead for usernames and group names, for use on every keystroke.
+    Served from the autocomplete index (see chat/autocomplete.py), without
+    pagination or a database query.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Autocomplete usernames and group names",
+        manual_parameters=[
+            openapi.Parameter("q", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description="Typed prefix"),
+            openapi.Parameter(
+                "type", openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(KINDS),
+                description="Only complete users or groups (default: both)",
+            ),
+            openapi.Parameter("limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description=f"Matches per type (max {MAX_LIMIT})"),
+        ],
+    )
+    def get(self, request):
+        prefix = request.query_params.get("q", "").strip()
+        if not prefix:
+            return Response({"error": "Query parameter `q` is required."}, status=400)
+
+        kind = request.query_params.get("type")
+        if kind is not None and kind not in KINDS:
+            return Response({"error": f"`type` must be one of {', '.join(KINDS)}."}, status=400)
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "`limit` must be a number."}, status=400)
+        if limit < 1:
+            return Response({"error": "`limit` must be positive."}, status=400)
+
+        results = {}
+        if kind in (None, "users"):
+            # One extra match in case the caller's own username is among them.
+            users = complete("users", prefix, limit + 1)
+            results["users"] = [user for user in users if user["user_id"] != request.user.id][:limit]
+        if kind in (None, "groups"):
+            results["groups"] = complete("groups", prefix, limit)
+        return Response(results)
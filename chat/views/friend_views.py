@@ -1,3 +1,4 @@
+from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -7,8 +8,12 @@ from chat.serializers.friend_serializers import FriendRequestSerializer
 from chat.models import FriendRequest, UserProfile
 from django.db.models import Q
 from rest_framework.pagination import PageNumberPagination
+from chat.presence import get_presence
+from chat.search import USERS, get_search_backend, in_order
 from chat.utils import get_friends
 from chat.serializers.friend_serializers import UserSearchResultSerializer
+from chat.serializers.row_serializers import UserSearchResultRowSerializer
+from chat.views.mixins import RowSerializerMixin
 from drf_yasg import openapi
 
 class SendFriendRequestView(APIView):
@@ -107,16 +112,28 @@ class RemoveFriendView(APIView):
         return Response({"success": "Friend removed." if deleted else "No such friend found."})
 
 
-class FriendListView(APIView):
+class FriendListView(RowSerializerMixin, generics.ListAPIView):
+    """
+    List friends with their presence status ("online", "away" or "offline"),
+    looked up for the whole page at once.
+    """
     permission_classes = [IsAuthenticated]
+    serializer_class = UserSearchResultSerializer
+    row_serializer_class = UserSearchResultRowSerializer
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        return get_friends(self.request.user)
+
+    def get_paginated_response(self, data):
+        statuses = get_presence().statuses(friend["user_id"] for friend in data)
+        for friend in data:
+            friend["status"] = statuses[friend["user_id"]]
+        return super().get_paginated_response(data)
 
     @swagger_auto_schema(operation_summary="List friends")
-    def get(self, request):
-        friends = get_friends(request.user)
-        paginator = PageNumberPagination()
-        result_page = paginator.paginate_queryset(friends, request)
-        serializer = UserSearchResultSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 
 class PendingFriendRequestsView(APIView):
@@ -124,7 +141,11 @@ class PendingFriendRequestsView(APIView):
 
     @swagger_auto_schema(operation_summary="List pending incoming requests")
     def get(self, request):
-        pending = FriendRequest.objects.filter(to_user=request.user, status='pending').order_by('-created_at')
+        pending = (
+            FriendRequest.objects.filter(to_user=request.user, status='pending')
+            .select_related('from_user')
+            .order_by('-created_at')
+        )
         paginator = PageNumberPagination()
         result_page = paginator.paginate_queryset(pending, request)
         serializer = FriendRequestSerializer(result_page, many=True)
@@ -133,9 +154,12 @@ class PendingFriendRequestsView(APIView):
 
 class SearchUsersView(APIView):
     """
-    Search users by username or full name.
+    Search users by username or full name, as you type (see chat/search.py).
+    The page is served through `row_serializer_class`; set it to None to use
+    UserSearchResultSerializer.
     """
     permission_classes = [IsAuthenticated]
+    row_serializer_class = UserSearchResultRowSerializer
 
     @swagger_auto_schema(
         operation_summary="Search users",
@@ -153,12 +177,14 @@ class SearchUsersView(APIView):
         if not query:
             return Response({"error": "Query parameter `q` is required."}, status=400)
 
-        profiles = UserProfile.objects.filter(
-            Q(username__icontains=query) | Q(full_name__icontains=query)
-        ).exclude(user=request.user).order_by("username")
+        ranked = get_search_backend().search(USERS, query, exclude={"user": request.user})
 
         paginator = PageNumberPagination()
-        result_page = paginator.paginate_queryset(profiles, request)
-        serializer = UserSearchResultSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        result_page = paginator.paginate_queryset(ranked, request, view=self)
+        profiles = in_order(UserProfile.objects.select_related("user"), result_page)
+        if self.row_serializer_class is not None:
+            data = self.row_serializer_class(self.row_serializer_class.select(profiles), many=True).data
+        else:
+            data = UserSearchResultSerializer(profiles, many=True).data
+        return paginator.get_paginated_response(data)
 
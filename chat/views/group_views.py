@@ -3,11 +3,17 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.pagination import PageNumberPagination
+from chat.pagination import MessagePagination
+from chat.ratelimit import MessageRateThrottle
+from chat.views.mixins import RowSerializerMixin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.db.models import Q
 from chat.models import Group, GroupMembership, GroupMessage
-from chat.serializers import GroupSerializer, GroupMembershipSerializer, GroupMessageSerializer
+from chat.rooms import GroupRoom
+from chat.search import GROUPS, get_search_backend, in_order
+from chat.utils import get_group_ids
+from chat.serializers import GroupSerializer, GroupListSerializer, GroupMembershipSerializer, GroupMessageSerializer, GroupMessageRowSerializer
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -16,15 +22,24 @@ class GroupViewSet(viewsets.ModelViewSet):
     """
     Group CRUD operations (create, list, retrieve, update, delete).
     Includes only groups the user created or is a member of.
+    The list includes the user's unread count for each group.
     """
     serializer_class = GroupSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        return Group.objects.filter(
-            Q(creator=user) | Q(memberships__user=user)
-        ).distinct()
+        groups = Group.objects.filter(
+            Q(creator=user) | Q(pk__in=get_group_ids(user))
+        ).select_related("creator")
+        if self.action == "list":
+            groups = groups.with_unread_counts(user)
+        return groups
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return GroupListSerializer
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         group = serializer.save(creator=self.request.user)
@@ -101,22 +116,28 @@ class SendGroupMessageView(generics.CreateAPIView):
     """
     serializer_class = GroupMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [MessageRateThrottle]
+    rate_limit_endpoint = "rest_group_message"
 
     @swagger_auto_schema(operation_summary="Send group message")
     def perform_create(self, serializer):
         group = serializer.validated_data["group"]
         if not GroupMembership.objects.filter(group=group, user=self.request.user).exists():
             raise PermissionDenied("You are not a member of this group.")
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        GroupRoom(self.request.user, group.id).broadcast_on_commit(message)
 
 
-class GroupMessagesView(generics.ListAPIView):
+class GroupMessagesView(RowSerializerMixin, generics.ListAPIView):
     """
     View messages from a group you belong to.
+    Advances the member's read watermark to the newest message on the page returned.
+    Supports keyset pagination with `?mode=cursor`, `?before=<id>` or `?after=<id>`.
     """
     serializer_class = GroupMessageSerializer
+    row_serializer_class = GroupMessageRowSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = MessagePagination
 
     @swagger_auto_schema(operation_summary="View group messages (paginated)")
     def get_queryset(self):
@@ -126,7 +147,13 @@ class GroupMessagesView(generics.ListAPIView):
         if not GroupMembership.objects.filter(group=group, user=self.request.user).exists():
             raise PermissionDenied("You are not a member of this group.")
 
-        return group.messages.all().order_by("-created_at")
+        return group.messages.select_related("sender").order_by("-created_at", "-id")
+
+    def get_paginated_response(self, data):
+        if data:
+            # Pages are newest first.
+            GroupMembership.objects.mark_read(self.kwargs["group_id"], self.request.user, data[0]["id"])
+        return super().get_paginated_response(data)
     
 
 class SearchGroupsView(APIView):
@@ -152,13 +179,12 @@ class SearchGroupsView(APIView):
         if not query:
             return Response({"error": "Query parameter `q` is required."}, status=400)
 
-        groups = Group.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).order_by("name")
+        ranked = get_search_backend().search(GROUPS, query)
 
         paginator = self.pagination_class()
-        paginated = paginator.paginate_queryset(groups, request)
-        serializer = GroupSerializer(paginated, many=True)
+        paginated = paginator.paginate_queryset(ranked, request, view=self)
+        groups = in_order(Group.objects.select_related("creator"), paginated)
+        serializer = GroupSerializer(groups, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -1,11 +1,18 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from chat.models import Message
-from chat.serializers import MessageSerializer
-from chat.utils import are_friends, get_friend_ids
+from chat.models import Conversation, GroupMessage, Message, is_read, message_key
+from chat.rooms import DirectRoom
+from chat.search import highlight, match_content
+from chat.serializers import ChatInboxSerializer, GroupMessageRowSerializer, MessageRowSerializer, MessageSerializer
+from chat.utils import are_friends, get_friend_ids, get_group_ids
 from rest_framework.pagination import PageNumberPagination
-from django.db.models import Max, Q
+from chat.pagination import MessagePagination, MessageSearchPagination
+from chat.ratelimit import MessageRateThrottle
+from chat.views.mixins import RowSerializerMixin
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -20,6 +27,8 @@ class SendMessageView(APIView):
     Sender is set as the logged-in user.
     """
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [MessageRateThrottle]
+    rate_limit_endpoint = "rest_message"
 
     @swagger_auto_schema(
         operation_summary="Send a message to a friend",
@@ -53,20 +62,26 @@ class SendMessageView(APIView):
 
         serializer = MessageSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(sender=request.user)
+            # The conversation row is updated by a post_save signal in the same transaction.
+            with transaction.atomic():
+                message = serializer.save(sender=request.user)
+                DirectRoom(request.user, receiver.id).broadcast_on_commit(message)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=400)
 
 
-class ChatHistoryView(generics.ListAPIView):
+class ChatHistoryView(RowSerializerMixin, generics.ListAPIView):
     """
     Get chat history with a specific friend.
-    Marks unread messages as read.
+    Advances the user's read watermark to the newest message on the page
+    returned, so an older (`?before=`) page leaves newer messages unread.
+    Supports keyset pagination with `?mode=cursor`, `?before=<id>` or `?after=<id>`.
     """
 
     serializer_class = MessageSerializer
+    row_serializer_class = MessageRowSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = MessagePagination
 
     def get_queryset(self):
         other_user_id = self.kwargs.get("id")
@@ -75,17 +90,24 @@ class ChatHistoryView(generics.ListAPIView):
         if not other_user or not are_friends(self.request.user, other_user):
             return Message.objects.none()
 
-        # Mark received messages as read
-        Message.objects.filter(
-            sender=other_user,
-            receiver=self.request.user,
-            is_read=False
-        ).update(is_read=True)
+        self.other_user = other_user
+        return (
+            DirectRoom(self.request.user, other_user.id).messages()
+            .select_related("sender", "receiver__profile")
+            .order_by("-created_at", "-id")
+        )
 
-        return Message.objects.filter(
-            sender__in=[self.request.user, other_user],
-            receiver__in=[self.request.user, other_user]
-        ).order_by("-created_at")
+    def get_paginated_response(self, data):
+        watermarks = {}
+        if data:
+            # Pages are newest first. One conversation-row update instead of flipping is_read on every message.
+            Conversation.objects.mark_read(self.request.user, self.other_user, data[0]["id"])
+            watermarks = Conversation.objects.read_watermarks(self.request.user, self.other_user)
+        # is_read is derived from the receiver's watermark, not stored per message.
+        for message in data:
+            watermark = watermarks.get(message["receiver"], (None, 0))
+            message["is_read"] = is_read(watermark, parse_datetime(message["created_at"]), message["id"])
+        return super().get_paginated_response(data)
 
     @swagger_auto_schema(operation_summary="View chat history with a friend")
     def get(self, request, *args, **kwargs):
@@ -106,33 +128,72 @@ class ChatInboxView(APIView):
         user = request.user
         friend_ids = get_friend_ids(user)
 
-        # Step 1: Get latest message IDs between user and each friend
-        latest_ids = (
-            Message.objects
+        conversations = (
+            Conversation.objects
             .filter(
-                Q(sender=user, receiver__in=friend_ids) |
-                Q(receiver=user, sender__in=friend_ids)
+                Q(user_low=user, user_high__in=friend_ids) |
+                Q(user_high=user, user_low__in=friend_ids),
+                last_message__isnull=False,
             )
-            .values('sender', 'receiver')
-            .annotate(latest_id=Max('id'))
-            .values_list('latest_id', flat=True)
+            .select_related("last_message__sender", "last_message__receiver__profile")
+            .order_by("-last_activity_at", "-id")
         )
 
-        # Step 2: Fetch those messages and sort them
-        messages = Message.objects.filter(id__in=latest_ids).order_by('-created_at')
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(conversations, request)
+
+        messages = []
+        for conversation in page:
+            message = conversation.last_message
+            message.unread_count = conversation.unread_count_for(user)
+            message.is_read = is_read(conversation.last_read_for(message.receiver_id), *message_key(message))
+            messages.append(message)
 
-        # Step 3: Deduplicate by unique friend ID (regardless of direction)
-        seen = set()
-        filtered = []
-        for msg in messages:
-            friend_id = msg.receiver.id if msg.sender == user else msg.sender.id
-            if friend_id not in seen:
-                seen.add(friend_id)
-                filtered.append(msg)
+        serializer = ChatInboxSerializer(messages, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-        # Step 4: Paginate the filtered result
-        paginator = PageNumberPagination()
-        paginated_msgs = paginator.paginate_queryset(filtered, request)
 
-        serializer = MessageSerializer(paginated_msgs, many=True)
-        return paginator.get_paginated_response(serializer.data)
\ No newline at end of file
+class MessageSearchView(APIView):
+    """
+    Search the content of the user's direct messages and of the groups they
+    belong to, newest first. Each result carries its `type` ("direct" or
+    "group"), a `snippet` around the match and the `highlights` offsets of
+    the matching words within it. Paginated with the opaque `next` cursor.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    row_serializers = {"direct": MessageRowSerializer, "group": GroupMessageRowSerializer}
+
+    @swagger_auto_schema(
+        operation_summary="Search message content",
+        manual_parameters=[
+            openapi.Parameter(
+                "q", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                description="Words to find; each matches the start of a word",
+            ),
+            openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Cursor from `next`"),
+        ],
+    )
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "Query parameter `q` is required."}, status=400)
+
+        user = request.user
+        direct = match_content(Message.objects.filter(Q(sender=user) | Q(receiver=user)), query)
+        group = match_content(GroupMessage.objects.filter(group_id__in=get_group_ids(user)), query)
+
+        paginator = MessageSearchPagination()
+        page = paginator.paginate_querysets({
+            kind: self.row_serializers[kind].select(queryset)
+            for kind, queryset in (("direct", direct), ("group", group))
+        }, request, view=self)
+
+        results = []
+        for kind, row in page:
+            result = {"type": kind, **self.row_serializers[kind].to_representation(row)}
+            # The per-row flag is no longer maintained; reads are tracked by watermarks.
+            del result["is_read"]
+            result["snippet"], result["highlights"] = highlight(result["content"], query)
+            results.append(result)
+        return paginator.get_paginated_response(results)
+
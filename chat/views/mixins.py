@@ -0,0 +1,14 @@
+class RowSerializerMixin:
+    """
+    Serves list pages through `row_serializer_class` (see
+    chat/serializers/row_serializers.py) when it is set. Leave it as None to
+    use the view's ModelSerializer.
+    """
+    row_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.row_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        rows = self.row_serializer_class.select(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(self.row_serializer_class(page, many=True).data)
@@ -1,32 +1,116 @@
-from django.http import JsonResponse
-from django.utils.deprecation import MiddlewareMixin
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
 from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
+from prometheus_client import Counter
 
+ws_auth_cache_hits = Counter("ws_auth_cache_hits_total", "WebSocket auth user cache hits", ["tier"])
+ws_auth_cache_misses = Counter("ws_auth_cache_misses_total", "WebSocket auth user cache misses")
 
-class CustomResponseMiddleware(MiddlewareMixin):
+
+class AuthUserCache:
     """
-    Middleware to wrap all DRF responses in a consistent format.
+    Bounded LRU of authenticated users with a TTL, keyed on (user id, token jti).
+
+    Misses fall through to an optional shared tier (the default Django cache,
+    Redis outside CI) keyed on the user id alone, since the user row does not
+    depend on the token. Invalidating a user deletes the shared entry and
+    gives the user a new version in the shared cache; every worker checks the
+    version on a local hit, so no worker keeps serving a deactivated user.
+    Without the shared tier (a single worker) local hits need no round trip.
     """
+    SHARED_KEY = "ws_auth_user:{}"
+    VERSION_KEY = "ws_auth_user_version:{}"
+
+    def __init__(self, max_size, ttl, shared):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = OrderedDict()  # (user_id, jti) -> (expires_at, version, user)
+        self.keys_by_user = {}  # user_id -> {(user_id, jti), ...}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.WS_AUTH_CACHE
+        return cls(config["MAX_SIZE"], config["TTL"], config["SHARED"])
+
+    async def aget(self, user_id, jti):
+        """Returns (user or None, version); pass the version on to aset."""
+        key = (user_id, jti)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+        if not self.shared:
+            if entry:
+                with self.lock:
+                    self.entries.move_to_end(key)
+                ws_auth_cache_hits.labels("local").inc()
+                return entry[2], 0
+            ws_auth_cache_misses.inc()
+            return None, 0
+
+        version_key, shared_key = self.VERSION_KEY.format(user_id), self.SHARED_KEY.format(user_id)
+        if entry:
+            version = await cache.aget(version_key, 0)
+            if entry[1] == version:
+                ws_auth_cache_hits.labels("local").inc()
+                return entry[2], version
+            with self.lock:
+                self._remove(key)
+            shared = await cache.aget(shared_key)
+        else:
+            found = await cache.aget_many([version_key, shared_key])
+            version, shared = found.get(version_key, 0), found.get(shared_key)
+        if shared is not None and shared[0] == version:
+            ws_auth_cache_hits.labels("shared").inc()
+            await self.aset(user_id, jti, shared[1], version, shared=False)
+            return shared[1], version
+
+        ws_auth_cache_misses.inc()
+        return None, version
+
+    async def aset(self, user_id, jti, user, version, shared=True):
+        """Cache `user`, loaded after aget returned `version`."""
+        key = (user_id, jti)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, version, user)
+            self.entries.move_to_end(key)
+            self.keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+        if shared and self.shared:
+            await cache.aset(self.SHARED_KEY.format(user_id), (version, user), self.ttl)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            for key in self.keys_by_user.pop(user_id, ()):
+                self.entries.pop(key, None)
+        if self.shared:
+            # A new version, never reused, outlives every entry cached under the old one.
+            cache.set(self.VERSION_KEY.format(user_id), time.time_ns(), self.ttl * 2)
+            cache.delete(self.SHARED_KEY.format(user_id))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
 
-    def process_response(self, request, response):
-        # Exclude browsable API, Swagger docs, etc.
-        excluded_paths = ["/swagger/", "/docs/", "/admin/", "/redoc/"]
-        if any(path in request.path for path in excluded_paths):
-            return response
-
-        if hasattr(response, "data") and isinstance(response.data, dict):
-            is_success = 200 <= response.status_code < 300
-            data = {
-                "success": is_success,
-                "data": response.data if is_success else None,
-                "errors": response.data if not is_success else None,
-                "status": response.status_code,
-            }
-            return JsonResponse(data, status=response.status_code)
-        
-        return response
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        keys = self.keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_user[key[0]]
+
+
+auth_user_cache = AuthUserCache.from_settings()
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -42,15 +126,47 @@ class JWTAuthMiddleware(BaseMiddleware):
         if token:
             try:
                 validated_token = UntypedToken(token)
-                user = await self.get_user_from_token(validated_token)
+                user = await self.get_user(validated_token)
                 scope["user"] = user
             except Exception:
                 pass  # keep user as AnonymousUser
 
         return await super().__call__(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user_from_token(self, validated_token):
-        from rest_framework_simplejwt.authentication import JWTAuthentication
-        jwt_auth = JWTAuthentication()
-        return jwt_auth.get_user(validated_token)
+    async def get_user(self, validated_token):
+        from rest_framework_simplejwt.settings import api_settings
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        user, version = await auth_user_cache.aget(user_id, jti)
+        if user is None:
+            user = await self.get_user_from_token(validated_token)
+            await auth_user_cache.aset(user_id, jti, user, version)
+        return user
+
+    async def get_user_from_token(self, validated_token):
+        # Async-ORM version of JWTAuthentication.get_user.
+        from django.contrib.auth import get_user_model
+        from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+        from rest_framework_simplejwt.settings import api_settings
+        from rest_framework_simplejwt.utils import get_md5_hash_password
+
+        User = get_user_model()
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        try:
+            user = await User.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        return user
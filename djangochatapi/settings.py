@@ -58,6 +58,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # Wraps responses in the {"success", "data", "errors", "status"} envelope.
+        'chat.renderers.EnvelopeJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -67,7 +72,6 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    "djangochatapi.middlewares.CustomResponseMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -105,15 +109,142 @@ WSGI_APPLICATION = "djangochatapi.wsgi.application"
 
 ASGI_APPLICATION = "djangochatapi.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [os.environ.get("REDIS_URL", "redis://localhost:6379")],
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+
+# "redis" is channels_redis, which pushes a group message onto every member
+# channel's queue. "streams" keeps a Redis Stream per group, written once per
+# message and read once per worker (see chat/layers.py); set
+# CHAT_CHANNEL_LAYER_URL=fakeredis:// to try it without a Redis server.
+CHAT_CHANNEL_LAYER = os.getenv("CHAT_CHANNEL_LAYER", "redis")
+
+if CHAT_CHANNEL_LAYER == "streams":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chat.layers.RedisStreamsChannelLayer",
+            "CONFIG": {
+                "url": os.getenv("CHAT_CHANNEL_LAYER_URL", REDIS_URL),
+                "maxlen": int(os.getenv("CHAT_CHANNEL_LAYER_MAXLEN", "1000")),
+            },
         },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+            },
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.getenv("CI", "False") == "True":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "djangochatapi",
+        }
+    }
+
+# Seconds a user's friend-id set stays cached (invalidated on every change).
+FRIEND_CACHE_TIMEOUT = int(os.getenv("FRIEND_CACHE_TIMEOUT", "300"))
+
+# Authorize WebSocket connects from the cached friend/group id sets when present.
+WS_AUTHZ_CACHE = os.getenv("WS_AUTHZ_CACHE", "True") == "True"
+
+# Users authenticated by JWTAuthMiddleware are cached per (user id, token jti).
+WS_AUTH_CACHE = {
+    "MAX_SIZE": int(os.getenv("WS_AUTH_CACHE_MAX_SIZE", "10000")),
+    "TTL": int(os.getenv("WS_AUTH_CACHE_TTL", "60")),  # seconds
+    "SHARED": os.getenv("WS_AUTH_CACHE_SHARED", "True") == "True",  # also cache in CACHES["default"]
+}
+
+# Most rooms one ws/stream/ connection may subscribe to.
+WS_STREAM_MAX_ROOMS = int(os.getenv("WS_STREAM_MAX_ROOMS", "500"))
+
+# Most missed messages sent in the {"type": "sync"} frame on reconnect (see chat/rooms.py).
+WS_SYNC_MAX_MESSAGES = int(os.getenv("WS_SYNC_MAX_MESSAGES", "500"))
+
+# Group sockets join their room once per worker and are fanned out to in
+# memory, instead of one channel-layer group member each (see chat/fanout.py).
+WS_LOCAL_FANOUT = os.getenv("WS_LOCAL_FANOUT", "False") == "True"
+
+# Per-connection outbound queue and what to do when a slow client fills it:
+# "drop_oldest", "coalesce" or "disconnect" (see chat/outbox.py).
+WS_OUTBOX = {
+    "SIZE": int(os.getenv("WS_OUTBOX_SIZE", "1000")),
+    "POLICY": os.getenv("WS_OUTBOX_POLICY", "disconnect"),
+}
+
+# How WebSocket messages are stored: "sync" commits each message before it is
+# broadcast, "write_behind" broadcasts first and batches the INSERTs. See
+# chat/persistence.py for the durability guarantees of write-behind mode.
+CHAT_MESSAGE_PERSISTENCE = os.getenv("CHAT_MESSAGE_PERSISTENCE", "sync")
+
+# JSON encoder for WebSocket frames and REST responses: "auto" uses orjson when
+# installed, "orjson" requires it, "json" forces the stdlib.
+CHAT_JSON_BACKEND = os.getenv("CHAT_JSON_BACKEND", "auto")
+
+# Threads for database work that cannot use the async ORM (transactions, bulk
+# flushes). 0 keeps Channels' single shared thread; see chat/db.py.
+CHAT_DB_EXECUTOR_WORKERS = int(os.getenv("CHAT_DB_EXECUTOR_WORKERS", "0"))
+
+# User and group search: "auto" uses the pg_trgm indexes on PostgreSQL and an
+# in-process prefix index otherwise. See chat/search.py.
+CHAT_SEARCH = {
+    "BACKEND": os.getenv("CHAT_SEARCH_BACKEND", "auto"),
+    "MAX_RESULTS": int(os.getenv("CHAT_SEARCH_MAX_RESULTS", "1000")),
+}
+
+# Username/group-name typeahead: "auto" shares one index through REDIS_URL when
+# the cache is Redis and keeps a per-process index otherwise. See chat/autocomplete.py.
+CHAT_AUTOCOMPLETE = {
+    "BACKEND": os.getenv("CHAT_AUTOCOMPLETE_BACKEND", "auto"),
+    "LIMIT": 10,
+}
+
+# Presence and typing indicators (never persisted); see chat/presence.py.
+CHAT_PRESENCE = {
+    "BACKEND": os.getenv("CHAT_PRESENCE_BACKEND", "auto"),
+    "TTL": int(os.getenv("CHAT_PRESENCE_TTL", "60")),  # seconds without a heartbeat before a connection counts as gone
+    "TYPING_WINDOW": 0.25,  # seconds of typing changes batched into one room event
+    "TYPING_REFRESH": 3.0,  # seconds before an unchanged "typing" state is sent again
+}
+
+# Token-bucket limits on sending, "<tokens>/<s|min|h|day>" per message or frame
+# type, or per "<endpoint>:<type>" (see chat/ratelimit.py).
+CHAT_RATE_LIMIT = {
+    "BACKEND": os.getenv("CHAT_RATE_LIMIT_BACKEND", "auto"),  # where per-user buckets live: "redis", "local" or "auto"
+    "USER": {  # per user, across all their connections and requests
+        "message": os.getenv("CHAT_RATE_LIMIT_MESSAGES", "10/s"),
+        "sync": "5/s",
+    },
+    "CONNECTION": {  # per WebSocket connection
+        "typing": "5/s",
+        "read": "20/s",
+        "subscribe": "50/s",
     },
 }
 
+CHAT_WRITE_BEHIND = {
+    "MAX_BATCH": int(os.getenv("CHAT_WRITE_BEHIND_MAX_BATCH", "200")),
+    "MAX_DELAY": float(os.getenv("CHAT_WRITE_BEHIND_MAX_DELAY", "0.05")),  # seconds
+    # Ids reserved per database round trip. Messages are ordered by (created_at, id),
+    # so ids from different processes' blocks need not follow send order.
+    "ID_BLOCK": int(os.getenv("CHAT_WRITE_BEHIND_ID_BLOCK", "100")),
+    "MAX_RETRIES": 3,
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases